@@ -0,0 +1,154 @@
+"""
+Pre-aggregated AI call latency histograms.
+
+Every AILog entry is also counted into AILatencyRollup when the telemetry buffer
+is flushed (see backend/ai_telemetry.py): one row per (day, call_type, provider,
+status, cache_hit, bucket) holding a count and the latency sum, incremented with
+one upsert per flush. Days are China dates (UTC+8) like the rest of the dashboard.
+
+Buckets are log-linear: SUB_BUCKETS per doubling from BASE_SECONDS, so a
+percentile read from the histogram (the bucket's upper bound) is at most ~19%
+above the true value. The dashboard reads a fixed number of grouped rows
+instead of every AILog row, so its cost does not grow with the log history.
+
+Rollups only cover entries flushed after they were introduced; fill them from
+existing AILog rows once with:
+
+    python -m backend.ai_latency backfill
+
+The rebuild runs while API and worker flushers keep writing. On MySQL it holds
+LOCK TABLES (AILog READ, AILatencyRollup WRITE) for its whole duration, so
+flushes (and dashboard reads) wait for it instead of being counted twice or
+lost; on SQLite the DELETE that starts it takes the database write lock. Each
+log row is therefore counted exactly once: by the rebuild if it was committed
+before, by its own flush otherwise. Run it off-peak on a large AILog table.
+"""
+import argparse
+import math
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List
+
+from sqlalchemy import text
+from sqlmodel import Session, delete, select
+
+from backend.database import engine, upsert_increment
+from backend.models import AILatencyRollup, AILog
+
+BASE_SECONDS = 0.01
+SUB_BUCKETS = 4
+# Last bucket ends at BASE_SECONDS * 2 ** (BUCKETS / SUB_BUCKETS) ~ 655s and takes everything above
+BUCKETS = 64
+
+PERCENTILES = (50, 90, 99)
+KEY_COLS = ("day", "call_type", "provider", "status", "cache_hit", "bucket")
+
+
+def bucket_of(seconds: float) -> int:
+    if not seconds or seconds <= BASE_SECONDS:
+        return 0
+    return min(BUCKETS - 1, math.ceil(math.log2(seconds / BASE_SECONDS) * SUB_BUCKETS))
+
+
+def bucket_upper(bucket: int) -> float:
+    return BASE_SECONDS * 2 ** (bucket / SUB_BUCKETS)
+
+
+def china_day(ts: datetime) -> str:
+    return (ts + timedelta(hours=8)).strftime("%Y-%m-%d")
+
+
+def percentiles(histogram: Dict[int, int]) -> Dict[str, float]:
+    """{"p50": s, "p90": s, "p99": s} from {bucket: count}; zeros for an empty histogram."""
+    total = sum(histogram.values())
+    result = {f"p{p}": 0.0 for p in PERCENTILES}
+    if not total:
+        return result
+    buckets = sorted(histogram)
+    for p in PERCENTILES:
+        rank = p / 100 * total
+        seen = 0
+        for bucket in buckets:
+            seen += histogram[bucket]
+            if seen >= rank:
+                result[f"p{p}"] = round(bucket_upper(bucket), 2)
+                break
+    return result
+
+
+def rollup_rows(entries: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Histogram increments for AILog entries (dicts with timestamp, call_type, status, response_time, ...)."""
+    acc = defaultdict(lambda: [0, 0.0])
+    for entry in entries:
+        latency = entry.get("response_time") or 0.0
+        key = (
+            china_day(entry["timestamp"]),
+            entry["call_type"],
+            entry.get("provider") or "",
+            entry["status"],
+            bool(entry.get("cache_hit")),
+            bucket_of(latency),
+        )
+        acc[key][0] += 1
+        acc[key][1] += latency
+    return [
+        {**dict(zip(KEY_COLS, key)), "count": count, "sum_seconds": total}
+        for key, (count, total) in acc.items()
+    ]
+
+
+def record_latencies(db: Session, entries: List[Dict[str, Any]]):
+    """Add entries to the rollups in one upsert. Runs inside the caller's transaction."""
+    upsert_increment(db, AILatencyRollup, rollup_rows(entries), key_cols=KEY_COLS, inc_cols=("count", "sum_seconds"))
+
+
+def backfill(batch_size: int = 5000) -> int:
+    """
+    Rebuild AILatencyRollup from all AILog rows. Returns the number of log rows
+    counted. Concurrent flushes wait until it commits (see the module docstring).
+    """
+    counted = 0
+    # LOCK TABLES and UNLOCK TABLES belong to a MySQL connection: everything,
+    # including the commit, runs on this one instead of going through the pool
+    with engine.connect() as conn:
+        mysql = conn.dialect.name == "mysql"
+        try:
+            if mysql:
+                conn.execute(text(f"LOCK TABLES {AILog.__tablename__} READ, {AILatencyRollup.__tablename__} WRITE"))
+            with Session(bind=conn) as db:
+                db.exec(delete(AILatencyRollup))
+                last_id = 0
+                while True:
+                    logs = db.exec(
+                        select(AILog.id, AILog.timestamp, AILog.call_type, AILog.provider, AILog.status, AILog.cache_hit, AILog.response_time)
+                        .where(AILog.id > last_id).order_by(AILog.id).limit(batch_size)
+                    ).all()
+                    if not logs:
+                        break
+                    last_id = logs[-1].id
+                    record_latencies(db, [log._asdict() for log in logs])
+                    counted += len(logs)
+            conn.commit()
+        finally:
+            if mysql:
+                conn.rollback()
+                conn.execute(text("UNLOCK TABLES"))
+    print(f"Rebuilt AI latency rollups from {counted} log rows")
+    return counted
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AI latency rollups")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_backfill = sub.add_parser("backfill", help="Rebuild rollups from existing AILog rows")
+    p_backfill.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    if args.command == "backfill":
+        from backend.database import create_db_and_tables
+        create_db_and_tables()
+        backfill(args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
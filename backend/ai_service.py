@@ -1,62 +1,63 @@
-import json
-import requests
-from typing import Dict, Any
+import asyncio
+from typing import Dict, Any, Iterator
 from backend.config import settings
-from openai import OpenAI
+from backend.llm_client import chat_json, achat_json, stream_text, LLMError, RETRY_STATUSES
+from backend.llm_router import can_route, route_chat_json, route_stream_text
+from backend.prompt_compaction import compact_kp_analysis, estimate_tokens
+from sqlmodel import Session, select
+from backend.models import AIConfig
 
-def generate_report(score: int, kp_stats: Dict[str, Any], prompt_template: str, api_key: str = None, duration_minutes: int = 0, history_rates: Dict[int, float] = None, subject_name: str = "系统架构设计师") -> Dict[str, Any]:
+def get_api_key(db: Session) -> str:
+    """
+    API key for the configured provider: the admin-managed AIConfig value wins,
+    otherwise the environment setting.
+    """
+    config_key = "qwen_api_key" if settings.AI_PROVIDER == "qwen" else "gemini_api_key"
+    api_conf = db.exec(select(AIConfig).where(AIConfig.config_key == config_key)).first()
+    if api_conf:
+        return api_conf.value
+    return settings.QWEN_API_KEY if settings.AI_PROVIDER == "qwen" else settings.GEMINI_API_KEY
+
+def get_api_keys(db: Session) -> Dict[str, str]:
+    """Keys for every provider (AIConfig first, then environment), for routing across providers."""
+    values = {c.config_key: c.value for c in db.exec(select(AIConfig).where(AIConfig.config_key.in_(["qwen_api_key", "gemini_api_key"]))).all()}
+    return {
+        "qwen": values.get("qwen_api_key") or settings.QWEN_API_KEY,
+        "gemini": values.get("gemini_api_key") or settings.GEMINI_API_KEY,
+    }
+
+def _provider_key(api_key: str = None) -> str:
+    return api_key or (settings.QWEN_API_KEY if settings.AI_PROVIDER == "qwen" else settings.GEMINI_API_KEY)
+
+def generate_report(score: int, kp_stats: Dict[str, Any], prompt_template: str, api_key: str = None, duration_minutes: int = 0, history_rates: Dict[int, float] = None, subject_name: str = "系统架构设计师", api_keys: Dict[str, str] = None) -> Dict[str, Any]:
     """
     Generates an AI analysis report using Gemini or Qwen.
     """
-    key = api_key or (settings.QWEN_API_KEY if settings.AI_PROVIDER == "qwen" else settings.GEMINI_API_KEY)
-    
-    if not key:
+    key = _provider_key(api_key)
+    if not key and not can_route(api_keys):
         return {"error": f"{settings.AI_PROVIDER} API Key not configured"}
+    return call_llm(build_report_prompt(score, kp_stats, prompt_template, duration_minutes, history_rates, subject_name), api_key=key, api_keys=api_keys)
 
-    # Format KP stats for prompt
-    kp_analysis_str = ""
-    # Sort KPs by chapter to group them nicely in the prompt (optional but good)
-    sorted_kps = sorted(kp_stats.values(), key=lambda x: x.get('chapter', ''))
-    
-    # history_rates is {kp_id: error_rate} (0.0 - 1.0)
-    # We want to display historical accuracy = (1 - error_rate) * 100
-    
-    for kp_id, stats in kp_stats.items():
-        # Note: kp_stats keys might be int, but we iterate dict.
-        # Wait, sorted_kps iterates values, so we lose the ID key unless it's in stats.
-        # Let's check main.py usage. kp_stats keys are q.knowledge_point_id (int).
-        # We need the ID to look up history.
-        pass
-
-    # Re-iterate with sorting but keeping access to ID
-    # Convert to list of tuples (id, stats)
-    kp_items = []
-    for k, v in kp_stats.items():
-        kp_items.append((k, v))
-        
-    kp_items.sort(key=lambda x: x[1].get('chapter', ''))
-    
-    for kpid, stats in kp_items:
-        name = stats.get('name', 'Unknown KP')
-        chapter = stats.get('chapter', 'Unknown Chapter')
-        weight = stats.get('weight', 'Unknown')
-        total = stats['total']
-        correct = stats['correct']
-        accuracy = int((correct / total) * 100) if total > 0 else 0
-        
-        history_str = ""
-        if history_rates and kpid in history_rates:
-            hist_err = history_rates[kpid]
-            hist_acc = int((1.0 - hist_err) * 100)
-            diff = accuracy - hist_acc
-            trend = "持平"
-            if diff > 5: trend = "进步"
-            elif diff < -5: trend = "退步"
-            
-            history_str = f" | 历史正确率: {hist_acc}% ({trend})"
-            
-        kp_analysis_str += f"- [{chapter}] {name} (权重: {weight}): 本次 {accuracy}% ({correct}/{total}){history_str}\n"
+async def agenerate_report(score: int, kp_stats: Dict[str, Any], prompt_template: str, api_key: str = None, duration_minutes: int = 0, history_rates: Dict[int, float] = None, subject_name: str = "系统架构设计师", api_keys: Dict[str, str] = None) -> Dict[str, Any]:
+    """Async variant of generate_report."""
+    key = _provider_key(api_key)
+    if not key and not can_route(api_keys):
+        return {"error": f"{settings.AI_PROVIDER} API Key not configured"}
+    return await acall_llm(build_report_prompt(score, kp_stats, prompt_template, duration_minutes, history_rates, subject_name), api_key=key, api_keys=api_keys)
+
+def stream_report(score: int, kp_stats: Dict[str, Any], prompt_template: str, api_key: str = None, duration_minutes: int = 0, history_rates: Dict[int, float] = None, subject_name: str = "系统架构设计师", api_keys: Dict[str, str] = None) -> Iterator[str]:
+    """
+    Streaming variant of generate_report: yields the raw JSON text as the model
+    writes it. Unlike generate_report, failures raise (LLMError or the client error).
+    """
+    key = _provider_key(api_key)
+    if not key and not can_route(api_keys):
+        raise LLMError(f"{settings.AI_PROVIDER} API Key not configured")
+    return stream_llm(build_report_prompt(score, kp_stats, prompt_template, duration_minutes, history_rates, subject_name), api_key=key, api_keys=api_keys)
 
+def build_report_prompt(score: int, kp_stats: Dict[str, Any], prompt_template: str, duration_minutes: int = 0, history_rates: Dict[int, float] = None, subject_name: str = "系统架构设计师", token_budget: int = None) -> str:
+    if token_budget is None:
+        token_budget = settings.REPORT_PROMPT_TOKEN_BUDGET
     accuracy = int((score / 75) * 100)
     score_gap = 45 - score
     gap_str = f"距离及格线（45分）还差 {score_gap} 分" if score_gap > 0 else f"已超过及格线 {abs(score_gap)} 分"
@@ -69,29 +70,38 @@ def generate_report(score: int, kp_stats: Dict[str, Any], prompt_template: str,
     elif "架构" in subject_name: level_suffix = "架构师"
     elif subject_name: level_suffix = subject_name # Fallback to full name if unknown pattern
 
-    prompt = prompt_template.format(
+    fields = dict(
         score=score,
         accuracy=accuracy,
-        duration_minutes=duration_minutes, 
-        kp_analysis=kp_analysis_str,
+        duration_minutes=duration_minutes,
         gap_analysis=gap_str,
         subject_name=subject_name,
         level_suffix=level_suffix
     )
+    # Per-KP section, compacted when the prompt would exceed the token budget (backend/prompt_compaction.py)
+    kp_budget = 0
+    if token_budget > 0:
+        kp_budget = max(1, token_budget - estimate_tokens(prompt_template.format(kp_analysis="", **fields)))
+    kp_analysis_str = compact_kp_analysis(kp_stats, history_rates, kp_budget)
+    return prompt_template.format(kp_analysis=kp_analysis_str, **fields)
 
-    if settings.AI_PROVIDER == "qwen":
-        return call_qwen(prompt, api_key=key)
-    else:
-        return call_gemini(prompt, api_key=key)
-
-def generate_share_content(report_data: Dict[str, Any], prompt_template: str, api_key: str = None, subject_name: str = "系统架构设计师") -> Dict[str, Any]:
+def generate_share_content(report_data: Dict[str, Any], prompt_template: str, api_key: str = None, subject_name: str = "系统架构设计师", api_keys: Dict[str, str] = None) -> Dict[str, Any]:
     """
     Generates social share content using Gemini or Qwen.
     """
-    key = api_key or (settings.QWEN_API_KEY if settings.AI_PROVIDER == "qwen" else settings.GEMINI_API_KEY)
-    if not key:
+    key = _provider_key(api_key)
+    if not key and not can_route(api_keys):
         return {"error": f"{settings.AI_PROVIDER} API Key not configured"}
+    return call_llm(build_share_prompt(report_data, prompt_template, subject_name), api_key=key, api_keys=api_keys)
 
+async def agenerate_share_content(report_data: Dict[str, Any], prompt_template: str, api_key: str = None, subject_name: str = "系统架构设计师", api_keys: Dict[str, str] = None) -> Dict[str, Any]:
+    """Async variant of generate_share_content."""
+    key = _provider_key(api_key)
+    if not key and not can_route(api_keys):
+        return {"error": f"{settings.AI_PROVIDER} API Key not configured"}
+    return await acall_llm(build_share_prompt(report_data, prompt_template, subject_name), api_key=key, api_keys=api_keys)
+
+def build_share_prompt(report_data: Dict[str, Any], prompt_template: str, subject_name: str = "系统架构设计师") -> str:
     level = report_data.get('title')
     if not level and 'evaluation' in report_data and isinstance(report_data['evaluation'], dict):
         level = report_data['evaluation'].get('level')
@@ -113,7 +123,7 @@ def generate_share_content(report_data: Dict[str, Any], prompt_template: str, ap
     else:
         highlight = "正在努力进步中"
 
-    prompt = prompt_template.format(
+    return prompt_template.format(
         level=level,
         score=score_str,
         percentile=percentile,
@@ -121,19 +131,47 @@ def generate_share_content(report_data: Dict[str, Any], prompt_template: str, ap
         subject_name=subject_name
     )
 
-    if settings.AI_PROVIDER == "qwen":
-        return call_qwen(prompt, api_key=key)
-    else:
-        return call_gemini(prompt, api_key=key)
-
-def generate_variant_questions(seed_questions: list[Dict[str, Any]], count_per_seed: int = 1, api_key: str = None, subject_name: str = "系统架构设计师") -> list[Dict[str, Any]]:
+def generate_variant_questions(seed_questions: list[Dict[str, Any]], count_per_seed: int = 1, api_key: str = None, subject_name: str = "系统架构设计师", api_keys: Dict[str, str] = None) -> list[Dict[str, Any]]:
     """
     Generates variant questions based on seed questions.
     """
-    key = api_key or (settings.QWEN_API_KEY if settings.AI_PROVIDER == "qwen" else settings.GEMINI_API_KEY)
-    if not key:
+    key = _provider_key(api_key)
+    if not key and not can_route(api_keys):
+        return []
+    try:
+        print(f"Generating questions with {settings.AI_PROVIDER}...")
+        result = call_llm(build_variant_prompt(seed_questions, count_per_seed, subject_name), api_key=key, api_keys=api_keys)
+        return _variant_list(result)
+    except Exception as e:
+        print(f"Variant Generation Exception: {e}")
         return []
 
+async def agenerate_variant_questions(seed_questions: list[Dict[str, Any]], count_per_seed: int = 1, api_key: str = None, subject_name: str = "系统架构设计师", api_keys: Dict[str, str] = None) -> list[Dict[str, Any]]:
+    """Async variant of generate_variant_questions."""
+    key = _provider_key(api_key)
+    if not key and not can_route(api_keys):
+        return []
+    try:
+        print(f"Generating questions with {settings.AI_PROVIDER}...")
+        result = await acall_llm(build_variant_prompt(seed_questions, count_per_seed, subject_name), api_key=key, api_keys=api_keys)
+        return _variant_list(result)
+    except Exception as e:
+        print(f"Variant Generation Exception: {e}")
+        return []
+
+def _variant_list(result) -> list[Dict[str, Any]]:
+    if isinstance(result, list):
+        return result
+    elif isinstance(result, dict) and "error" in result:
+        print(f"AI Generation Error: {result['error']}")
+        return []
+    else:
+        if isinstance(result, dict):
+             if "questions" in result: return result["questions"]
+             return []
+        return []
+
+def build_variant_prompt(seed_questions: list[Dict[str, Any]], count_per_seed: int = 1, subject_name: str = "系统架构设计师") -> str:
     # Construct prompt
     seeds_text = ""
     for q in seed_questions:
@@ -175,27 +213,42 @@ def generate_variant_questions(seed_questions: list[Dict[str, Any]], count_per_s
   ...
 ]
 """
-    try:
-        print(f"Generating questions with {settings.AI_PROVIDER}...")
-        
-        if settings.AI_PROVIDER == "qwen":
-            result = call_qwen(prompt, api_key=key)
-        else:
-            result = call_gemini(prompt, api_key=key)
-            
-        if isinstance(result, list):
-            return result
-        elif isinstance(result, dict) and "error" in result:
-            print(f"AI Generation Error: {result['error']}")
-            return []
-        else:
-            if isinstance(result, dict):
-                 if "questions" in result: return result["questions"]
-                 return []
-            return []
-    except Exception as e:
-        print(f"Variant Generation Exception: {e}")
-        return []
+    return prompt
+
+# -----------------------------------------------------------------------------
+# Provider calls (shared pooled clients with retry/backoff, see backend/llm_client.py)
+# -----------------------------------------------------------------------------
+
+def call_llm(prompt: str, api_key: str = None, api_keys: Dict[str, str] = None) -> Dict[str, Any]:
+    # With keys for several providers, route with hedging/circuit breaking (backend/llm_router.py)
+    if can_route(api_keys):
+        print(f"[routed] Prompt:\n{prompt}")
+        try:
+            return route_chat_json(prompt, api_keys)
+        except Exception as e:
+            print(f"LLM Routing Error: {e}")
+            return {"error": str(e)}
+    if settings.AI_PROVIDER == "qwen":
+        return call_qwen(prompt, api_key=api_key)
+    return call_gemini(prompt, api_key=api_key)
+
+async def acall_llm(prompt: str, api_key: str = None, api_keys: Dict[str, str] = None) -> Dict[str, Any]:
+    if can_route(api_keys):
+        # The router waits on threads; keep that off the event loop (to_thread keeps the telemetry context)
+        return await asyncio.to_thread(call_llm, prompt, api_key, api_keys)
+    if settings.AI_PROVIDER == "qwen":
+        return await acall_qwen(prompt, api_key=api_key)
+    return await acall_gemini(prompt, api_key=api_key)
+
+def stream_llm(prompt: str, api_key: str = None, api_keys: Dict[str, str] = None) -> Iterator[str]:
+    if can_route(api_keys):
+        print(f"[routed] Prompt:\n{prompt}")
+        return route_stream_text(prompt, api_keys)
+    if settings.AI_PROVIDER == "qwen":
+        print(f"[qwen-plus] Prompt:\n{prompt}")
+        return stream_text("qwen", prompt, api_key or settings.QWEN_API_KEY, "qwen-plus")
+    print(prompt)
+    return _stream_gemini(prompt, api_key or settings.GEMINI_API_KEY)
 
 def call_qwen(prompt: str, api_key: str = None, model_name: str = "qwen-plus") -> Dict[str, Any]:
     """
@@ -205,68 +258,74 @@ def call_qwen(prompt: str, api_key: str = None, model_name: str = "qwen-plus") -
     if not key:
         return {"error": "Qwen API Key not configured"}
 
-    client = OpenAI(
-        api_key=key,
-        base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
-    )
+    print(f"[{model_name}] Prompt:\n{prompt}")
+
+    try:
+        return chat_json("qwen", prompt, key, model_name)
+    except Exception as e:
+        print(f"Qwen API Error: {e}")
+        return {"error": str(e)}
+
+async def acall_qwen(prompt: str, api_key: str = None, model_name: str = "qwen-plus") -> Dict[str, Any]:
+    key = api_key or settings.QWEN_API_KEY
+    if not key:
+        return {"error": "Qwen API Key not configured"}
 
     print(f"[{model_name}] Prompt:\n{prompt}")
 
     try:
-        completion = client.chat.completions.create(
-            model=model_name,
-            messages=[{'role': 'user', 'content': prompt}],
-            response_format={"type": "json_object"}
-        )
-        
-        content = completion.choices[0].message.content
-        return json.loads(content)
+        return await achat_json("qwen", prompt, key, model_name)
     except Exception as e:
         print(f"Qwen API Error: {e}")
         return {"error": str(e)}
 
+# gemini-2.0-flash falls back to gemini-1.5-flash on rate limit instead of retrying
+GEMINI_FALLBACK_MODELS = {"gemini-2.0-flash": "gemini-1.5-flash"}
+
+def _gemini_retry_statuses(model_name: str):
+    if model_name in GEMINI_FALLBACK_MODELS:
+        return tuple(s for s in RETRY_STATUSES if s != 429)
+    return RETRY_STATUSES
 
 def call_gemini(prompt: str, api_key: str = None, model_name: str = "gemini-2.0-flash") -> Dict[str, Any]:
     key = api_key or settings.GEMINI_API_KEY
-    
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/{model_name}:generateContent?key={key}"
-    
-    payload = {
-        "contents": [{
-            "parts": [{"text": prompt}]
-        }],
-        "generationConfig": {
-            "response_mime_type": "application/json"
-        }
-    }
-    
+
+    print(prompt)
+
     try:
-        # Use requests for better proxy compatibility
-        proxies = None
-        if settings.PROXY_URL:
-            print(f"Using Proxy: {settings.PROXY_URL}")
-            proxies = {
-                "http": settings.PROXY_URL,
-                "https": settings.PROXY_URL
-            }
-
-        print(prompt) 
-        response = requests.post(url, json=payload, headers={"Content-Type": "application/json"}, proxies=proxies, timeout=60.0)
-        
-        if response.status_code == 429 and model_name == "gemini-2.0-flash":
-            print(f"Gemini 2.0 Flash Rate Limit (429). Falling back to gemini-1.5-flash...")
-            return call_gemini(prompt, api_key, model_name="gemini-1.5-flash")
-            
-        response.raise_for_status()
-        data = response.json()
-        
-        # Extract JSON from text response
-        text_content = data['candidates'][0]['content']['parts'][0]['text']
-        # Clean up code blocks if present
-        text_content = text_content.replace('```json', '').replace('```', '').strip()
-        
-        return json.loads(text_content)
+        return chat_json("gemini", prompt, key, model_name, retry_statuses=_gemini_retry_statuses(model_name))
+    except LLMError as e:
+        if e.status == 429 and model_name in GEMINI_FALLBACK_MODELS:
+            print(f"Gemini {model_name} Rate Limit (429). Falling back to {GEMINI_FALLBACK_MODELS[model_name]}...")
+            return call_gemini(prompt, api_key, model_name=GEMINI_FALLBACK_MODELS[model_name])
+        print(f"Gemini API Error ({model_name}): {e}")
+        return {"error": str(e)}
     except Exception as e:
         print(f"Gemini API Error ({model_name}): {e}")
-        # If it was already a fallback attempt or another error, return error
         return {"error": str(e)}
+
+async def acall_gemini(prompt: str, api_key: str = None, model_name: str = "gemini-2.0-flash") -> Dict[str, Any]:
+    key = api_key or settings.GEMINI_API_KEY
+
+    print(prompt)
+
+    try:
+        return await achat_json("gemini", prompt, key, model_name, retry_statuses=_gemini_retry_statuses(model_name))
+    except LLMError as e:
+        if e.status == 429 and model_name in GEMINI_FALLBACK_MODELS:
+            print(f"Gemini {model_name} Rate Limit (429). Falling back to {GEMINI_FALLBACK_MODELS[model_name]}...")
+            return await acall_gemini(prompt, api_key, model_name=GEMINI_FALLBACK_MODELS[model_name])
+        print(f"Gemini API Error ({model_name}): {e}")
+        return {"error": str(e)}
+    except Exception as e:
+        print(f"Gemini API Error ({model_name}): {e}")
+        return {"error": str(e)}
+
+def _stream_gemini(prompt: str, api_key: str, model_name: str = "gemini-2.0-flash") -> Iterator[str]:
+    try:
+        return stream_text("gemini", prompt, api_key, model_name, retry_statuses=_gemini_retry_statuses(model_name))
+    except LLMError as e:
+        if e.status == 429 and model_name in GEMINI_FALLBACK_MODELS:
+            print(f"Gemini {model_name} Rate Limit (429). Falling back to {GEMINI_FALLBACK_MODELS[model_name]}...")
+            return _stream_gemini(prompt, api_key, model_name=GEMINI_FALLBACK_MODELS[model_name])
+        raise
@@ -0,0 +1,111 @@
+"""
+Buffered AI call telemetry (AILog rows).
+
+log_ai_call() only appends to an in-process buffer; a PeriodicTask (main.py for
+the API, worker.py for the worker) writes it to MySQL with one multi-row INSERT
+per FLUSH_BATCH_SIZE entries, so logging an LLM call never adds a DB round trip
+to a request or job. The same transaction adds the entries to the latency
+histograms (see backend/ai_latency.py). The shutdown hooks flush once more. A
+failed flush puts its entries back for the next round; the buffer is bounded
+(BUFFER_MAX, oldest dropped) so a DB outage cannot grow it without limit.
+
+Provider, model and token counts are reported by llm_client: run the LLM call
+inside track_llm_call() and pass the collected usage to log_ai_call().
+"""
+import threading
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Dict, Iterator, Optional
+
+from sqlalchemy import insert
+from sqlmodel import Session
+
+from backend.database import engine
+from backend.models import AILog
+from backend.ai_latency import record_latencies
+
+FLUSH_BATCH_SIZE = 500
+BUFFER_MAX = 50000
+
+_buffer: deque = deque(maxlen=BUFFER_MAX)
+_lock = threading.Lock()
+
+_usage: ContextVar[Optional[Dict[str, Any]]] = ContextVar("llm_usage", default=None)
+
+
+@contextmanager
+def track_llm_call() -> Iterator[Dict[str, Any]]:
+    """Collect provider, model and token counts of the LLM calls made inside the block (last call wins)."""
+    usage: Dict[str, Any] = {}
+    token = _usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _usage.reset(token)
+
+
+def note_llm_usage(provider: str = None, model: str = None, prompt_tokens: int = None, completion_tokens: int = None):
+    """Called by llm_client; a no-op outside track_llm_call()."""
+    usage = _usage.get()
+    if usage is None:
+        return
+    if provider is not None:
+        # A new call: drop the token counts of the previous attempt
+        usage.clear()
+        usage["provider"] = provider
+    for key, value in (("model", model), ("prompt_tokens", prompt_tokens), ("completion_tokens", completion_tokens)):
+        if value is not None:
+            usage[key] = value
+
+
+def merge_llm_usage(usage: Dict[str, Any]):
+    """Copy usage collected in another thread (e.g. a routed call) into the current track_llm_call()."""
+    current = _usage.get()
+    if current is not None and usage:
+        current.clear()
+        current.update(usage)
+
+
+def log_ai_call(call_type: str, status: str, response_time: float, error_message: str = None, cache_hit: bool = False, usage: Optional[Dict[str, Any]] = None):
+    usage = usage or {}
+    entry = {
+        "call_type": call_type,
+        "status": status,
+        "response_time": response_time,
+        "timestamp": datetime.utcnow(),
+        "error_message": error_message,
+        "cache_hit": cache_hit,
+        "provider": usage.get("provider"),
+        "model": usage.get("model"),
+        "prompt_tokens": usage.get("prompt_tokens"),
+        "completion_tokens": usage.get("completion_tokens"),
+    }
+    with _lock:
+        _buffer.append(entry)
+
+
+def flush_ai_logs() -> int:
+    """Write buffered entries to MySQL, FLUSH_BATCH_SIZE rows per INSERT. Returns rows written."""
+    flushed = 0
+    while True:
+        with _lock:
+            batch = [_buffer.popleft() for _ in range(min(FLUSH_BATCH_SIZE, len(_buffer)))]
+        if not batch:
+            break
+        try:
+            with Session(engine) as db:
+                db.exec(insert(AILog.__table__).values(batch))
+                # Latency histograms for the dashboard, in the same transaction
+                record_latencies(db, batch)
+                db.commit()
+        except Exception:
+            # Put them back so the next round retries
+            with _lock:
+                _buffer.extendleft(reversed(batch))
+            raise
+        flushed += len(batch)
+        if len(batch) < FLUSH_BATCH_SIZE:
+            break
+    return flushed
@@ -0,0 +1,149 @@
+"""
+Write-behind buffer for exam answers.
+
+Each answer is recorded in a Redis hash `exam_answers:{session_id}`
+(question_id -> answer) and the session is added to the dirty set. A background
+flusher (PeriodicTask in main.py) writes dirty sessions to MySQL in batches, so
+an exam costs a handful of row writes instead of one per click.
+
+The hash always holds every buffered answer of the session, so flushing is an
+idempotent merge and a session that is re-marked dirty while being flushed is
+simply written again on the next round. submit_exam flushes its session before
+grading and the shutdown hook drains whatever is still pending.
+"""
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException
+from sqlmodel import Session, select
+
+from backend.database import engine, redis_client
+from backend.models import ExamSession
+
+DIRTY_KEY = "exam_answers_dirty"
+# Longer than the 150 minute exam, so buffered answers outlive the session
+ANSWERS_TTL = 3600 * 4
+FLUSH_BATCH_SIZE = 200
+
+
+def answers_key(session_id: str) -> str:
+    return f"exam_answers:{session_id}"
+
+
+def _check_open(db: Session, session_id: str):
+    session = db.get(ExamSession, session_id)
+    if not session:
+        raise HTTPException(404, "Session not found")
+    if session.is_submitted:
+        raise HTTPException(400, "Session already submitted")
+
+
+def record_answers(db: Session, session_id: str, answers: Dict[str, str]):
+    """
+    Buffer answers for a session. The DB is only consulted for the first write
+    of a session, to reject unknown or submitted sessions.
+    """
+    if not answers:
+        return
+    key = answers_key(session_id)
+    try:
+        if not redis_client.exists(key):
+            _check_open(db, session_id)
+        pipe = redis_client.pipeline()
+        pipe.hset(key, mapping={str(qid): ans for qid, ans in answers.items()})
+        pipe.expire(key, ANSWERS_TTL)
+        pipe.sadd(DIRTY_KEY, session_id)
+        pipe.execute()
+    except HTTPException:
+        raise
+    except Exception as e:
+        # Redis unavailable: write through to the DB rather than lose the answer
+        print(f"Redis Answer Buffer Error: {e}")
+        session = db.get(ExamSession, session_id)
+        if not session or session.is_submitted:
+            raise HTTPException(404, "Session not found")
+        _apply(db, [session], {session_id: {str(qid): ans for qid, ans in answers.items()}})
+        db.commit()
+
+
+def pending_answers(session_id: str) -> Dict[str, str]:
+    """Buffered answers not necessarily flushed yet (merge over the DB copy on resume)."""
+    try:
+        return redis_client.hgetall(answers_key(session_id))
+    except Exception as e:
+        print(f"Redis Answer Fetch Error: {e}")
+        return {}
+
+
+def merge_answers(session_id: str, user_answers: Optional[Dict[str, str]]) -> Dict[str, str]:
+    merged = dict(user_answers or {})
+    merged.update(pending_answers(session_id))
+    return merged
+
+
+def _apply(db: Session, sessions: List[ExamSession], buffered: Dict[str, Dict[str, str]]):
+    for session in sessions:
+        answers = buffered.get(session.id)
+        if not answers or session.is_submitted:
+            continue
+        merged = dict(session.user_answers or {})
+        merged.update(answers)
+        if merged != session.user_answers:
+            # Assign a new dict so the JSON column is detected as changed
+            session.user_answers = merged
+            db.add(session)
+
+
+def flush_session(db: Session, session: ExamSession):
+    """Write one session's buffered answers now (used by submit before grading)."""
+    try:
+        redis_client.srem(DIRTY_KEY, session.id)
+    except Exception as e:
+        print(f"Redis Answer Flush Error: {e}")
+    answers = pending_answers(session.id)
+    if not answers:
+        return
+    _apply(db, [session], {session.id: answers})
+    db.commit()
+    db.refresh(session)
+
+
+def discard_session(session_id: str):
+    """Drop a submitted session's buffer."""
+    try:
+        pipe = redis_client.pipeline()
+        pipe.delete(answers_key(session_id))
+        pipe.srem(DIRTY_KEY, session_id)
+        pipe.execute()
+    except Exception as e:
+        print(f"Redis Answer Discard Error: {e}")
+
+
+def flush_dirty_answers() -> int:
+    """Write all dirty sessions to MySQL, FLUSH_BATCH_SIZE sessions per transaction. Returns sessions written."""
+    flushed = 0
+    while True:
+        session_ids = redis_client.spop(DIRTY_KEY, FLUSH_BATCH_SIZE)
+        if not session_ids:
+            break
+
+        pipe = redis_client.pipeline()
+        for sid in session_ids:
+            pipe.hgetall(answers_key(sid))
+        buffered = dict(zip(session_ids, pipe.execute()))
+
+        try:
+            with Session(engine) as db:
+                sessions = db.exec(select(ExamSession).where(ExamSession.id.in_(session_ids))).all()
+                _apply(db, sessions, buffered)
+                db.commit()
+        except Exception:
+            # Put them back so the next round retries
+            redis_client.sadd(DIRTY_KEY, *session_ids)
+            raise
+        flushed += len(session_ids)
+
+        if len(session_ids) < FLUSH_BATCH_SIZE:
+            break
+    if flushed:
+        print(f"DEBUG: Flushed buffered answers for {flushed} sessions")
+    return flushed
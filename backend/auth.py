@@ -1,6 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer
 from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from datetime import datetime, timedelta
 from typing import Optional
 from pydantic import BaseModel
@@ -14,7 +16,7 @@ from jose import JWTError, jwt
 from passlib.context import CryptContext
 import hashlib
 
-from backend.database import get_session, redis_client
+from backend.database import get_async_session, get_async_redis
 from backend.models import AdminUser
 from backend.config import settings
 
@@ -98,8 +100,14 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def _generate_captcha_image(code: str) -> bytes:
+    image = ImageCaptcha(width=160, height=60)
+    return image.generate(code).read()
+
 # --- Dependency ---
-async def get_current_admin(token: str = Depends(oauth2_scheme), session: Session = Depends(get_session)):
+# Async routes here use the async DB session / Redis pool; bcrypt and captcha
+# rendering are CPU-bound and run in the threadpool.
+async def get_current_admin(token: str = Depends(oauth2_scheme), session: AsyncSession = Depends(get_async_session), rds = Depends(get_async_redis)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -107,7 +115,7 @@ async def get_current_admin(token: str = Depends(oauth2_scheme), session: Sessio
     )
     
     # Check Blacklist
-    if redis_client.get(f"blacklist:{token}"):
+    if await rds.get(f"blacklist:{token}"):
         raise credentials_exception
 
     try:
@@ -118,7 +126,7 @@ async def get_current_admin(token: str = Depends(oauth2_scheme), session: Sessio
     except JWTError:
         raise credentials_exception
         
-    user = session.exec(select(AdminUser).where(AdminUser.username == username)).first()
+    user = (await session.exec(select(AdminUser).where(AdminUser.username == username))).first()
     if user is None:
         raise credentials_exception
     return user
@@ -126,7 +134,7 @@ async def get_current_admin(token: str = Depends(oauth2_scheme), session: Sessio
 # --- Routes ---
 
 @router.post("/logout")
-async def logout(token: str = Depends(oauth2_scheme)):
+async def logout(token: str = Depends(oauth2_scheme), rds = Depends(get_async_redis)):
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         exp = payload.get("exp")
@@ -136,32 +144,31 @@ async def logout(token: str = Depends(oauth2_scheme)):
             ttl = int((expire_time - now).total_seconds())
             
             if ttl > 0:
-                redis_client.setex(f"blacklist:{token}", ttl, "1")
+                await rds.setex(f"blacklist:{token}", ttl, "1")
     except JWTError:
         pass # Invalid token, ignore
     
     return {"message": "Successfully logged out"}
 
 @router.get("/captcha")
-async def get_captcha():
+async def get_captcha(rds = Depends(get_async_redis)):
     """Generate a captcha image and return ID + Image"""
     # 1. Generate Code
     code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=4))
     captcha_id = str(uuid.uuid4())
     
     # 2. Store in Redis (5 mins)
-    redis_client.setex(f"captcha:{captcha_id}", 300, code)
+    await rds.setex(f"captcha:{captcha_id}", 300, code)
     
     # 3. Generate Image
-    image = ImageCaptcha(width=160, height=60)
-    data = image.generate(code)
+    data = await run_in_threadpool(_generate_captcha_image, code)
     
-    return StreamingResponse(io.BytesIO(data.read()), media_type="image/png", headers={"X-Captcha-ID": captcha_id})
+    return StreamingResponse(io.BytesIO(data), media_type="image/png", headers={"X-Captcha-ID": captcha_id})
 
 @router.post("/login", response_model=Token)
-async def login(req: LoginRequest, session: Session = Depends(get_session)):
+async def login(req: LoginRequest, session: AsyncSession = Depends(get_async_session), rds = Depends(get_async_redis)):
     # 1. Verify Captcha
-    stored_code = redis_client.get(f"captcha:{req.captcha_id}")
+    stored_code = await rds.get(f"captcha:{req.captcha_id}")
     if not stored_code:
         raise HTTPException(status_code=400, detail="验证码已过期")
     
@@ -173,7 +180,7 @@ async def login(req: LoginRequest, session: Session = Depends(get_session)):
         raise HTTPException(status_code=400, detail="验证码错误")
     
     # Delete used captcha
-    redis_client.delete(f"captcha:{req.captcha_id}")
+    await rds.delete(f"captcha:{req.captcha_id}")
     
     # 2. Decrypt Password
     decrypted_password = decrypt_password(req.password)
@@ -181,8 +188,8 @@ async def login(req: LoginRequest, session: Session = Depends(get_session)):
         raise HTTPException(status_code=400, detail="密码解密失败")
 
     # 3. Verify User
-    user = session.exec(select(AdminUser).where(AdminUser.username == req.username)).first()
-    if not user or not verify_password(decrypted_password, user.hashed_password):
+    user = (await session.exec(select(AdminUser).where(AdminUser.username == req.username))).first()
+    if not user or not await run_in_threadpool(verify_password, decrypted_password, user.hashed_password):
         raise HTTPException(status_code=401, detail="用户名或密码错误")
         
     if not user.is_active:
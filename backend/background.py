@@ -0,0 +1,45 @@
+"""
+Minimal periodic background task runner for per-worker housekeeping loops.
+
+Tasks run in a daemon thread started from the app's startup hook and are
+stopped (with an optional final run) from the shutdown hook.
+"""
+import threading
+from typing import Callable
+
+
+class PeriodicTask:
+    def __init__(self, name: str, interval: float, fn: Callable[[], None], run_on_stop: bool = False):
+        self.name = name
+        self.interval = interval
+        self.fn = fn
+        self.run_on_stop = run_on_stop
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        if self.run_on_stop:
+            self._run_once()
+
+    def _run_once(self):
+        try:
+            self.fn()
+        except Exception as e:
+            print(f"Background task {self.name} error: {e}")
+
+    def _loop(self):
+        # Run once right away so caches/stock are warm shortly after startup
+        self._run_once()
+        while not self._stop.wait(self.interval):
+            self._run_once()
@@ -0,0 +1,103 @@
+"""
+Benchmark: full vs compacted report prompt (backend.prompt_compaction).
+
+Usage:
+    python -m backend.benchmarks.bench_report_prompt [--kps 10,30,60,90] [--budget 1800]
+    python -m backend.benchmarks.bench_report_prompt --kps 60 --provider qwen [--api-key KEY] [--repeat 3]
+
+Prints prompt length (characters and estimated tokens) for synthetic papers
+touching the given numbers of knowledge points, with history, before and after
+compaction. With --provider, also streams both prompts of each size from the
+provider (or from `python -m backend.llm_stub` via QWEN_BASE_URL /
+GEMINI_BASE_URL) and reports median time to first chunk and total latency.
+"""
+import argparse
+import random
+import statistics
+import time
+
+from backend.ai_service import build_report_prompt
+from backend.config import settings
+from backend.llm_client import stream_text
+from backend.llm_router import PROVIDER_MODELS
+from backend.prompt_compaction import estimate_tokens
+
+CHAPTERS = ["计算机系统基础", "信息系统基础", "信息安全技术", "软件工程", "数据库设计", "系统架构设计", "系统质量属性与架构评估", "软件可靠性", "未来信息综合技术", "架构风格"]
+WEIGHTS = ["核心", "重要", "一般", "冷门"]
+
+
+def make_kp_stats(n_kps: int, seed: int = 0):
+    rnd = random.Random(seed)
+    kp_stats = {}
+    history_rates = {}
+    for kp_id in range(1, n_kps + 1):
+        total = rnd.randint(1, 3)
+        kp_stats[kp_id] = {
+            "total": total,
+            "correct": rnd.randint(0, total),
+            "name": f"知识点{kp_id}：" + "架构设计方法与质量属性"[:rnd.randint(4, 10)],
+            "chapter": CHAPTERS[kp_id % len(CHAPTERS)],
+            "weight": rnd.choice(WEIGHTS),
+        }
+        history_rates[kp_id] = rnd.choice([0.0, 0.2, 0.4, 0.6, 0.8])
+    score = sum(s["correct"] for s in kp_stats.values())
+    return min(75, score + rnd.randint(0, 20)), kp_stats, history_rates
+
+
+def prompts(n_kps: int, budget: int):
+    score, kp_stats, history_rates = make_kp_stats(n_kps)
+    full = build_report_prompt(score, kp_stats, settings.DEFAULT_PROMPT_REPORT, 90, history_rates, token_budget=0)
+    compact = build_report_prompt(score, kp_stats, settings.DEFAULT_PROMPT_REPORT, 90, history_rates, token_budget=budget)
+    return full, compact
+
+
+def bench_size(sizes, budget):
+    print(f"{'KPs':>5} {'full chars':>11} {'full tok':>9} {'compact chars':>14} {'compact tok':>12} {'saved':>7}")
+    for n in sizes:
+        full, compact = prompts(n, budget)
+        full_tok, compact_tok = estimate_tokens(full), estimate_tokens(compact)
+        print(f"{n:>5} {len(full):>11,} {full_tok:>9,} {len(compact):>14,} {compact_tok:>12,} {1 - compact_tok / full_tok:>6.0%}")
+
+
+def time_stream(provider, prompt, api_key, repeat):
+    model = PROVIDER_MODELS[provider][0]
+    first, total = [], []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        chunks = stream_text(provider, prompt, api_key, model)
+        first.append(time.perf_counter() - t0)
+        for _ in chunks:
+            pass
+        total.append(time.perf_counter() - t0)
+    return statistics.median(first), statistics.median(total)
+
+
+def bench_latency(sizes, budget, provider, api_key, repeat):
+    print(f"\nProvider latency ({provider}, median of {repeat})")
+    print(f"{'KPs':>5} {'prompt':>8} {'first chunk (s)':>16} {'total (s)':>10}")
+    for n in sizes:
+        for label, prompt in zip(("full", "compact"), prompts(n, budget)):
+            first, total = time_stream(provider, prompt, api_key, repeat)
+            print(f"{n:>5} {label:>8} {first:>16.2f} {total:>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--kps", default="10,30,60,90")
+    parser.add_argument("--budget", type=int, default=settings.REPORT_PROMPT_TOKEN_BUDGET)
+    parser.add_argument("--provider", choices=sorted(PROVIDER_MODELS), help="Also measure provider latency")
+    parser.add_argument("--api-key", default=None, help="Default: QWEN_API_KEY / GEMINI_API_KEY")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    sizes = [int(x) for x in args.kps.split(",")]
+    bench_size(sizes, args.budget)
+    if args.provider:
+        api_key = args.api_key or (settings.QWEN_API_KEY if args.provider == "qwen" else settings.GEMINI_API_KEY)
+        if not api_key:
+            parser.error("--api-key is required (or set QWEN_API_KEY / GEMINI_API_KEY)")
+        bench_latency(sizes, args.budget, args.provider, api_key, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
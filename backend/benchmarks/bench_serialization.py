@@ -0,0 +1,119 @@
+"""
+Benchmark: FastAPI default JSON path vs backend.serialization (orjson).
+
+Usage:
+    python -m backend.benchmarks.bench_serialization [--repeat 2000]
+
+Measures a 75-question exam payload (start_exam / session resume) and a
+dashboard stats payload (/api/dashboard/stats) for:
+  - response:  jsonable_encoder + JSONResponse.render  vs  json_response
+  - cache:     json.dumps / json.loads                 vs  dumps / loads
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from backend.serialization import dumps, loads, json_response
+
+
+def make_exam_payload(n_questions=75, seed=0):
+    rnd = random.Random(seed)
+    questions = []
+    for i in range(n_questions):
+        stem = "在系统架构设计中，关于质量属性场景的描述，以下说法正确的是（ ）。" * rnd.randint(1, 4)
+        questions.append({
+            "id": 10000 + i,
+            "index": i + 1,
+            "content": stem,
+            "options": [f"{letter}. 选项内容 {letter} " + "架构风格与质量属性" * rnd.randint(1, 3) for letter in "ABCD"],
+            "type": "single",
+            "user_answer": None,
+        })
+    return {
+        "session_id": "3f1c2a8e-8b1d-4a52-9f3e-2c1d0e9b7a65",
+        "status": "resumed",
+        "start_time": datetime(2026, 10, 16, 1, 2, 3).isoformat(),
+        "duration_left": 8123,
+        "questions": questions,
+        "user_answers": {str(10000 + i): rnd.choice("ABCD") for i in range(0, n_questions, 2)},
+    }
+
+
+def make_dashboard_payload(seed=0):
+    rnd = random.Random(seed)
+    today = datetime(2026, 10, 16)
+    dates = [(today - timedelta(days=i)).strftime("%Y-%m-%d") for i in range(6, -1, -1)]
+    return {
+        "user_stats": {
+            "total_users": 12345,
+            "pdf_downloads": 2345,
+            "shares": 678,
+            "trend": [{"date": d, "active": rnd.randint(0, 500), "new": rnd.randint(0, 200), "total": rnd.randint(1000, 20000)} for d in dates],
+            "device_distribution": [{"name": n, "value": rnd.randint(0, 5000)} for n in ("PC", "iPhone", "Android", "iPad", "Mobile")],
+            "score_distribution": [{"name": n, "value": rnd.randint(0, 3000)} for n in ("0-44", "45-59", "60-75")],
+        },
+        "kp_distribution": [{"name": n, "count": rnd.randint(0, 300), "percentage": round(rnd.random() * 100, 1)} for n in ("核心", "重要", "一般", "冷门", "非考纲要求")],
+        "location_distribution": [{"name": f"省份{i} 城市{i}", "value": rnd.randint(0, 800)} for i in range(300)],
+        "start_time_distribution": [{"name": f"{h:02d}", "value": rnd.randint(0, 100)} for h in range(24)],
+        "duration_distribution": [{"name": n, "value": rnd.randint(0, 2000)} for n in ("0-10m", "10-30m", "30-60m", "60-90m", "90m+")],
+        "ai_stats": {
+            "assembly": 2000, "report": 9000, "social": 800, "success": 11500, "failure": 300,
+            "avg_latency": {"assembly": 12.3, "report": 21.4, "social": 6.2},
+        },
+        "ai_trends": [{
+            "date": d, "assembly": rnd.randint(0, 300), "report": rnd.randint(0, 900), "social": rnd.randint(0, 100),
+            "success": rnd.randint(0, 1200), "failure": rnd.randint(0, 40),
+            "latency": {"assembly": round(rnd.random() * 20, 2), "report": round(rnd.random() * 30, 2), "social": round(rnd.random() * 10, 2)},
+        } for d in dates],
+    }
+
+
+def _median_us(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1e6
+
+
+def bench(name, payload, repeat):
+    cached_std = json.dumps(payload)
+    cached_fast = dumps(payload)
+    rows = [
+        ("response", lambda: JSONResponse(jsonable_encoder(payload)).body, lambda: json_response(payload).body),
+        ("cache dumps", lambda: json.dumps(payload), lambda: dumps(payload)),
+        ("cache loads", lambda: json.loads(cached_std), lambda: loads(cached_fast)),
+    ]
+    size = len(cached_fast.encode("utf-8"))
+    print(f"\n{name} ({size / 1024:.1f} KiB)")
+    print(f"{'step':>12} {'stdlib (us)':>12} {'orjson (us)':>12} {'speedup':>8}")
+    for step, legacy_fn, fast_fn in rows:
+        legacy = _median_us(legacy_fn, repeat)
+        fast = _median_us(fast_fn, repeat)
+        print(f"{step:>12} {legacy:>12.1f} {fast:>12.1f} {legacy / fast:>7.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    exam = make_exam_payload()
+    dashboard = make_dashboard_payload()
+    # Both paths must produce the same JSON value
+    assert loads(json_response(exam).body) == json.loads(JSONResponse(jsonable_encoder(exam)).body)
+    assert loads(dumps(dashboard)) == dashboard
+
+    bench("exam payload, 75 questions", exam, args.repeat)
+    bench("dashboard stats", dashboard, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
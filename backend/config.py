@@ -70,6 +70,70 @@ class Settings:
 3. **image_text** (图片文字): 适合印在分享图上的核心短句（如“AI说我是准高工”或“击败99%的竞争者”）。
 """
 
+    # Exam Paper Stock
+    # Number of pre-drawn base papers kept per subject (0 disables the stock)
+    PAPER_STOCK_DEPTH = int(os.getenv("PAPER_STOCK_DEPTH", "5"))
+    # How often (seconds) the background producer tops the stock up
+    PAPER_STOCK_REFRESH_SECONDS = int(os.getenv("PAPER_STOCK_REFRESH_SECONDS", "15"))
+
+    # Exam Answer Write-Behind (see backend/answer_buffer.py)
+    # How often (seconds) buffered answers are flushed from Redis to MySQL
+    ANSWER_FLUSH_SECONDS = int(os.getenv("ANSWER_FLUSH_SECONDS", "5"))
+
+    # AI Call Telemetry (see backend/ai_telemetry.py)
+    # How often (seconds) buffered AILog entries are bulk-inserted into MySQL
+    AI_LOG_FLUSH_SECONDS = int(os.getenv("AI_LOG_FLUSH_SECONDS", "5"))
+
+    # Offline IP Geolocation (see backend/geoip.py)
+    GEOIP_TABLE_PATH = os.getenv("GEOIP_TABLE_PATH", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "geoip", "ip_ranges.csv"))
+    # Default source for `python -m backend.geoip refresh`. A URL must be pinned (e.g. to a commit)
+    # and comes with the sha256 of the file; the refresh refuses URLs without one
+    GEOIP_SOURCE_URL = os.getenv("GEOIP_SOURCE_URL", "")
+    GEOIP_SOURCE_SHA256 = os.getenv("GEOIP_SOURCE_SHA256", "")
+    # Opt-in: fetch the table from GEOIP_SOURCE_URL at startup when the file is missing
+    GEOIP_FETCH_ON_STARTUP = os.getenv("GEOIP_FETCH_ON_STARTUP", "false").lower() == "true"
+    GEOIP_CACHE_SIZE = int(os.getenv("GEOIP_CACHE_SIZE", "65536"))
+
+    # LLM Client (see backend/llm_client.py)
+    # Per-request timeout (seconds), retries after the first attempt, and max in-flight calls per provider per worker
+    LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+    LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+    LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+    # Provider endpoints; point both at `python -m backend.llm_stub` for load tests
+    QWEN_BASE_URL = os.getenv("QWEN_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1")
+    GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta")
+
+    # LLM Routing (see backend/llm_router.py), used when keys for several providers are set
+    LLM_ROUTING = os.getenv("LLM_ROUTING", "true").lower() in ("1", "true", "yes")
+    # Hedge to the next provider after this latency percentile of the preferred one (0 disables hedging)
+    LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "90"))
+    LLM_HEDGE_DEFAULT_SECONDS = float(os.getenv("LLM_HEDGE_DEFAULT_SECONDS", "20"))
+    LLM_HEDGE_MIN_SECONDS = float(os.getenv("LLM_HEDGE_MIN_SECONDS", "2"))
+    # Circuit breaker per provider: open on this error rate (over at least MIN_CALLS) or CONSECUTIVE failures
+    LLM_BREAKER_ERROR_RATE = float(os.getenv("LLM_BREAKER_ERROR_RATE", "0.5"))
+    LLM_BREAKER_MIN_CALLS = int(os.getenv("LLM_BREAKER_MIN_CALLS", "5"))
+    LLM_BREAKER_CONSECUTIVE = int(os.getenv("LLM_BREAKER_CONSECUTIVE", "5"))
+    LLM_BREAKER_OPEN_SECONDS = float(os.getenv("LLM_BREAKER_OPEN_SECONDS", "30"))
+
+    # AI Variant Batching (see backend/variant_queue.py)
+    # The worker gathers variant jobs for this long (seconds) and sends up to MAX_KPS knowledge points per LLM call
+    VARIANT_BATCH_WINDOW_SECONDS = float(os.getenv("VARIANT_BATCH_WINDOW_SECONDS", "1.0"))
+    VARIANT_BATCH_MAX_KPS = int(os.getenv("VARIANT_BATCH_MAX_KPS", "15"))
+
+    # Report Prompt Compaction (see backend/prompt_compaction.py)
+    # Estimated token cap for the report prompt; larger KP sets are summarised per chapter (0 disables)
+    REPORT_PROMPT_TOKEN_BUDGET = int(os.getenv("REPORT_PROMPT_TOKEN_BUDGET", "1800"))
+
+    # AI Report Cache (see backend/report_gen_cache.py)
+    # Reports reused for submissions with the same normalised prompt inputs; 0 entries disables the cache
+    REPORT_GEN_CACHE_MAX_ENTRIES = int(os.getenv("REPORT_GEN_CACHE_MAX_ENTRIES", "20000"))
+    REPORT_GEN_CACHE_TTL_SECONDS = int(os.getenv("REPORT_GEN_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+    # Share Copy Cache (see backend/share_cache.py)
+    # Variants kept per distinct share prompt before clicks are served from the cache; 0 disables the cache
+    SHARE_CACHE_VARIANTS = int(os.getenv("SHARE_CACHE_VARIANTS", "3"))
+    SHARE_CACHE_TTL_SECONDS = int(os.getenv("SHARE_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
     # System Proxy
     PROXY_URL = os.getenv("PROXY_URL", None)
 
@@ -1,6 +1,9 @@
 from sqlmodel import SQLModel, create_engine, Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine
 from backend.config import settings
 import redis
+import redis.asyncio as aioredis
 import pymysql  # Explicitly import pymysql for SQLAlchemy MySQL driver
 
 # MySQL connection
@@ -10,9 +13,52 @@ engine = create_engine(settings.DATABASE_URL, echo=False, pool_pre_ping=True)
 # Redis connection
 redis_client = redis.from_url(settings.REDIS_URL, decode_responses=True)
 
+# Async connections for `async def` endpoints, so they never block the event loop.
+# Sync endpoints keep using `engine` / `redis_client` from the threadpool.
+def _async_database_url(url: str) -> str:
+    """Same database through its asyncio driver (pymysql -> aiomysql, sqlite -> aiosqlite)."""
+    for sync_prefix, async_prefix in (
+        ("mysql+pymysql://", "mysql+aiomysql://"),
+        ("mysql://", "mysql+aiomysql://"),
+        ("sqlite://", "sqlite+aiosqlite://"),
+    ):
+        if url.startswith(sync_prefix):
+            return async_prefix + url[len(sync_prefix):]
+    return url
+
+async_engine = create_async_engine(_async_database_url(settings.DATABASE_URL), echo=False, pool_pre_ping=True)
+async_redis_client = aioredis.from_url(settings.REDIS_URL, decode_responses=True)
+
+def add_missing_columns(bind=None):
+    """
+    create_all() only creates missing tables. Add columns that were added to a
+    model after its table was created (ALTER TABLE ... ADD COLUMN), using the
+    field's scalar default as the server default for existing rows.
+    """
+    from sqlalchemy import inspect, text
+    bind = bind or engine
+    inspector = inspect(bind)
+    existing_tables = set(inspector.get_table_names())
+    with bind.begin() as conn:
+        for table in SQLModel.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            present = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in present:
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=bind.dialect)}"
+                default = column.default.arg if column.default is not None and column.default.is_scalar else None
+                if default is not None:
+                    literal = int(default) if isinstance(default, bool) else default
+                    ddl += f" NOT NULL DEFAULT {literal!r}" if not column.nullable else f" DEFAULT {literal!r}"
+                print(f"Adding column {table.name}.{column.name}")
+                conn.execute(text(ddl))
+
 def create_db_and_tables():
     try:
         SQLModel.metadata.create_all(engine)
+        add_missing_columns()
         
         # Initialize default config if not exists
         from backend.models import AIConfig
@@ -34,6 +80,40 @@ def create_db_and_tables():
         print(f"Error creating tables: {e}")
         print("Please ensure MySQL is running and the database exists.")
 
+def upsert_increment(db: Session, model, rows, key_cols, inc_cols, set_cols=()):
+    """
+    Insert rows, or add `inc_cols` onto the existing row with the same `key_cols`
+    (which must be covered by a unique index). One statement for the whole batch.
+    """
+    if not rows:
+        return
+    table = model.__table__
+    dialect = db.get_bind().dialect.name
+    if dialect == "mysql":
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(table).values(rows)
+        updates = {c: table.c[c] + stmt.inserted[c] for c in inc_cols}
+        updates.update({c: stmt.inserted[c] for c in set_cols})
+        stmt = stmt.on_duplicate_key_update(**updates)
+    else:
+        # SQLite / PostgreSQL (local development)
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(table).values(rows)
+        updates = {c: table.c[c] + stmt.excluded[c] for c in inc_cols}
+        updates.update({c: stmt.excluded[c] for c in set_cols})
+        stmt = stmt.on_conflict_do_update(index_elements=list(key_cols), set_=updates)
+    db.exec(stmt)
+
 def get_session():
     with Session(engine) as session:
         yield session
+
+async def get_async_session():
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
+
+def get_async_redis():
+    return async_redis_client
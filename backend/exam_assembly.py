@@ -0,0 +1,165 @@
+"""
+Exam paper composition.
+
+A paper is 75 questions: 5 low-weight questions drawn uniformly, 22 past-paper
+and 45 exercise questions drawn by KP weight, and AI variants filling the rest.
+`draw_paper` is used both for cold assembly in start_exam (personal weights,
+history excluded) and by the paper stock producer (base weights plus a reserve
+of spare candidates per pool). `personalise_paper` turns a stocked paper into a
+user's paper.
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from backend.question_catalog import SubjectCatalog, PAST_PAPER_TYPES, EXERCISE_TYPES, AI_GENERATED_TYPE
+from backend.sampling import CandidatePool, KPWeightTable, weighted_pick, uniform_pick, get_rng
+
+EXAM_SIZE = 75
+
+# (pool, question count) in draw order; the AI pool fills whatever is left to EXAM_SIZE
+PAPER_LAYOUT = (("low_weight", 5), ("past", 22), ("exercise", 45))
+AI_POOL = "ai"
+UNIFORM_POOLS = ("low_weight",)
+
+# Weak-KP swaps prefer AI variants, then exercises, then past papers
+SWAP_SOURCE_ORDER = ("ai", "exercise", "past")
+
+
+def catalog_pools(catalog: SubjectCatalog) -> Dict[str, CandidatePool]:
+    return {
+        "low_weight": catalog.low_weight,
+        "past": catalog.pool(PAST_PAPER_TYPES),
+        "exercise": catalog.pool(EXERCISE_TYPES),
+        AI_POOL: catalog.pool(AI_GENERATED_TYPE),
+    }
+
+
+def base_kp_weights(kp_scores: Iterable[Tuple[int, Optional[int]]]) -> Dict[int, float]:
+    """Global KP weights (weight_score, minimum 1)."""
+    return {kp_id: float(score if score and score > 0 else 1) for kp_id, score in kp_scores}
+
+
+def personal_kp_weights(kp_scores: Iterable[Tuple[int, Optional[int]]], error_rates: Dict[int, float]) -> Dict[int, float]:
+    """W_final = W_global * (1 + 2.0 * ErrorRate)"""
+    weights = base_kp_weights(kp_scores)
+    for kp_id in weights:
+        weights[kp_id] *= (1.0 + 2.0 * error_rates.get(kp_id, 0.0))
+    return weights
+
+
+def weak_kps(error_rates: Dict[int, float], limit: int = 3, threshold: float = 0.4) -> List[int]:
+    """Top `limit` KPs by error rate with error rate >= threshold."""
+    sorted_errors = sorted(error_rates.items(), key=lambda x: x[1], reverse=True)
+    return [kpid for kpid, rate in sorted_errors if rate >= threshold][:limit]
+
+
+def _pick(name: str, pool: CandidatePool, k: int, weight_table: KPWeightTable, exclude_ids) -> CandidatePool:
+    if name in UNIFORM_POOLS:
+        return uniform_pick(pool, k, exclude_ids=exclude_ids)
+    return weighted_pick(pool, k, weight_table, exclude_ids=exclude_ids)
+
+
+def _layout():
+    for name, k in PAPER_LAYOUT:
+        yield name, k
+    yield AI_POOL, None
+
+
+def draw_paper(pools: Dict[str, CandidatePool], weight_table: KPWeightTable, exclude_ids=None, reserve_ratio: float = 0.0) -> Dict[str, Tuple[CandidatePool, int]]:
+    """
+    Draw a paper from the pools. Returns {pool: (drawn, k)} where the first k
+    entries of `drawn` are the picks and the remainder (reserve_ratio * k extra
+    candidates, in draw order) is kept as reserve for personalisation.
+    """
+    result = {}
+    taken: List[int] = []
+    for name, k in _layout():
+        if k is None:
+            k = max(0, EXAM_SIZE - len(taken))
+        pool = pools.get(name)
+        if pool is None or len(pool) == 0 or k == 0:
+            result[name] = (CandidatePool.from_entries([]), 0)
+            continue
+        pool = pool.without(taken)
+        drawn = _pick(name, pool, k + int(k * reserve_ratio), weight_table, exclude_ids)
+        k = min(k, len(drawn))
+        result[name] = (drawn, k)
+        taken.extend(int(x) for x in drawn.ids[:k])
+    return result
+
+
+def paper_question_ids(paper: Dict[str, Tuple[CandidatePool, int]]) -> List[int]:
+    ids = []
+    for drawn, k in paper.values():
+        ids.extend(int(x) for x in drawn.ids[:k])
+    return ids
+
+
+def personalise_paper(stocked: Dict[str, Tuple[CandidatePool, int]], pools: Dict[str, CandidatePool], weight_table: KPWeightTable, exclude_ids=None, swap_kps: Optional[List[int]] = None) -> List[int]:
+    """
+    Turn a stocked base paper into a user's paper:
+    1. Re-draw each pool's picks from its picks + reserve with the user's weights,
+       avoiding recently seen questions.
+    2. Make sure each weak KP in `swap_kps` is represented, swapping in a question
+       of that KP from the full pool for the lowest-weight pick of the same pool.
+    """
+    exclude = set(exclude_ids or [])
+    picks: Dict[str, CandidatePool] = {}
+    taken: List[int] = []
+    for name, _ in _layout():
+        drawn, k = stocked.get(name, (CandidatePool.from_entries([]), 0))
+        if k == 0:
+            continue
+        picked = _pick(name, drawn.without(taken), k, weight_table, exclude)
+        picks[name] = picked
+        taken.extend(int(x) for x in picked.ids)
+
+    for kp_id in swap_kps or []:
+        if any(np.any(p.kp_ids == kp_id) for p in picks.values()):
+            continue
+        _swap_in_kp(kp_id, picks, pools, weight_table, exclude, set(taken), set(swap_kps))
+        taken = [int(x) for p in picks.values() for x in p.ids]
+
+    return [int(x) for p in picks.values() for x in p.ids]
+
+
+def _swap_in_kp(kp_id: int, picks: Dict[str, CandidatePool], pools: Dict[str, CandidatePool], weight_table: KPWeightTable, exclude: set, taken: set, protected_kps: set):
+    for name in SWAP_SOURCE_ORDER:
+        pool = pools.get(name)
+        current = picks.get(name)
+        if pool is None or current is None or len(current) == 0:
+            continue
+        candidates = pool.ids[pool.kp_ids == kp_id]
+        candidates = [int(x) for x in candidates if int(x) not in taken and int(x) not in exclude]
+        if not candidates:
+            continue
+
+        # Replace the lowest-weight pick that does not itself cover a weak KP
+        weights = weight_table.lookup(current.kp_ids)
+        replaceable = ~np.isin(current.kp_ids, np.fromiter(protected_kps, dtype=np.int64))
+        if not replaceable.any():
+            continue
+        weights = np.where(replaceable, weights, np.inf)
+        victim = int(np.argmin(weights))
+
+        ids = current.ids.copy()
+        kp_ids = current.kp_ids.copy()
+        ids[victim] = candidates[int(get_rng().integers(len(candidates)))]
+        kp_ids[victim] = kp_id
+        picks[name] = CandidatePool(ids, kp_ids)
+        return
+
+
+def paper_to_dict(paper: Dict[str, Tuple[CandidatePool, int]]) -> Dict:
+    return {
+        name: {"k": k, "ids": [int(x) for x in drawn.ids], "kp_ids": [int(x) for x in drawn.kp_ids]}
+        for name, (drawn, k) in paper.items()
+    }
+
+
+def paper_from_dict(data: Dict) -> Dict[str, Tuple[CandidatePool, int]]:
+    return {
+        name: (CandidatePool(np.array(p["ids"], dtype=np.int64), np.array(p["kp_ids"], dtype=np.int64)), p["k"])
+        for name, p in data.items()
+    }
@@ -0,0 +1,157 @@
+"""
+Gatekeeping for /api/exam/start in one Redis round trip.
+
+The rate limit (INCR + EXPIRE), the cached session lookup (GET) and the
+generation lock (SET NX) run as a single server-side script, so the endpoint
+pays one round trip instead of four and the counter can never be left without
+a TTL between INCR and EXPIRE.
+
+The lock holds a per-request token and is released by a compare-and-delete
+script, so a request that outlives LOCK_TTL cannot drop the next holder's lock.
+
+Requests that find the lock busy do not poll: the lock holder publishes the
+finished session payload on `exam_gen_done:{fp}:{subject}` and waiters are
+woken by that message (see wait_for_result / finish_generation).
+"""
+import time
+import uuid
+from typing import Optional, Tuple
+
+from backend.database import redis_client
+
+RATE_LIMIT = 10 # requests per window per IP
+RATE_WINDOW = 60
+LOCK_TTL = 30
+# How long a busy request waits for the lock holder before giving up with 429
+WAIT_TIMEOUT = 10
+
+# Verdicts
+RATE_LIMITED = "rate_limited"
+CACHED = "cached"
+LOCK_ACQUIRED = "locked"
+LOCK_BUSY = "busy"
+
+# KEYS: rate_key, cache_key, lock_key
+# ARGV: rate_limit, rate_window, lock_ttl, lock_token
+_GATE_SCRIPT = """
+local rate = redis.call('INCR', KEYS[1])
+if rate == 1 then redis.call('EXPIRE', KEYS[1], ARGV[2]) end
+if rate > tonumber(ARGV[1]) then return {'rate_limited', ''} end
+
+local cached = redis.call('GET', KEYS[2])
+if cached then return {'cached', cached} end
+
+if redis.call('SET', KEYS[3], ARGV[4], 'NX', 'EX', ARGV[3]) then return {'locked', ''} end
+return {'busy', ''}
+"""
+_gate = redis_client.register_script(_GATE_SCRIPT)
+
+# KEYS: lock_key. ARGV: lock_token
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end
+return 0
+"""
+_release = redis_client.register_script(_RELEASE_SCRIPT)
+
+
+def rate_key(ip: str) -> str:
+    return f"rate_limit:start_exam:{ip}"
+
+
+def cache_key(fingerprint: str, subject_id: int) -> str:
+    return f"exam_session:{fingerprint}:{subject_id}"
+
+
+def lock_key(fingerprint: str, subject_id: int) -> str:
+    return f"exam_gen_lock:{fingerprint}:{subject_id}"
+
+
+def done_channel(fingerprint: str, subject_id: int) -> str:
+    return f"exam_gen_done:{fingerprint}:{subject_id}"
+
+
+def load_scripts():
+    """Load the gate scripts into Redis at startup so requests only send EVALSHA."""
+    try:
+        redis_client.script_load(_GATE_SCRIPT)
+        redis_client.script_load(_RELEASE_SCRIPT)
+    except Exception as e:
+        print(f"Redis Script Load Error: {e}")
+
+
+def new_lock_token() -> str:
+    """One per request; pass it to every gate call that may take or release the lock."""
+    return uuid.uuid4().hex
+
+
+def check_start_exam(ip: str, fingerprint: str, subject_id: int, token: str) -> Tuple[str, Optional[str]]:
+    """
+    Returns (verdict, cached_payload). cached_payload is only set for CACHED.
+    On LOCK_ACQUIRED the lock holds `token`.
+    If Redis is unavailable the request proceeds as if the lock was acquired.
+    """
+    try:
+        verdict, payload = _gate(
+            keys=[rate_key(ip), cache_key(fingerprint, subject_id), lock_key(fingerprint, subject_id)],
+            args=[RATE_LIMIT, RATE_WINDOW, LOCK_TTL, token],
+        )
+    except Exception as e:
+        print(f"Redis Gate Error: {e}")
+        return LOCK_ACQUIRED, None
+    return verdict, payload or None
+
+
+def acquire_lock(fingerprint: str, subject_id: int, token: str) -> bool:
+    try:
+        return bool(redis_client.set(lock_key(fingerprint, subject_id), token, nx=True, ex=LOCK_TTL))
+    except Exception as e:
+        print(f"Redis Lock Error: {e}")
+        return True
+
+
+def release_lock(fingerprint: str, subject_id: int, token: str):
+    """Release the lock only if it still holds `token` (it may have expired and been retaken)."""
+    try:
+        _release(keys=[lock_key(fingerprint, subject_id)], args=[token])
+    except Exception as e:
+        print(f"Redis Delete Error: {e}")
+
+
+def finish_generation(fingerprint: str, subject_id: int, payload: str, token: str):
+    """Wake requests waiting on this user's generation with the session payload, then release the lock."""
+    try:
+        redis_client.publish(done_channel(fingerprint, subject_id), payload)
+    except Exception as e:
+        print(f"Redis Publish Error: {e}")
+    release_lock(fingerprint, subject_id, token)
+
+
+def wait_for_result(fingerprint: str, subject_id: int, timeout: float = WAIT_TIMEOUT) -> Optional[str]:
+    """
+    Block until the lock holder publishes the session payload. Returns the payload,
+    or None on timeout / Redis error.
+    """
+    pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+    try:
+        pubsub.subscribe(done_channel(fingerprint, subject_id))
+        # The holder may have finished before we subscribed; it caches before publishing
+        cached = redis_client.get(cache_key(fingerprint, subject_id))
+        if cached:
+            return cached
+
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            message = pubsub.get_message(timeout=remaining)
+            if message and message["type"] == "message":
+                return message["data"]
+    except Exception as e:
+        print(f"Redis Wait Error: {e}")
+        return None
+    finally:
+        try:
+            pubsub.close()
+        except Exception:
+            pass
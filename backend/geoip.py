@@ -0,0 +1,292 @@
+"""
+Offline IP geolocation.
+
+Answers "region city" for an IPv4 address from a local range table instead of
+calling ip-api.com: the table is loaded once per worker into sorted integer
+arrays and queried by binary search, with an LRU cache for repeat IPs.
+
+Table file (settings.GEOIP_TABLE_PATH, default data/geoip/ip_ranges.csv):
+    start_int,end_int,region,city
+sorted by start_int, ranges non-overlapping. It is produced by a separate data
+step and shipped in the image as a file (the Docker build does not download
+anything):
+
+    python -m backend.geoip refresh --source <file-or-url> [--sha256 <hex>]
+    python -m backend.geoip lookup 1.2.3.4
+
+URL sources must be pinned: pass the expected sha256 of the downloaded file
+(--sha256 / GEOIP_SOURCE_SHA256), otherwise the refresh refuses to run. A
+process that starts without the table only fetches it when
+GEOIP_FETCH_ON_STARTUP is enabled (ensure_table), with the same check.
+
+The source may be a CSV of `start,end,region,city` (dotted or integer IPs) or
+an ip2region-style text file `start|end|country|area|province|city|isp` (or the
+newer `start|end|country|province|city|isp`).
+"""
+import argparse
+import bisect
+import csv
+import hashlib
+import io
+import ipaddress
+import os
+import threading
+from array import array
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+from backend.config import settings
+
+LAN_LABEL = "局域网 (LAN)"
+UNKNOWN_LABEL = "Unknown"
+
+
+class IPRangeTable:
+    def __init__(self, starts: array, ends: array, label_idx: array, labels: List[str]):
+        self.starts = starts
+        self.ends = ends
+        self.label_idx = label_idx
+        self.labels = labels
+
+    def __len__(self):
+        return len(self.starts)
+
+    def lookup(self, ip_int: int) -> Optional[str]:
+        pos = bisect.bisect_right(self.starts, ip_int) - 1
+        if pos < 0 or ip_int > self.ends[pos]:
+            return None
+        return self.labels[self.label_idx[pos]]
+
+    @classmethod
+    def load(cls, path: str) -> "IPRangeTable":
+        starts, ends, label_idx = array("L"), array("L"), array("L")
+        labels: List[str] = []
+        label_ids = {}
+        with open(path, encoding="utf-8", newline="") as f:
+            for row in csv.reader(f):
+                if not row or not row[0].isdigit():
+                    continue # header / comments
+                label = f"{row[2]} {row[3]}".strip() if len(row) > 3 else row[2].strip()
+                if label not in label_ids:
+                    label_ids[label] = len(labels)
+                    labels.append(label)
+                starts.append(int(row[0]))
+                ends.append(int(row[1]))
+                label_idx.append(label_ids[label])
+        return cls(starts, ends, label_idx, labels)
+
+
+_table: Optional[IPRangeTable] = None
+_table_lock = threading.Lock()
+_table_missing_reported = False
+
+
+def _get_table() -> Optional[IPRangeTable]:
+    global _table, _table_missing_reported
+    if _table is not None:
+        return _table
+    with _table_lock:
+        if _table is not None:
+            return _table
+        path = settings.GEOIP_TABLE_PATH
+        if not os.path.exists(path):
+            if not _table_missing_reported:
+                print(f"[WARNING] GeoIP table not found at {path}, locations will be '{UNKNOWN_LABEL}'. "
+                      f"Run: python -m backend.geoip refresh --source <file-or-url>")
+                _table_missing_reported = True
+            return None
+        _table = IPRangeTable.load(path)
+        print(f"[INFO] Loaded GeoIP table: {len(_table)} ranges from {path}")
+        return _table
+
+
+def reload_table():
+    """Drop the loaded table and cached lookups; the next lookup reloads from disk."""
+    global _table, _table_missing_reported
+    with _table_lock:
+        _table = None
+        _table_missing_reported = False
+    _locate_ip.cache_clear()
+
+
+def ensure_table(source: Optional[str] = None, sha256: Optional[str] = None) -> bool:
+    """
+    Fetch the table from `source` (default settings.GEOIP_SOURCE_URL, checked
+    against settings.GEOIP_SOURCE_SHA256) if it is missing, then load it.
+    Returns whether a table is available. Errors are printed, not raised:
+    lookups just stay Unknown.
+    """
+    path = settings.GEOIP_TABLE_PATH
+    source = source if source is not None else settings.GEOIP_SOURCE_URL
+    sha256 = sha256 if sha256 is not None else settings.GEOIP_SOURCE_SHA256
+    if not os.path.exists(path) and source:
+        try:
+            count = refresh_table(source, path, sha256=sha256)
+            print(f"[INFO] Fetched GeoIP table: {count} ranges from {source}")
+        except Exception as e:
+            print(f"[WARNING] GeoIP table fetch from {source} failed: {e}")
+        reload_table()
+    return _get_table() is not None
+
+
+def locate_ip(ip: str) -> str:
+    """Human-readable location for an IP: LAN, "region city", or Unknown."""
+    return _locate_ip((ip or "").strip())
+
+
+@lru_cache(maxsize=settings.GEOIP_CACHE_SIZE)
+def _locate_ip(ip: str) -> str:
+    try:
+        addr = ipaddress.ip_address(ip)
+    except ValueError:
+        return UNKNOWN_LABEL
+
+    # Dual-stack listeners report IPv4 clients as ::ffff:a.b.c.d
+    if addr.version == 6 and addr.ipv4_mapped:
+        addr = addr.ipv4_mapped
+
+    if addr.is_private or addr.is_loopback:
+        return LAN_LABEL
+    if addr.version != 4:
+        return UNKNOWN_LABEL
+
+    table = _get_table()
+    if table is None:
+        return UNKNOWN_LABEL
+    return table.lookup(int(addr)) or UNKNOWN_LABEL
+
+
+# -----------------------------------------------------------------------------
+# Table refresh
+# -----------------------------------------------------------------------------
+
+def _ip_to_int(value: str) -> int:
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+    return int(ipaddress.IPv4Address(value))
+
+
+def _clean(value: str) -> str:
+    value = value.strip()
+    return "" if value in ("0", "-", "") else value
+
+
+def parse_source(text: str) -> List[Tuple[int, int, str, str]]:
+    rows = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if "|" in line:
+            # ip2region style: start|end|country|area|province|city|isp
+            parts = line.split("|")
+            if len(parts) >= 7:
+                # start|end|country|area|province|city|isp
+                region = _clean(parts[4]) or _clean(parts[2])
+                city = _clean(parts[5])
+            elif len(parts) == 6:
+                # start|end|country|province|city|isp
+                region = _clean(parts[3]) or _clean(parts[2])
+                city = _clean(parts[4])
+            else:
+                continue
+        else:
+            parts = next(csv.reader(io.StringIO(line)))
+            if len(parts) < 3:
+                continue
+            region = _clean(parts[2])
+            city = _clean(parts[3]) if len(parts) > 3 else ""
+        try:
+            start, end = _ip_to_int(parts[0]), _ip_to_int(parts[1])
+        except ValueError:
+            continue # header or malformed row
+        if end < start:
+            continue
+        rows.append((start, end, region, city))
+
+    rows.sort()
+    # Drop overlaps (keep the earlier range) so binary search stays correct
+    cleaned = []
+    last_end = -1
+    for start, end, region, city in rows:
+        if start <= last_end:
+            if end <= last_end:
+                continue
+            start = last_end + 1
+        cleaned.append((start, end, region, city))
+        last_end = end
+    return cleaned
+
+
+def _is_url(source: str) -> bool:
+    return source.startswith("http://") or source.startswith("https://")
+
+
+def _read_source(source: str) -> bytes:
+    if _is_url(source):
+        import requests
+        res = requests.get(source, timeout=120)
+        res.raise_for_status()
+        return res.content
+    with open(source, "rb") as f:
+        return f.read()
+
+
+def refresh_table(source: str, path: Optional[str] = None, sha256: Optional[str] = None) -> int:
+    """
+    Rebuild the table file from a source file/URL. Returns the number of ranges
+    written. `sha256` (hex) is checked against the raw source and is required
+    for URLs, so an unpinned or changed upstream file is never loaded.
+    """
+    path = path or settings.GEOIP_TABLE_PATH
+    if _is_url(source) and not sha256:
+        raise ValueError(f"Refusing to download {source} without an expected sha256 (--sha256 / GEOIP_SOURCE_SHA256)")
+    raw = _read_source(source)
+    if sha256:
+        digest = hashlib.sha256(raw).hexdigest()
+        if digest != sha256.strip().lower():
+            raise ValueError(f"sha256 mismatch for {source}: expected {sha256}, got {digest}")
+    rows = parse_source(raw.decode("utf-8-sig"))
+    if not rows:
+        raise ValueError(f"No IP ranges parsed from {source}")
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # Per-process temp file: several workers may fetch at startup at once
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["start_int", "end_int", "region", "city"])
+        writer.writerows(rows)
+    os.replace(tmp_path, path)
+    return len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline IP geolocation table tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_refresh = sub.add_parser("refresh", help="Rebuild the IP range table")
+    p_refresh.add_argument("--source", default=settings.GEOIP_SOURCE_URL, help="Source file path or URL (default: GEOIP_SOURCE_URL)")
+    p_refresh.add_argument("--sha256", default=settings.GEOIP_SOURCE_SHA256, help="Expected sha256 of the source (required for URLs; default: GEOIP_SOURCE_SHA256)")
+    p_refresh.add_argument("--output", default=settings.GEOIP_TABLE_PATH)
+
+    p_lookup = sub.add_parser("lookup", help="Look up IP addresses")
+    p_lookup.add_argument("ips", nargs="+")
+
+    args = parser.parse_args()
+    if args.command == "refresh":
+        if not args.source:
+            parser.error("--source is required (or set GEOIP_SOURCE_URL)")
+        try:
+            count = refresh_table(args.source, args.output, sha256=args.sha256)
+        except ValueError as e:
+            parser.error(str(e))
+        print(f"Wrote {count} IP ranges to {args.output}")
+    else:
+        for ip in args.ips:
+            print(f"{ip}\t{locate_ip(ip)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,384 @@
+"""
+Shared, pooled LLM provider clients.
+
+One client per provider (and API key) per worker process, reused across calls
+so connections stay alive instead of paying a TLS handshake per request:
+
+- qwen:   OpenAI / AsyncOpenAI against DashScope's compatible-mode endpoint
+- gemini: requests.Session / httpx.AsyncClient against generateContent
+
+Every call goes through the same policy: a per-request timeout, retries with
+exponential backoff and full jitter on transient failures (timeouts, connection
+errors, 429 and 5xx), and a per-provider cap on in-flight calls.
+
+`chat_json` / `achat_json` return the parsed JSON object from the model, or
+raise LLMError. `stream_text` yields the completion text as it arrives. Provider,
+model and token counts of each call are reported to the caller's
+ai_telemetry.track_llm_call() block.
+"""
+import asyncio
+import json
+import random
+import threading
+import time
+import weakref
+from typing import Any, Callable, Dict, Iterator, Optional
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from backend.config import settings
+from backend.ai_telemetry import note_llm_usage
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+
+
+class LLMError(Exception):
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+def _backoff(attempt: int) -> float:
+    """Full jitter: uniform in [0, min(max, base * 2^attempt)]."""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+
+def _is_retryable(e: Exception, retry_statuses) -> bool:
+    if isinstance(e, LLMError):
+        return e.status in retry_statuses
+    # Transport-level failures of any of the clients
+    return isinstance(e, (requests.ConnectionError, requests.Timeout, httpx.TransportError)) or type(e).__name__ in ("APITimeoutError", "APIConnectionError")
+
+
+def parse_json_text(text: str) -> Any:
+    # Models sometimes wrap JSON in code fences
+    text = text.replace('```json', '').replace('```', '').strip()
+    return json.loads(text)
+
+
+# -----------------------------------------------------------------------------
+# Shared clients and concurrency caps
+# -----------------------------------------------------------------------------
+
+_clients_lock = threading.Lock()
+_qwen_clients: Dict[str, Any] = {}
+_http_session: Optional[requests.Session] = None
+
+_sync_limits: Dict[str, threading.BoundedSemaphore] = {}
+
+# Async clients and semaphores are bound to the event loop that first uses them,
+# so they are kept per running loop (tests, asyncio.run scripts and worker
+# threads each have their own). Weak keys: a loop's entries go away with it,
+# and a new loop reusing a dead loop's id() never gets its objects.
+_loop_objects: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Any, Any]]" = weakref.WeakKeyDictionary()
+
+
+def _loop_local(key: Any, factory: Callable[[], Any]) -> Any:
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        objects = _loop_objects.setdefault(loop, {})
+        if key not in objects:
+            objects[key] = factory()
+        return objects[key]
+
+
+def _sync_limit(provider: str) -> threading.BoundedSemaphore:
+    with _clients_lock:
+        if provider not in _sync_limits:
+            _sync_limits[provider] = threading.BoundedSemaphore(settings.LLM_MAX_CONCURRENCY)
+        return _sync_limits[provider]
+
+
+def _async_limit(provider: str) -> asyncio.Semaphore:
+    # asyncio primitives belong to one event loop
+    return _loop_local(("limit", provider), lambda: asyncio.Semaphore(settings.LLM_MAX_CONCURRENCY))
+
+
+def _qwen_client(api_key: str):
+    from openai import OpenAI
+    with _clients_lock:
+        client = _qwen_clients.get(api_key)
+        if client is None:
+            # Retries are handled here, not by the SDK
+            client = OpenAI(api_key=api_key, base_url=settings.QWEN_BASE_URL, timeout=settings.LLM_TIMEOUT_SECONDS, max_retries=0)
+            _qwen_clients[api_key] = client
+        return client
+
+
+def _qwen_async_client(api_key: str):
+    from openai import AsyncOpenAI
+    # Its connection pool belongs to the running loop
+    return _loop_local(("qwen", api_key), lambda: AsyncOpenAI(
+        api_key=api_key, base_url=settings.QWEN_BASE_URL, timeout=settings.LLM_TIMEOUT_SECONDS, max_retries=0,
+    ))
+
+
+def _gemini_session() -> requests.Session:
+    global _http_session
+    with _clients_lock:
+        if _http_session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=settings.LLM_MAX_CONCURRENCY)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            if settings.PROXY_URL:
+                session.proxies = {"http": settings.PROXY_URL, "https": settings.PROXY_URL}
+            _http_session = session
+        return _http_session
+
+
+def _gemini_async_client() -> httpx.AsyncClient:
+    # Its connection pool belongs to the running loop
+    return _loop_local("gemini", lambda: httpx.AsyncClient(
+        timeout=settings.LLM_TIMEOUT_SECONDS,
+        proxy=settings.PROXY_URL or None,
+        limits=httpx.Limits(max_connections=settings.LLM_MAX_CONCURRENCY, max_keepalive_connections=settings.LLM_MAX_CONCURRENCY),
+    ))
+
+
+def _qwen_status_error(e: Exception) -> Exception:
+    status = getattr(e, "status_code", None)
+    if status is not None:
+        return LLMError(str(e), status=status)
+    return e
+
+
+# -----------------------------------------------------------------------------
+# Providers
+# -----------------------------------------------------------------------------
+
+def _qwen_messages(prompt: str):
+    return [{'role': 'user', 'content': prompt}]
+
+
+def _gemini_url(model_name: str, api_key: str) -> str:
+    return f"{settings.GEMINI_BASE_URL}/models/{model_name}:generateContent?key={api_key}"
+
+
+def _gemini_payload(prompt: str) -> Dict[str, Any]:
+    return {
+        "contents": [{
+            "parts": [{"text": prompt}]
+        }],
+        "generationConfig": {
+            "response_mime_type": "application/json"
+        }
+    }
+
+
+def _gemini_stream_url(model_name: str, api_key: str) -> str:
+    return f"{settings.GEMINI_BASE_URL}/models/{model_name}:streamGenerateContent?alt=sse&key={api_key}"
+
+
+def _gemini_text(data: Dict[str, Any]) -> str:
+    return data['candidates'][0]['content']['parts'][0]['text']
+
+
+def _note_qwen_usage(usage):
+    if usage is not None:
+        note_llm_usage(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
+
+
+def _note_gemini_usage(data: Dict[str, Any]):
+    usage = data.get("usageMetadata")
+    if usage:
+        note_llm_usage(prompt_tokens=usage.get("promptTokenCount"), completion_tokens=usage.get("candidatesTokenCount"))
+
+
+def _qwen_once(prompt: str, api_key: str, model_name: str) -> Any:
+    try:
+        completion = _qwen_client(api_key).chat.completions.create(
+            model=model_name,
+            messages=_qwen_messages(prompt),
+            response_format={"type": "json_object"}
+        )
+    except Exception as e:
+        raise _qwen_status_error(e)
+    _note_qwen_usage(completion.usage)
+    return parse_json_text(completion.choices[0].message.content)
+
+
+async def _aqwen_once(prompt: str, api_key: str, model_name: str) -> Any:
+    try:
+        completion = await _qwen_async_client(api_key).chat.completions.create(
+            model=model_name,
+            messages=_qwen_messages(prompt),
+            response_format={"type": "json_object"}
+        )
+    except Exception as e:
+        raise _qwen_status_error(e)
+    _note_qwen_usage(completion.usage)
+    return parse_json_text(completion.choices[0].message.content)
+
+
+def _gemini_once(prompt: str, api_key: str, model_name: str) -> Any:
+    response = _gemini_session().post(
+        _gemini_url(model_name, api_key), json=_gemini_payload(prompt),
+        headers={"Content-Type": "application/json"}, timeout=settings.LLM_TIMEOUT_SECONDS,
+    )
+    if response.status_code >= 400:
+        raise LLMError(f"Gemini HTTP {response.status_code}: {response.text[:200]}", status=response.status_code)
+    data = response.json()
+    _note_gemini_usage(data)
+    return parse_json_text(_gemini_text(data))
+
+
+async def _agemini_once(prompt: str, api_key: str, model_name: str) -> Any:
+    response = await _gemini_async_client().post(
+        _gemini_url(model_name, api_key), json=_gemini_payload(prompt),
+        headers={"Content-Type": "application/json"},
+    )
+    if response.status_code >= 400:
+        raise LLMError(f"Gemini HTTP {response.status_code}: {response.text[:200]}", status=response.status_code)
+    data = response.json()
+    _note_gemini_usage(data)
+    return parse_json_text(_gemini_text(data))
+
+
+_SYNC_CALLS = {"qwen": _qwen_once, "gemini": _gemini_once}
+_ASYNC_CALLS = {"qwen": _aqwen_once, "gemini": _agemini_once}
+
+
+def chat_json(provider: str, prompt: str, api_key: str, model_name: str, retry_statuses=RETRY_STATUSES) -> Any:
+    """Call the provider and return the parsed JSON reply. Raises LLMError (or the last error) when retries run out."""
+    call = _SYNC_CALLS[provider]
+    note_llm_usage(provider=provider, model=model_name)
+    attempt = 0
+    while True:
+        try:
+            with _sync_limit(provider):
+                return call(prompt, api_key, model_name)
+        except Exception as e:
+            if attempt >= settings.LLM_MAX_RETRIES or not _is_retryable(e, retry_statuses):
+                raise
+            delay = _backoff(attempt)
+            print(f"[{provider}/{model_name}] transient error ({e}), retry {attempt + 1} in {delay:.2f}s")
+            time.sleep(delay)
+            attempt += 1
+
+
+async def achat_json(provider: str, prompt: str, api_key: str, model_name: str, retry_statuses=RETRY_STATUSES) -> Any:
+    """Async variant of chat_json."""
+    call = _ASYNC_CALLS[provider]
+    note_llm_usage(provider=provider, model=model_name)
+    attempt = 0
+    while True:
+        try:
+            async with _async_limit(provider):
+                return await call(prompt, api_key, model_name)
+        except Exception as e:
+            if attempt >= settings.LLM_MAX_RETRIES or not _is_retryable(e, retry_statuses):
+                raise
+            delay = _backoff(attempt)
+            print(f"[{provider}/{model_name}] transient error ({e}), retry {attempt + 1} in {delay:.2f}s")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+# -----------------------------------------------------------------------------
+# Streaming
+# -----------------------------------------------------------------------------
+
+def _qwen_stream(prompt: str, api_key: str, model_name: str) -> Iterator[str]:
+    try:
+        stream = _qwen_client(api_key).chat.completions.create(
+            model=model_name,
+            messages=_qwen_messages(prompt),
+            response_format={"type": "json_object"},
+            stream=True,
+            # The last chunk then carries token counts
+            stream_options={"include_usage": True}
+        )
+    except Exception as e:
+        raise _qwen_status_error(e)
+    with stream:
+        for chunk in stream:
+            if getattr(chunk, "usage", None):
+                _note_qwen_usage(chunk.usage)
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+def _gemini_stream(prompt: str, api_key: str, model_name: str) -> Iterator[str]:
+    with _gemini_session().post(
+        _gemini_stream_url(model_name, api_key), json=_gemini_payload(prompt),
+        headers={"Content-Type": "application/json"}, timeout=settings.LLM_TIMEOUT_SECONDS, stream=True,
+    ) as response:
+        if response.status_code >= 400:
+            raise LLMError(f"Gemini HTTP {response.status_code}: {response.text[:200]}", status=response.status_code)
+        # chunk_size=None: hand lines over as they arrive instead of filling 512-byte reads
+        for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            try:
+                data = json.loads(line[5:])
+                _note_gemini_usage(data)
+                text = _gemini_text(data)
+            except (ValueError, KeyError, IndexError):
+                continue
+            if text:
+                yield text
+
+
+_STREAM_CALLS = {"qwen": _qwen_stream, "gemini": _gemini_stream}
+
+
+def _stream_with_retry(provider: str, prompt: str, api_key: str, model_name: str, retry_statuses) -> Iterator[str]:
+    call = _STREAM_CALLS[provider]
+    attempt = 0
+    with _sync_limit(provider):
+        while True:
+            started = False
+            try:
+                for text in call(prompt, api_key, model_name):
+                    started = True
+                    yield text
+                return
+            except Exception as e:
+                # Once text has been handed out the call cannot be replayed
+                if started or attempt >= settings.LLM_MAX_RETRIES or not _is_retryable(e, retry_statuses):
+                    raise
+                delay = _backoff(attempt)
+                print(f"[{provider}/{model_name}] transient error ({e}), retry {attempt + 1} in {delay:.2f}s")
+                time.sleep(delay)
+                attempt += 1
+
+
+def stream_text(provider: str, prompt: str, api_key: str, model_name: str, retry_statuses=RETRY_STATUSES) -> Iterator[str]:
+    """
+    Stream the completion text. Waits for the first chunk before returning, so
+    connection/status errors (after retries) are raised here rather than while
+    iterating.
+    """
+    note_llm_usage(provider=provider, model=model_name)
+    chunks = _stream_with_retry(provider, prompt, api_key, model_name, retry_statuses)
+    try:
+        first = next(chunks)
+    except StopIteration:
+        return iter(())
+    return _Prepended(first, chunks)
+
+
+class _Prepended:
+    """The already-read first chunk followed by the rest; close() reaches the provider stream."""
+
+    def __init__(self, first: str, chunks):
+        self._first = first
+        self._chunks = chunks
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        if self._first is not None:
+            first, self._first = self._first, None
+            return first
+        return next(self._chunks)
+
+    def close(self):
+        # Releases the connection and the concurrency slot
+        self._chunks.close()
@@ -0,0 +1,301 @@
+"""
+Routing of LLM calls across providers.
+
+When keys for more than one provider are available, ai_service sends calls
+through here instead of straight to settings.AI_PROVIDER:
+
+- Rolling stats per (provider, model, kind): latency of successful calls and
+  error rate over the last STATS_WINDOW_SECONDS / STATS_WINDOW_CALLS calls.
+  kind is "chat" (full JSON reply) or "stream" (time to first chunk).
+- A circuit breaker per provider: it opens after LLM_BREAKER_CONSECUTIVE
+  failures in a row or an error rate of LLM_BREAKER_ERROR_RATE over at least
+  LLM_BREAKER_MIN_CALLS calls, skips the provider for LLM_BREAKER_OPEN_SECONDS,
+  then lets a single trial call through (half-open).
+- Hedging: the preferred provider (settings.AI_PROVIDER) is called first; if
+  it has not answered after its LLM_HEDGE_PERCENTILE latency, the next
+  provider is called as well and the first valid JSON reply wins. A provider
+  that fails early is failed over immediately. The losing call still finishes
+  in the background so its stats are recorded.
+
+State is per process (each API worker and the background worker keep their own).
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from backend.config import settings
+from backend.llm_client import chat_json, stream_text, LLMError, RETRY_STATUSES
+from backend.ai_telemetry import track_llm_call, merge_llm_usage
+
+# Models per provider in fallback order: a 429 on one moves to the next
+PROVIDER_MODELS = {
+    "qwen": ["qwen-plus"],
+    "gemini": ["gemini-2.0-flash", "gemini-1.5-flash"],
+}
+
+STATS_WINDOW_SECONDS = 600
+STATS_WINDOW_CALLS = 200
+# Below this many successful samples the hedge delay is LLM_HEDGE_DEFAULT_SECONDS
+MIN_PERCENTILE_SAMPLES = 20
+
+
+class RollingStats:
+    def __init__(self):
+        self._samples = deque(maxlen=STATS_WINDOW_CALLS)  # (monotonic ts, latency, ok)
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, ok: bool):
+        with self._lock:
+            self._samples.append((time.monotonic(), latency, ok))
+
+    def _recent(self) -> List[Tuple[float, float, bool]]:
+        cutoff = time.monotonic() - STATS_WINDOW_SECONDS
+        with self._lock:
+            return [s for s in self._samples if s[0] >= cutoff]
+
+    def error_rate(self) -> Tuple[int, float]:
+        """(calls, error rate) in the window."""
+        recent = self._recent()
+        if not recent:
+            return 0, 0.0
+        errors = sum(1 for _, _, ok in recent if not ok)
+        return len(recent), errors / len(recent)
+
+    def latency_percentile(self, pct: float) -> Optional[float]:
+        latencies = sorted(latency for _, latency, ok in self._recent() if ok)
+        if len(latencies) < MIN_PERCENTILE_SAMPLES:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * pct / 100))]
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.consecutive_failures = 0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= settings.LLM_BREAKER_OPEN_SECONDS:
+                self.state = self.HALF_OPEN
+                self.trial_in_flight = False
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def on_result(self, ok: bool, stats: RollingStats):
+        with self._lock:
+            if ok:
+                self.consecutive_failures = 0
+                # A slow call started before the circuit opened does not close it; the trial call does
+                if self.state == self.OPEN:
+                    return
+                if self.state != self.CLOSED:
+                    print(f"LLM circuit for {self.name} closed")
+                self.state = self.CLOSED
+                return
+            self.consecutive_failures += 1
+            calls, rate = stats.error_rate()
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and (
+                self.consecutive_failures >= settings.LLM_BREAKER_CONSECUTIVE
+                or (calls >= settings.LLM_BREAKER_MIN_CALLS and rate >= settings.LLM_BREAKER_ERROR_RATE)
+            )):
+                print(f"LLM circuit for {self.name} opened ({self.consecutive_failures} failures in a row, error rate {rate:.0%} over {calls} calls)")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+_lock = threading.Lock()
+_stats: Dict[Tuple[str, str, str], RollingStats] = {}
+_provider_stats: Dict[str, RollingStats] = {}
+_breakers: Dict[str, CircuitBreaker] = {name: CircuitBreaker(name) for name in PROVIDER_MODELS}
+# Calls run here so the caller can wait on several at once
+_executor = ThreadPoolExecutor(max_workers=2 * settings.LLM_MAX_CONCURRENCY, thread_name_prefix="llm-route")
+
+
+def _route_stats(provider: str, model: str, kind: str) -> RollingStats:
+    with _lock:
+        key = (provider, model, kind)
+        if key not in _stats:
+            _stats[key] = RollingStats()
+        if provider not in _provider_stats:
+            _provider_stats[provider] = RollingStats()
+        return _stats[key]
+
+
+def _record(provider: str, model: str, kind: str, latency: float, ok: bool, provider_level: bool = True):
+    _route_stats(provider, model, kind).record(latency, ok)
+    if not provider_level:
+        return
+    provider_stats = _provider_stats[provider]
+    provider_stats.record(latency, ok)
+    _breakers[provider].on_result(ok, provider_stats)
+
+
+def _retry_statuses(provider: str, index: int):
+    # Rate limits move on to the next model instead of being retried
+    if index + 1 < len(PROVIDER_MODELS[provider]):
+        return tuple(s for s in RETRY_STATUSES if s != 429)
+    return RETRY_STATUSES
+
+
+def _falls_back(provider: str, index: int, e: Exception) -> bool:
+    if index + 1 < len(PROVIDER_MODELS[provider]) and isinstance(e, LLMError) and e.status == 429:
+        print(f"{provider} {PROVIDER_MODELS[provider][index]} Rate Limit (429). Falling back to {PROVIDER_MODELS[provider][index + 1]}...")
+        return True
+    return False
+
+
+def _chat(provider: str, prompt: str, api_key: str) -> Any:
+    models = PROVIDER_MODELS[provider]
+    for i, model in enumerate(models):
+        start = time.monotonic()
+        try:
+            result = chat_json(provider, prompt, api_key, model, retry_statuses=_retry_statuses(provider, i))
+            if not isinstance(result, (dict, list)):
+                raise LLMError(f"{provider}/{model} returned no JSON object")
+        except Exception as e:
+            # A 429 handed to the next model is not a provider failure
+            fallback = _falls_back(provider, i, e)
+            _record(provider, model, "chat", time.monotonic() - start, False, provider_level=not fallback)
+            if fallback:
+                continue
+            raise
+        _record(provider, model, "chat", time.monotonic() - start, True)
+        return result
+
+
+def _stream(provider: str, prompt: str, api_key: str) -> Iterator[str]:
+    models = PROVIDER_MODELS[provider]
+    for i, model in enumerate(models):
+        start = time.monotonic()
+        try:
+            chunks = stream_text(provider, prompt, api_key, model, retry_statuses=_retry_statuses(provider, i))
+        except Exception as e:
+            # A 429 handed to the next model is not a provider failure
+            fallback = _falls_back(provider, i, e)
+            _record(provider, model, "stream", time.monotonic() - start, False, provider_level=not fallback)
+            if fallback:
+                continue
+            raise
+        _record(provider, model, "stream", time.monotonic() - start, True)
+        return _WatchedStream(provider, model, chunks)
+
+
+class _WatchedStream:
+    """A stream that breaks after its first chunk still counts against the provider."""
+
+    def __init__(self, provider: str, model: str, chunks):
+        self.provider = provider
+        self.model = model
+        self._chunks = chunks
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        try:
+            return next(self._chunks)
+        except StopIteration:
+            raise
+        except Exception:
+            _record(self.provider, self.model, "stream", 0.0, False)
+            raise
+
+    def close(self):
+        close = getattr(self._chunks, "close", None)
+        if close:
+            close()
+
+
+def _hedge_delay(provider: str, kind: str) -> float:
+    latency = _route_stats(provider, PROVIDER_MODELS[provider][0], kind).latency_percentile(settings.LLM_HEDGE_PERCENTILE)
+    if latency is None:
+        latency = settings.LLM_HEDGE_DEFAULT_SECONDS
+    return max(settings.LLM_HEDGE_MIN_SECONDS, latency)
+
+
+def _providers(api_keys: Dict[str, str]) -> List[str]:
+    primary = settings.AI_PROVIDER if settings.AI_PROVIDER in PROVIDER_MODELS else "gemini"
+    order = [primary] + [p for p in PROVIDER_MODELS if p != primary]
+    return [p for p in order if api_keys.get(p)]
+
+
+def can_route(api_keys: Optional[Dict[str, str]]) -> bool:
+    """Routing applies when enabled and keys for at least two providers are set."""
+    return bool(settings.LLM_ROUTING and api_keys and len(_providers(api_keys)) > 1)
+
+
+def _attempt(call: Callable[[str, str], Any], provider: str, api_key: str) -> Tuple[Any, Dict[str, Any]]:
+    # Usage is collected per attempt; only the winner's reaches the caller's track_llm_call()
+    with track_llm_call() as usage:
+        return call(provider, api_key), usage
+
+
+def _run(api_keys: Dict[str, str], kind: str, call: Callable[[str, str], Any], discard: Callable[[Any], None]) -> Any:
+    providers = _providers(api_keys)
+    queue = list(providers)
+    pending = {}
+    errors: List[Exception] = []
+
+    def launch() -> bool:
+        while queue:
+            provider = queue.pop(0)
+            if _breakers[provider].allow():
+                pending[_executor.submit(_attempt, call, provider, api_keys[provider])] = provider
+                return True
+            print(f"LLM circuit for {provider} is open, skipping")
+        return False
+
+    if not launch():
+        raise LLMError(f"All LLM providers unavailable (circuit open): {', '.join(providers)}")
+
+    hedging = settings.LLM_HEDGE_PERCENTILE > 0
+    hedge_at = time.monotonic() + _hedge_delay(pending[next(iter(pending))], kind)
+    while pending:
+        timeout = max(0.0, hedge_at - time.monotonic()) if hedging and queue else None
+        done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+        if not done:
+            print(f"LLM hedge: no {kind} reply from {', '.join(pending.values())} after {_hedge_delay(next(iter(pending.values())), kind):.1f}s")
+            launch()
+            continue
+        for future in done:
+            provider = pending.pop(future)
+            try:
+                result, usage = future.result()
+            except Exception as e:
+                print(f"LLM {kind} via {provider} failed: {e}")
+                errors.append(e)
+                continue
+            # Late finishers are dropped (streams are closed)
+            for other in pending:
+                other.add_done_callback(lambda f: discard(f.result()[0]) if f.exception() is None else None)
+            merge_llm_usage(usage)
+            return result
+        if not pending:
+            launch()
+    raise errors[-1] if errors else LLMError("No LLM provider answered")
+
+
+def route_chat_json(prompt: str, api_keys: Dict[str, str]) -> Any:
+    """Parsed JSON reply from the first provider that answers validly. Raises when all fail."""
+    return _run(api_keys, "chat", lambda provider, key: _chat(provider, prompt, key), lambda result: None)
+
+
+def route_stream_text(prompt: str, api_keys: Dict[str, str]) -> Iterator[str]:
+    """Completion stream of the first provider to produce text (hedged on time to first chunk)."""
+    def discard(chunks):
+        close = getattr(chunks, "close", None)
+        if close:
+            close()
+    return _run(api_keys, "stream", lambda provider, key: _stream(provider, prompt, key), discard)
@@ -0,0 +1,421 @@
+"""
+Stub LLM server for load and latency tests.
+
+Speaks the two provider APIs used by backend/llm_client.py, so submit_exam (the
+report worker), the share copy and AI variants can be exercised without calling
+DashScope or Gemini:
+
+- POST /v1/chat/completions                          Qwen (OpenAI-compatible), plain or stream=true
+- POST /v1beta/models/{model}:generateContent        Gemini
+- POST /v1beta/models/{model}:streamGenerateContent  Gemini, SSE (?alt=sse)
+- GET  /stats                                        calls per prompt kind and outcome
+
+Replies are schema-valid JSON for the prompt kind (report, share or variant,
+detected from the prompt text). Latency is drawn from a log-normal
+distribution. Failures can be injected as a random HTTP 500 rate, a random 429
+rate, and 429 bursts (every N seconds, all calls fail for S seconds):
+
+    python -m backend.llm_stub --port 8900 --latency-median 4 --latency-sigma 0.5 \\
+        --error-rate 0.02 --burst-every 60 --burst-seconds 5
+
+Then run the API and the worker with
+    QWEN_BASE_URL=http://127.0.0.1:8900/v1
+    GEMINI_BASE_URL=http://127.0.0.1:8900/v1beta
+and any non-empty API keys.
+
+Record/replay:
+    --record FILE  forward every call to the real provider with the caller's key
+                   (--upstream-qwen / --upstream-gemini) and append
+                   {"prompt_sha", "kind", "text", "latency"} to FILE as JSON lines
+    --replay FILE  answer prompts recorded in FILE with the recorded text; other
+                   prompts get synthetic replies. Latency and failures still
+                   follow the options above.
+"""
+import argparse
+import asyncio
+import hashlib
+import math
+import random
+import re
+import time
+import uuid
+from collections import Counter
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from backend.prompt_compaction import estimate_tokens
+from backend.serialization import dumps, loads
+
+DEFAULT_UPSTREAM_QWEN = "https://dashscope.aliyuncs.com/compatible-mode/v1"
+DEFAULT_UPSTREAM_GEMINI = "https://generativelanguage.googleapis.com/v1beta"
+
+
+class StubOptions:
+    # Full reply latency: log-normal with this median (seconds) and sigma
+    latency_median = 3.0
+    latency_sigma = 0.5
+    # Share of the latency spent before the first stream chunk
+    ttft_fraction = 0.2
+    stream_chunks = 20
+    error_rate = 0.0
+    rate_limit_rate = 0.0
+    burst_every = 0.0
+    burst_seconds = 0.0
+    record_path: Optional[str] = None
+    replay: Dict[str, str] = {}
+    upstream_qwen = DEFAULT_UPSTREAM_QWEN
+    upstream_gemini = DEFAULT_UPSTREAM_GEMINI
+
+
+options = StubOptions()
+stats: Counter = Counter()
+app = FastAPI(title="LLM stub")
+
+
+def prompt_sha(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+def prompt_kind(prompt: str) -> str:
+    if "种子题目" in prompt:
+        return "variant"
+    if "moments_copy" in prompt:
+        return "share"
+    if "knowledge_profile" in prompt:
+        return "report"
+    return "other"
+
+
+# -----------------------------------------------------------------------------
+# Synthetic replies
+# -----------------------------------------------------------------------------
+
+def _fake_report(prompt: str) -> Dict[str, Any]:
+    match = re.search(r"总分：(\d+)", prompt)
+    score = int(match.group(1)) if match else 45
+    low = max(0, min(70, score - 3))
+    level = "准高级工程师" if score >= 45 else "初级工程师"
+    return {
+        "knowledge_profile": {
+            "strengths": ["软件架构风格", "质量属性"],
+            "weaknesses": ["系统可靠性分析与设计", "信息安全技术"],
+        },
+        "evaluation": {"level": level, "comment": f"本次得分 {score} 分，基础较扎实，但高权重章节仍有明显短板。"},
+        "prediction": {"score_range": f"{low}-{low + 5}", "advice": "若能攻克可靠性与安全两个薄弱项，预计可提升 5 分。"},
+        "learning_path": [
+            "使用“智能组卷”针对 [系统可靠性分析与设计] 进行定向训练",
+            "复习信息安全技术的典型考点",
+            "每周完成一套真题并回顾错题",
+        ],
+    }
+
+
+def _fake_share(prompt: str) -> Dict[str, Any]:
+    match = re.search(r"评分等级：(.+)", prompt)
+    level = match.group(1).strip() if match else "准高级工程师"
+    return {
+        "moments_copy": f"AI 精准诊断说我是{level}\n哪里不会考哪里\n离证书又近了一步",
+        "xiaohongshu_copy": f"🚫拒绝无效刷题！AI 说我是{level}🔥\nAI智能组卷，精准查漏补缺💪\n#软考 #AI备考 #备考攻略",
+        "image_text": f"AI说我是{level}",
+    }
+
+
+def _fake_variants(prompt: str) -> List[Dict[str, Any]]:
+    match = re.search(r"生成 (\d+) 道", prompt)
+    count = int(match.group(1)) if match else 1
+    items = []
+    for seed_id in re.findall(r"^ID: (\S+)$", prompt, flags=re.MULTILINE):
+        for i in range(count):
+            items.append({
+                "based_on_id": int(seed_id) if seed_id.isdigit() else seed_id,
+                "content": f"（桩）关于种子题 {seed_id} 所考知识点的变体题 {i + 1}，以下说法正确的是（ ）。",
+                "options": ["A. 说法一", "B. 说法二", "C. 说法三", "D. 说法四"],
+                "answer": random.choice("ABCD"),
+                "explanation": "桩服务生成的解析。",
+            })
+    return items
+
+
+_FAKES = {"report": _fake_report, "share": _fake_share, "variant": _fake_variants}
+
+
+def reply_text(prompt: str) -> str:
+    recorded = options.replay.get(prompt_sha(prompt))
+    if recorded is not None:
+        return recorded
+    fake = _FAKES.get(prompt_kind(prompt))
+    return dumps(fake(prompt) if fake else {})
+
+
+# -----------------------------------------------------------------------------
+# Latency and failures
+# -----------------------------------------------------------------------------
+
+def sample_latency() -> float:
+    if options.latency_median <= 0:
+        return 0.0
+    return random.lognormvariate(math.log(options.latency_median), options.latency_sigma)
+
+
+def injected_failure() -> Optional[int]:
+    """HTTP status to fail this call with, or None."""
+    if options.burst_every > 0 and time.time() % options.burst_every < options.burst_seconds:
+        return 429
+    if random.random() < options.rate_limit_rate:
+        return 429
+    if random.random() < options.error_rate:
+        return 500
+    return None
+
+
+def _chunks(text: str) -> List[str]:
+    size = max(1, math.ceil(len(text) / max(1, options.stream_chunks)))
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+# -----------------------------------------------------------------------------
+# Provider shapes
+# -----------------------------------------------------------------------------
+
+def _qwen_error(status: int, message: str) -> JSONResponse:
+    code = "rate_limit_exceeded" if status == 429 else "internal_error"
+    return JSONResponse({"error": {"message": message, "type": code, "code": code}}, status_code=status)
+
+
+def _gemini_error(status: int, message: str) -> JSONResponse:
+    name = "RESOURCE_EXHAUSTED" if status == 429 else "INTERNAL"
+    return JSONResponse({"error": {"code": status, "message": message, "status": name}}, status_code=status)
+
+
+def _usage(prompt: str, text: str) -> Dict[str, int]:
+    prompt_tokens, completion_tokens = estimate_tokens(prompt), estimate_tokens(text)
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+
+
+def _qwen_completion(model: str, text: str, usage: Dict[str, int]) -> Dict[str, Any]:
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": text}}],
+        "usage": usage,
+    }
+
+
+def _qwen_chunk(chunk_id: str, model: str, text: str, finish_reason: Optional[str] = None) -> str:
+    delta = {"content": text} if text else {}
+    body = {
+        "id": chunk_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    return f"data: {dumps(body)}\n\n"
+
+
+def _gemini_body(text: str, usage: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+    body = {"candidates": [{"content": {"parts": [{"text": text}], "role": "model"}, "index": 0}]}
+    if usage:
+        body["usageMetadata"] = {"promptTokenCount": usage["prompt_tokens"], "candidatesTokenCount": usage["completion_tokens"], "totalTokenCount": usage["total_tokens"]}
+    return body
+
+
+async def _paced(chunks: List[str], total: float) -> AsyncIterator[str]:
+    """Yield chunks with the first after ttft_fraction of `total` and the rest spread over the remainder."""
+    await asyncio.sleep(total * options.ttft_fraction)
+    gap = total * (1 - options.ttft_fraction) / max(1, len(chunks) - 1)
+    for i, chunk in enumerate(chunks):
+        if i:
+            await asyncio.sleep(gap)
+        yield chunk
+
+
+# -----------------------------------------------------------------------------
+# Record mode
+# -----------------------------------------------------------------------------
+
+_upstream: Optional[httpx.AsyncClient] = None
+
+
+def _upstream_client() -> httpx.AsyncClient:
+    global _upstream
+    if _upstream is None:
+        _upstream = httpx.AsyncClient(timeout=120)
+    return _upstream
+
+
+def _record(prompt: str, text: str, latency: float):
+    entry = {"prompt_sha": prompt_sha(prompt), "kind": prompt_kind(prompt), "text": text, "latency": round(latency, 3)}
+    with open(options.record_path, "a", encoding="utf-8") as f:
+        f.write(dumps(entry) + "\n")
+
+
+async def _forward_qwen(request: Request, body: Dict[str, Any]) -> httpx.Response:
+    payload = dict(body, stream=False)
+    payload.pop("stream_options", None)
+    return await _upstream_client().post(
+        f"{options.upstream_qwen}/chat/completions", json=payload,
+        headers={"Authorization": request.headers.get("authorization", "")},
+    )
+
+
+async def _forward_gemini(request: Request, model: str, body: Dict[str, Any]) -> httpx.Response:
+    return await _upstream_client().post(
+        f"{options.upstream_gemini}/models/{model}:generateContent",
+        params={"key": request.query_params.get("key", "")}, json=body,
+    )
+
+
+def load_replay(path: str) -> Dict[str, str]:
+    replay = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                entry = loads(line)
+                replay[entry["prompt_sha"]] = entry["text"]
+    return replay
+
+
+# -----------------------------------------------------------------------------
+# Routes
+# -----------------------------------------------------------------------------
+
+async def _resolve(prompt: str, forward) -> Any:
+    """
+    (text or upstream response, latency still to simulate), or
+    (error status, message) for an upstream or injected failure.
+    """
+    kind = prompt_kind(prompt)
+    if options.record_path:
+        start = time.monotonic()
+        response = await forward()
+        if response.status_code >= 400:
+            stats[(kind, response.status_code)] += 1
+            return response.status_code, response.text[:500]
+        return response, time.monotonic() - start
+
+    status = injected_failure()
+    if status is not None:
+        stats[(kind, status)] += 1
+        if status == 500:
+            await asyncio.sleep(sample_latency() * options.ttft_fraction)
+        return status, "injected by llm_stub"
+    return reply_text(prompt), sample_latency()
+
+
+@app.post("/v1/chat/completions")
+async def qwen_chat(request: Request):
+    body = await request.json()
+    prompt = "\n".join(str(m.get("content", "")) for m in body.get("messages", []))
+    model = body.get("model", "qwen-plus")
+    resolved = await _resolve(prompt, lambda: _forward_qwen(request, body))
+    if isinstance(resolved[0], int):
+        return _qwen_error(*resolved)
+    text, latency = resolved
+    if isinstance(text, httpx.Response):
+        text = text.json()["choices"][0]["message"]["content"]
+        _record(prompt, text, latency)
+        latency = 0.0
+    stats[(prompt_kind(prompt), 200)] += 1
+
+    if not body.get("stream"):
+        await asyncio.sleep(latency)
+        return JSONResponse(_qwen_completion(model, text, _usage(prompt, text)))
+
+    chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+
+    async def events():
+        async for chunk in _paced(_chunks(text), latency):
+            yield _qwen_chunk(chunk_id, model, chunk)
+        yield _qwen_chunk(chunk_id, model, "", finish_reason="stop")
+        if (body.get("stream_options") or {}).get("include_usage"):
+            yield f"data: {dumps({'id': chunk_id, 'object': 'chat.completion.chunk', 'created': int(time.time()), 'model': model, 'choices': [], 'usage': _usage(prompt, text)})}\n\n"
+        yield "data: [DONE]\n\n"
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.post("/v1beta/models/{model_action}")
+async def gemini_generate(model_action: str, request: Request):
+    model, _, action = model_action.partition(":")
+    body = await request.json()
+    prompt = "\n".join(str(p.get("text", "")) for c in body.get("contents", []) for p in c.get("parts", []))
+    resolved = await _resolve(prompt, lambda: _forward_gemini(request, model, body))
+    if isinstance(resolved[0], int):
+        return _gemini_error(*resolved)
+    text, latency = resolved
+    if isinstance(text, httpx.Response):
+        text = text.json()["candidates"][0]["content"]["parts"][0]["text"]
+        _record(prompt, text, latency)
+        latency = 0.0
+    stats[(prompt_kind(prompt), 200)] += 1
+
+    if action != "streamGenerateContent":
+        await asyncio.sleep(latency)
+        return JSONResponse(_gemini_body(text, _usage(prompt, text)))
+
+    async def events():
+        chunks = _chunks(text)
+        i = 0
+        async for chunk in _paced(chunks, latency):
+            i += 1
+            # Token counts ride on the last chunk, as with the real API
+            yield f"data: {dumps(_gemini_body(chunk, _usage(prompt, text) if i == len(chunks) else None))}\r\n\r\n"
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/stats")
+def get_stats():
+    result: Dict[str, Dict[str, int]] = {}
+    for (kind, status), count in stats.items():
+        result.setdefault(kind, {})[str(status)] = count
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub Qwen/Gemini server for load and latency tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-median", type=float, default=options.latency_median, help="Median full reply latency in seconds (0 = instant)")
+    parser.add_argument("--latency-sigma", type=float, default=options.latency_sigma, help="Log-normal sigma of the latency")
+    parser.add_argument("--ttft-fraction", type=float, default=options.ttft_fraction, help="Share of the latency before the first stream chunk")
+    parser.add_argument("--stream-chunks", type=int, default=options.stream_chunks)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability of an HTTP 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Probability of an HTTP 429")
+    parser.add_argument("--burst-every", type=float, default=0.0, help="Start a 429 burst every N seconds (0 = never)")
+    parser.add_argument("--burst-seconds", type=float, default=0.0, help="Length of each 429 burst")
+    parser.add_argument("--seed", type=int, default=None)
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--record", metavar="FILE", help="Forward calls to the real providers and record replies")
+    group.add_argument("--replay", metavar="FILE", help="Answer recorded prompts from FILE")
+    parser.add_argument("--upstream-qwen", default=DEFAULT_UPSTREAM_QWEN)
+    parser.add_argument("--upstream-gemini", default=DEFAULT_UPSTREAM_GEMINI)
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    options.latency_median = args.latency_median
+    options.latency_sigma = args.latency_sigma
+    options.ttft_fraction = min(1.0, max(0.0, args.ttft_fraction))
+    options.stream_chunks = args.stream_chunks
+    options.error_rate = args.error_rate
+    options.rate_limit_rate = args.rate_limit_rate
+    options.burst_every = args.burst_every
+    options.burst_seconds = args.burst_seconds
+    options.upstream_qwen = args.upstream_qwen.rstrip("/")
+    options.upstream_gemini = args.upstream_gemini.rstrip("/")
+    options.record_path = args.record
+    if args.replay:
+        options.replay = load_replay(args.replay)
+        print(f"Loaded {len(options.replay)} recorded replies from {args.replay}")
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,23 +4,53 @@ from sqlmodel import Session, select, delete, desc
 from typing import List, Dict, Any, Optional
 from datetime import datetime, timedelta
 import random
-import json
+import threading
 import time
 from sqlalchemy import func
 from sqlalchemy.orm import selectinload
 
-from backend.database import get_session, create_db_and_tables, redis_client
-from backend.models import Question, ExamSession, KnowledgePoint, AIConfig, MajorChapter, AILog, Subject
+from backend.database import get_session, create_db_and_tables, redis_client, get_async_session, get_async_redis, async_engine, async_redis_client
+from sqlmodel.ext.asyncio.session import AsyncSession
+from fastapi.concurrency import run_in_threadpool
+from backend.models import Question, ExamSession, KnowledgePoint, AIConfig, MajorChapter, AILatencyRollup, Subject
 from pydantic import BaseModel
 from backend.parsers import parse_weight_table, parse_questions, parse_syllabus
 from backend.config import settings
-from backend.ai_service import generate_variant_questions
+from backend.variant_queue import enqueue_variant_generation
+from backend.question_catalog import get_catalog, invalidate_catalog
+from backend.sampling import KPWeightTable, uniform_pick_excluding
+from backend.exam_assembly import (
+    catalog_pools, personal_kp_weights, weak_kps,
+    draw_paper, paper_question_ids, personalise_paper,
+)
+from backend.paper_stock import take_stocked_paper, refill_stock
+from backend.background import PeriodicTask
+from backend.geoip import locate_ip, ensure_table as ensure_geoip_table
+from backend.exam_gate import (
+    check_start_exam, acquire_lock, load_scripts, wait_for_result, finish_generation, new_lock_token,
+    cache_key as exam_cache_key,
+    RATE_LIMITED, CACHED, LOCK_ACQUIRED, LOCK_BUSY,
+)
+from backend.answer_buffer import record_answers, merge_answers, flush_session, discard_session, flush_dirty_answers
+from backend.ai_telemetry import log_ai_call, track_llm_call, flush_ai_logs
+from backend.ai_latency import china_day, percentiles as latency_percentiles
+from backend.question_payload import get_question_payloads, invalidate_question_payloads, session_cache_entry, session_from_cache
+from backend.report_cache import get_cached_report, report_generation, store_report, serialize_report, invalidate_report, etag_matches
+from backend.serialization import FastJSONResponse, json_response, raw_json_response, dumps as json_dumps
+from backend.schemas import ExamSessionResponse, ReportResponse, DashboardStatsResponse
+from backend.mastery import get_user_kp_error_rates, record_session_results, mirror_session_results, counts_toward_mastery
+from backend.report_stream import follow_report_stream, sse_message
+from backend.report_queue import (
+    build_report_job, enqueue_report_job, process_report_job, report_status, wait_for_report,
+    STATUS_PENDING as REPORT_PENDING, STATUS_WAIT_MAX as REPORT_WAIT_MAX
+)
 from backend.auth import router as auth_router, get_current_admin, ensure_default_admin
 from backend.models import AdminUser
 
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import StreamingResponse
 
-app = FastAPI(title="Smart Assessment System - System Architect")
+app = FastAPI(title="Smart Assessment System - System Architect", default_response_class=FastJSONResponse)
 
 app.include_router(auth_router)
 
@@ -72,6 +102,13 @@ def download_report_yaml(session_id: str, db: Session = Depends(get_session)):
         }
     )
 
+# Keeps pre-drawn base papers per subject in Redis (see backend/paper_stock.py)
+paper_stock_task = PeriodicTask("paper-stock", settings.PAPER_STOCK_REFRESH_SECONDS, refill_stock)
+# Writes buffered exam answers to MySQL; drained once more on shutdown (see backend/answer_buffer.py)
+answer_flush_task = PeriodicTask("answer-flush", settings.ANSWER_FLUSH_SECONDS, flush_dirty_answers, run_on_stop=True)
+# Bulk-inserts buffered AI call telemetry (see backend/ai_telemetry.py)
+ai_log_flush_task = PeriodicTask("ai-log-flush", settings.AI_LOG_FLUSH_SECONDS, flush_ai_logs, run_on_stop=True)
+
 @app.on_event("startup")
 def on_startup():
     create_db_and_tables()
@@ -128,6 +165,25 @@ def on_startup():
         # Ensure default admin account exists
         ensure_default_admin(session)
 
+    load_scripts()
+    paper_stock_task.start()
+    answer_flush_task.start()
+    ai_log_flush_task.start()
+    # Opt-in: fetch the GeoIP table if the image/volume has none; lookups return Unknown until it is loaded
+    if settings.GEOIP_FETCH_ON_STARTUP:
+        threading.Thread(target=ensure_geoip_table, name="geoip-fetch", daemon=True).start()
+
+@app.on_event("shutdown")
+def on_shutdown():
+    paper_stock_task.stop()
+    answer_flush_task.stop()
+    ai_log_flush_task.stop()
+
+@app.on_event("shutdown")
+async def close_async_connections():
+    await async_engine.dispose()
+    await async_redis_client.aclose()
+
 # -----------------------------------------------------------------------------
 # Admin APIs
 # -----------------------------------------------------------------------------
@@ -231,6 +287,7 @@ async def upload_syllabus(
         count += 1
         
     db.commit()
+    invalidate_catalog()
     return {"message": f"Processed {count} syllabus knowledge points for Subject {subject_id}"}
 
 @app.post("/api/admin/upload/weights")
@@ -330,6 +387,7 @@ async def upload_weights(
             count += 1
     
     db.commit()
+    invalidate_catalog()
     return {"message": f"Processed knowledge points for Subject {subject_id}: Updated {updated_count}, Created {count}"}
 
 @app.post("/api/admin/upload/questions")
@@ -392,6 +450,7 @@ async def upload_questions(
         count += 1
         
     db.commit()
+    invalidate_catalog()
     return {"message": f"Uploaded {count} questions for {db_source_type} (Subject {subject_id})"}
 
 # --- CRUD APIs for Data Management ---
@@ -428,6 +487,7 @@ def update_kp(kp_id: int, data: Dict[str, Any], db: Session = Depends(get_sessio
             
     db.add(kp)
     db.commit()
+    invalidate_catalog()
     return kp
 
 @app.delete("/api/admin/knowledge_points/{kp_id}")
@@ -437,6 +497,7 @@ def delete_kp(kp_id: int, db: Session = Depends(get_session)):
         raise HTTPException(404, "KP not found")
     db.delete(kp)
     db.commit()
+    invalidate_catalog()
     return {"status": "deleted"}
 
 @app.get("/api/admin/questions")
@@ -483,6 +544,10 @@ def update_question(q_id: int, data: Dict[str, Any], db: Session = Depends(get_s
             
     db.add(q)
     db.commit()
+    # Drop the cached payload before bumping the bank version: a worker that sees the
+    # new version must not find the old payload in Redis and keep it under that version
+    invalidate_question_payloads([q_id])
+    invalidate_catalog()
     return q
 
 @app.delete("/api/admin/questions/{q_id}")
@@ -492,6 +557,9 @@ def delete_question(q_id: int, db: Session = Depends(get_session)):
         raise HTTPException(404, "Question not found")
     db.delete(q)
     db.commit()
+    # Payload first, then the version (see update_question)
+    invalidate_question_payloads([q_id])
+    invalidate_catalog()
     return {"status": "deleted"}
 
 # --- AI Config APIs ---
@@ -518,7 +586,7 @@ def update_ai_config(config: Dict[str, str], db: Session = Depends(get_session))
 # Exam APIs
 # -----------------------------------------------------------------------------
 
-@app.get("/api/exam/session/{session_id}")
+@app.get("/api/exam/session/{session_id}", response_model=ExamSessionResponse)
 def get_exam_session(
     session_id: str,
     db: Session = Depends(get_session)
@@ -550,15 +618,15 @@ def get_exam_session(
         sub = db.get(Subject, session.subject_id)
         if sub: subject_name = sub.name
 
-    return {
+    return json_response({
         "session_id": session.id,
         "subject_name": subject_name,
         "status": "resumed",
         "start_time": session.start_time.isoformat(),
         "duration_left": duration_left,
         "questions": get_questions_by_ids(db, session.question_ids),
-        "user_answers": session.user_answers or {}
-    }
+        "user_answers": merge_answers(session.id, session.user_answers)
+    })
 
 def get_user_question_history(fingerprint: str) -> List[int]:
     """Get list of question IDs recently seen by user."""
@@ -571,65 +639,6 @@ def get_user_question_history(fingerprint: str) -> List[int]:
         print(f"Redis History Fetch Error: {e}")
         return []
 
-def get_user_kp_error_rates(db: Session, fingerprint: str, subject_id: Optional[int] = None) -> Dict[int, float]:
-    """
-    Calculate error rates for each KP based on user's past sessions.
-    Returns: {kp_id: error_rate} (0.0 to 1.0)
-    """
-    # 1. Fetch user's submitted sessions
-    query = select(ExamSession).where(
-        ExamSession.user_fingerprint == fingerprint,
-        ExamSession.is_submitted == True
-    )
-    if subject_id:
-        query = query.where(ExamSession.subject_id == subject_id)
-        
-    sessions = db.exec(query.order_by(desc(ExamSession.start_time)).limit(20)).all()
-    
-    if not sessions: return {}
-    
-    # 2. Collect stats
-    kp_stats = {} # {kp_id: {total: 0, wrong: 0}}
-    
-    # We need to fetch all questions involved to know their KPs and Answers
-    # Optimization: Collect all QIDs first
-    all_qids = set()
-    for s in sessions:
-        if s.question_ids:
-            all_qids.update(s.question_ids)
-            
-    if not all_qids: return {}
-    
-    questions = db.exec(select(Question).where(Question.id.in_(all_qids))).all()
-    q_map = {q.id: q for q in questions}
-    
-    for s in sessions:
-        if not s.user_answers: continue
-        
-        for qid_int in s.question_ids:
-            q = q_map.get(qid_int)
-            if not q or not q.knowledge_point_id: continue
-            
-            qid_str = str(qid_int)
-            user_ans = s.user_answers.get(qid_str)
-            
-            if q.knowledge_point_id not in kp_stats:
-                kp_stats[q.knowledge_point_id] = {"total": 0, "wrong": 0}
-            
-            kp_stats[q.knowledge_point_id]["total"] += 1
-            
-            # Check correctness (simple match)
-            if user_ans != q.answer:
-                kp_stats[q.knowledge_point_id]["wrong"] += 1
-                
-    # 3. Calculate rates
-    rates = {}
-    for kpid, stats in kp_stats.items():
-        if stats["total"] > 0:
-            rates[kpid] = stats["wrong"] / stats["total"]
-            
-    return rates
-
 def update_user_question_history(fingerprint: str, q_ids: List[int]):
     """Push new question IDs to history and trim."""
     if not q_ids: return
@@ -652,7 +661,7 @@ class StartExamRequest(BaseModel):
     user_fingerprint: str
     subject_id: Optional[int] = 1
 
-@app.post("/api/exam/start")
+@app.post("/api/exam/start", response_model=ExamSessionResponse)
 def start_exam(
     request: Request,
     body: StartExamRequest,
@@ -688,16 +697,11 @@ def start_exam(
     # Debug Logging
     print(f"DEBUG: IP={ip}, UA={user_agent}, Device={device}")
 
-    # Rate Limiting
-    rate_key = f"rate_limit:start_exam:{ip}"
-    try:
-        current_rate = redis_client.incr(rate_key)
-        if current_rate == 1:
-            redis_client.expire(rate_key, 60)
-        if current_rate > 10:
-             raise HTTPException(429, "Too many requests. Please try again later.")
-    except Exception as e:
-        print(f"Redis Rate Limit Error: {e}")
+    # Rate limit, cached session and generation lock in one round trip (see backend/exam_gate.py)
+    lock_token = new_lock_token()
+    verdict, cached_data = check_start_exam(ip, user_fingerprint, subject_id, lock_token)
+    if verdict == RATE_LIMITED:
+        raise HTTPException(429, "Too many requests. Please try again later.")
 
     # Security: Referer Check
     referer = request.headers.get("referer")
@@ -706,33 +710,15 @@ def start_exam(
         if not any(d in referer for d in allowed_domains):
             print(f"WARNING: Suspicious Referer: {referer}")
 
-    # Location Detection
-    location = "Unknown"
-    # Check for private IP ranges (Local LAN)
-    if ip == "127.0.0.1" or ip.startswith("192.168.") or ip.startswith("10.") or (ip.startswith("172.") and 16 <= int(ip.split('.')[1]) <= 31):
-        location = "局域网 (LAN)"
-    else:
-        # Try external API for public IP
-        try:
-            import requests
-            # Use ip-api.com (free, no key, rate limited)
-            res = requests.get(f"http://ip-api.com/json/{ip}?lang=zh-CN", timeout=3)
-            if res.status_code == 200:
-                data = res.json()
-                if data.get("status") == "success":
-                    location = f"{data.get('regionName', '')} {data.get('city', '')}".strip()
-        except Exception:
-            pass # Keep as Unknown if failed
-
-
+    # Location Detection (offline range table, no network call; see backend/geoip.py)
+    location = locate_ip(ip)
 
     # 1. Check Redis Cache first (3.2.2 Session Persistence)
-    cache_key = f"exam_session:{user_fingerprint}:{subject_id}"
+    cache_key = exam_cache_key(user_fingerprint, subject_id)
     try:
-        cached_data = redis_client.get(cache_key)
-        if cached_data:
+        if verdict == CACHED:
             print(f"DEBUG: Cache Hit for {user_fingerprint}")
-            session_data = json.loads(cached_data)
+            session_data = session_from_cache(db, cached_data)
             # Recalculate duration_left based on start_time in cache (or just trust cache? Time passes...)
             # Ideally we recalculate.
             start_time = datetime.fromisoformat(session_data["start_time"])
@@ -740,12 +726,17 @@ def start_exam(
             
             if time_diff < 9000:
                 session_data["duration_left"] = int(9000 - time_diff)
-                return session_data
+                # Answers given since the payload was cached live in the answer buffer
+                session_data["user_answers"] = merge_answers(session_data["session_id"], session_data.get("user_answers"))
+                return json_response(session_data)
             else:
                 # Expired in logic even if in Redis
                 redis_client.delete(cache_key)
     except Exception as e:
         print(f"Redis Error: {e}")
+    if verdict == CACHED:
+        # Cached session was unusable, take the generation lock ourselves
+        verdict = LOCK_ACQUIRED if acquire_lock(user_fingerprint, subject_id, lock_token) else LOCK_BUSY
 
     # 2. Check active session in DB (Fallback / Long term)
     existing = db.exec(select(ExamSession).where(
@@ -772,15 +763,18 @@ def start_exam(
                 "start_time": existing.start_time.isoformat(),
                 "duration_left": int(9000 - time_diff),
                 "questions": get_questions_by_ids(db, existing.question_ids),
-                "user_answers": existing.user_answers
+                "user_answers": merge_answers(existing.id, existing.user_answers)
             }
-            # Cache it
+            # Cache it (ids + answers only, question bodies come from the payload cache)
+            payload = session_cache_entry(response_data, existing.question_ids)
             try:
-                redis_client.setex(cache_key, 1800, json.dumps(response_data))
+                redis_client.setex(cache_key, 1800, payload)
             except Exception as e:
                 print(f"Redis Set Error: {e}")
                 
-            return response_data
+            if verdict == LOCK_ACQUIRED:
+                finish_generation(user_fingerprint, subject_id, payload, lock_token)
+            return json_response(response_data)
         else:
             # Expire
             existing.is_submitted = True
@@ -789,284 +783,78 @@ def start_exam(
             
     # 3. Generate New Exam
     
-    # Lock to prevent double generation
-    lock_key = f"exam_gen_lock:{user_fingerprint}:{subject_id}"
-    if not redis_client.set(lock_key, "1", nx=True, ex=30):
-        # Already generating
+    # Lock to prevent double generation (taken by the gate above)
+    if verdict == LOCK_BUSY:
+        # Already generating: wait for the lock holder to publish the session
         print(f"DEBUG: Concurrent generation detected for {user_fingerprint}")
-        # Wait loop
-        for _ in range(10):
-            time.sleep(0.5)
-            existing = db.exec(select(ExamSession).where(
-                ExamSession.user_fingerprint == user_fingerprint,
-                ExamSession.is_submitted == False
-            )).first()
-            if existing:
-                # Return session
-                time_diff = (datetime.utcnow() - existing.start_time).total_seconds()
-                return {
-                    "session_id": existing.id,
-                    "status": "resumed",
-                    "start_time": existing.start_time.isoformat(),
-                    "duration_left": int(9000 - time_diff),
-                    "questions": get_questions_by_ids(db, existing.question_ids),
-                    "user_answers": existing.user_answers
-                }
+        payload = wait_for_result(user_fingerprint, subject_id)
+        if payload:
+            session_data = session_from_cache(db, payload)
+            time_diff = (datetime.utcnow() - datetime.fromisoformat(session_data["start_time"])).total_seconds()
+            session_data["status"] = "resumed"
+            session_data["duration_left"] = int(9000 - time_diff)
+            return json_response(session_data)
         raise HTTPException(429, "Exam generation in progress, please retry.")
 
     # Target: 75 Qs. 
-    # 30% Past (22), 50% Exercise (38), 20% AI (15)
+    # 5 Low Weight, 22 Past, 45 Exercise, AI fills the rest (see backend/exam_assembly.py)
     
-    def get_qs_query(source_type):
-        return select(Question).join(KnowledgePoint).join(MajorChapter).where(
-            MajorChapter.subject_id == subject_id,
-            Question.source_type == source_type
-        )
-
-    # We use "历年真题" and "章节练习" as source_type now, mapped from upload
-    q_past = db.exec(get_qs_query("历年真题")).all()
-    q_exercise = db.exec(get_qs_query("章节练习")).all()
-    q_ai = db.exec(get_qs_query("ai_generated")).all()
-    
-    # If no data found with Chinese types, try fallback to English types (legacy support)
-    if not q_past:
-        q_past = db.exec(get_qs_query("past_paper")).all()
-    if not q_exercise:
-        q_exercise = db.exec(get_qs_query("exercise")).all()
-    
-    # Pre-fetch KP weights for weighted sampling
-    # We fetch ID and Score, filtered by Subject via MajorChapter
-    kps = db.exec(select(KnowledgePoint.id, KnowledgePoint.weight_score)
-                  .join(MajorChapter)
-                  .where(MajorChapter.subject_id == subject_id)).all()
+    # Candidate pools come from the worker's in-memory catalog (ids + KP weights only)
+    catalog = get_catalog(db, subject_id)
+    pools = catalog_pools(catalog)
+    
+    # KP weights for weighted sampling, filtered by Subject via MajorChapter
+    kps = catalog.kp_scores
     # Optimization 1: User Error Rate Weighting
     user_error_rates = get_user_kp_error_rates(db, user_fingerprint, subject_id)
-    
-    kp_weights = {}
-    for kp_id, score in kps:
-        base_weight = score if score and score > 0 else 1
-        # Apply Error Rate Factor: W_final = W_global * (1 + 2.0 * ErrorRate)
-        error_rate = user_error_rates.get(kp_id, 0.0)
-        kp_weights[kp_id] = base_weight * (1.0 + 2.0 * error_rate)
+    weight_table = KPWeightTable(personal_kp_weights(kps, user_error_rates))
 
     # Optimization 2: Sliding Window Deduplication
     user_history = get_user_question_history(user_fingerprint)
     
-    # Weight-based selection helper
-    def weighted_sample(questions, k, exclude_ids=None):
-        if not questions: return []
-        
-        # Filter exclusions
-        candidates = questions
-        if exclude_ids:
-             candidates = [q for q in questions if q.id not in exclude_ids]
-             
-        # Fallback if candidates not enough (backfill from excluded if needed, oldest first logic implied by random if we just ignore exclusion)
-        # But simple fallback: if not enough candidates, use full list
-        if len(candidates) < k:
-            candidates = questions # Reset filter
-        
-        if len(candidates) <= k: return candidates
-        
-        # Efraimidis-Spirakis algorithm
-        scored_items = []
-        for q in candidates:
-            w = kp_weights.get(q.knowledge_point_id, 1) 
-            if w <= 0: w = 1
-            
-            r = random.random()
-            if r == 0: r = 1e-10
-            
-            score = r ** (1.0 / w)
-            scored_items.append((score, q))
-            
-        scored_items.sort(key=lambda x: x[0], reverse=True)
-        return [item[1] for item in scored_items[:k]]
-
-    selected = []
-    
-    # 1. Select 5 "Low Weight" questions (General/Cold/Not Syllabus)
-    # Fetch candidate questions via join, filtered by Subject
-    q_low_weight = db.exec(select(Question).join(KnowledgePoint).join(MajorChapter).where(
-        MajorChapter.subject_id == subject_id,
-        KnowledgePoint.weight_level.in_(["一般", "冷门", "非考纲要求"])
-    )).all()
-    
-    # Filter History for Low Weight too
-    low_weight_candidates = [q for q in q_low_weight if q.id not in user_history]
-    if len(low_weight_candidates) < 5: low_weight_candidates = q_low_weight
-    
-    low_weight_picks = []
-    if low_weight_candidates:
-        count_low = min(len(low_weight_candidates), 5)
-        low_weight_picks = random.sample(low_weight_candidates, count_low)
-        selected.extend(low_weight_picks)
-        
-    # Remove picked low weight questions from pools to avoid duplicates
-    picked_ids = {q.id for q in low_weight_picks}
-    q_past = [q for q in q_past if q.id not in picked_ids]
-    q_exercise = [q for q in q_exercise if q.id not in picked_ids]
-    
-    # 2. Fill remaining slots
-    # Target: 22 Past, 45 Exercise
-    selected.extend(weighted_sample(q_past, 22, exclude_ids=user_history))
-    selected.extend(weighted_sample(q_exercise, 45, exclude_ids=user_history))
-    
-    # Fill AI quota
-    needed_ai = 75 - len(selected)
-    
-    # Optimization 3: Error-Driven AI Generation (Sync with Timeout)
+    # Optimization 3: Error-Driven AI Generation (queued, see backend/variant_queue.py)
     # Identify Target KPs: Top 3 Weakest KPs (Error Rate > 0.4)
-    # Sort error rates
-    sorted_errors = sorted(user_error_rates.items(), key=lambda x: x[1], reverse=True)
-    target_kps = [kpid for kpid, rate in sorted_errors if rate >= 0.4][:3]
+    weak_kp_ids = weak_kps(user_error_rates)
+    target_kps = list(weak_kp_ids)
     
     # If no weak KPs (New User), pick top weighted KPs
     if not target_kps:
         sorted_weights = sorted(kps, key=lambda x: x[1] if x[1] else 0, reverse=True)
         target_kps = [x[0] for x in sorted_weights[:3]]
         
-    # Check if we need to generate for these KPs
-    # Filter q_ai by target_kps and check count
-    # Since q_ai list is all AI questions, we filter in memory
-    
-    # Group q_ai by KP
-    ai_by_kp = {}
-    for q in q_ai:
-        if q.knowledge_point_id:
-            ai_by_kp.setdefault(q.knowledge_point_id, []).append(q)
-            
-    # For each target KP, if we have < 1 AI questions, generate 1
-    # Optimize: Collect all seeds first and do ONE AI call
-    all_seeds_data = []
-    
-    for kpid in target_kps:
-        existing_ai_count = len(ai_by_kp.get(kpid, []))
-        if existing_ai_count < 1:
-            # Need to generate
-            # Find seed questions for this KP (from Past/Exercise)
-            # Fetch 1 seed
-            seeds = db.exec(select(Question).where(
-                Question.knowledge_point_id == kpid,
-                Question.source_type.in_(["历年真题", "章节练习", "past_paper", "exercise"])
-            ).limit(1)).all()
-            
-            if seeds:
-                for q in seeds:
-                    kp_name = q.knowledge_point.name if q.knowledge_point else "Unknown"
-                    all_seeds_data.append({
-                        "id": q.id, 
-                        "content": q.content, 
-                        "options": q.options, 
-                        "answer": q.answer, 
-                        "explanation": q.explanation,
-                        "knowledge_point": kp_name,
-                        "kp_id": kpid # Pass KP ID to map back later
-                    })
-        else:
-            print(f"DEBUG: Skipping AI generation for KP {kpid}, enough questions ({existing_ai_count}) exist.")
-
-    if all_seeds_data:
-        try:
-            # Fetch API Key
-            if settings.AI_PROVIDER == "qwen":
-                api_conf = db.exec(select(AIConfig).where(AIConfig.config_key == "qwen_api_key")).first()
-                api_key = api_conf.value if api_conf else settings.QWEN_API_KEY
-            else:
-                api_conf = db.exec(select(AIConfig).where(AIConfig.config_key == "gemini_api_key")).first()
-                api_key = api_conf.value if api_conf else settings.GEMINI_API_KEY
-
-            # Get Subject Name for Prompt
-            subject_obj = db.get(Subject, subject_id)
-            subject_name = subject_obj.name if subject_obj else "系统架构设计师"
-
-            start_ts = time.time()
-            
-            # Batch generate: Pass all seeds at once (No batching needed for small N=3)
-            generated_all = generate_variant_questions(all_seeds_data, 1, api_key=api_key, subject_name=subject_name)
-            
-            duration = time.time() - start_ts
-            db.add(AILog(call_type="smart_paper", status="success", response_time=duration))
-            
-            # Save
-            new_qs = []
-            
-            # Helper to find original KP ID from generated item (based_on_id)
-            seed_kp_map = {str(item["id"]): item["kp_id"] for item in all_seeds_data}
-            
-            for item in generated_all:
-                # Basic validation
-                raw_content = item.get("content", "")
-                if not raw_content: continue
-                
-                content = str(raw_content).strip()
-                if len(content) < 5 or "xxx" in content.lower(): continue
-                
-                if not item.get("options") or not item.get("answer"): continue
-                
-                opts = item.get("options", [])
-                if not isinstance(opts, list) or len(opts) < 2: continue
-                
-                # Retrieve KP ID
-                base_id = str(item.get('based_on_id', ''))
-                kp_id_gen = seed_kp_map.get(base_id)
-                
-                if not kp_id_gen: continue # Should not happen if AI returns based_on_id correctly
-                
-                # Ensure options list
-                if isinstance(opts, str):
-                    try: opts = json.loads(opts)
-                    except: pass
-
-                q = Question(
-                    content=item["content"],
-                    options=opts,
-                    answer=item["answer"],
-                    explanation=item.get("explanation", "AI Generated"),
-                    source_type="ai_generated",
-                    knowledge_point_id=kp_id_gen,
-                    source_detail=f"Error-Driven Variant of {base_id}"
-                )
-                db.add(q)
-                new_qs.append(q)
-            
-            db.commit()
-            for q in new_qs: db.refresh(q)
-            q_ai.extend(new_qs)
-            
-        except Exception as e:
-            print(f"Error-Driven AI Generation Failed: {e}")
-
-    # Now select AI questions
-    selected.extend(weighted_sample(q_ai, needed_ai, exclude_ids=user_history))
+    # Target KPs without any AI question get variants generated by the worker;
+    # this paper is filled from the existing bank and never waits on the LLM
+    missing_ai_kps = [kpid for kpid in target_kps if not (pools["ai"].kp_ids == kpid).any()]
+    if missing_ai_kps:
+        queued = enqueue_variant_generation(subject_id, missing_ai_kps)
+        print(f"DEBUG: Queued AI variant generation for KPs {queued} (missing: {missing_ai_kps})")
+
+    # Draw the paper: personalise a stocked base paper if one is available,
+    # otherwise assemble cold with the user's weights
+    stocked = take_stocked_paper(subject_id, catalog.version)
+    if stocked:
+        print(f"DEBUG: Using stocked paper for subject {subject_id}")
+        selected = personalise_paper(stocked, pools, weight_table, exclude_ids=user_history, swap_kps=weak_kp_ids)
+    else:
+        selected = paper_question_ids(draw_paper(pools, weight_table, exclude_ids=user_history))
         
     # Final check and backfill
     if len(selected) < 75:
         needed_backfill = 75 - len(selected)
         print(f"DEBUG: Insufficient questions ({len(selected)}), backfilling {needed_backfill}...")
         
-        # Collect all used IDs
-        used_ids = {q.id for q in selected}
+        # Uniform draw from the subject's own questions (catalog arrays, no DB query)
+        backfill_picks = uniform_pick_excluding(catalog.all_questions, needed_backfill, exclude_ids=selected)
         
-        # Try to fetch from database excluding already selected ones
-        # We fetch extra to ensure randomness
-        backfill_candidates = db.exec(select(Question).where(Question.id.not_in(used_ids)).limit(needed_backfill * 5)).all()
-        
-        if backfill_candidates:
-            # If we have enough, sample
-            if len(backfill_candidates) >= needed_backfill:
-                backfill_picks = random.sample(backfill_candidates, needed_backfill)
-            else:
-                backfill_picks = backfill_candidates
-                
-            selected.extend(backfill_picks)
+        if len(backfill_picks):
+            selected.extend(int(x) for x in backfill_picks.ids)
             print(f"DEBUG: Backfilled {len(backfill_picks)} questions.")
         else:
-            print("DEBUG: No more questions available in DB to backfill.")
+            print("DEBUG: No more questions available in subject to backfill.")
         
     # Shuffle final list
     random.shuffle(selected)
-    q_ids = [q.id for q in selected]
+    q_ids = selected
     
     session = ExamSession(
         user_fingerprint=user_fingerprint,
@@ -1089,33 +877,19 @@ def start_exam(
         "user_answers": {}
     }
     
-    # Cache to Redis
+    # Cache to Redis (ids + answers only)
+    payload = session_cache_entry(response_data, q_ids)
     try:
-        redis_client.setex(cache_key, 1800, json.dumps(response_data))
+        redis_client.setex(cache_key, 1800, payload)
     except Exception as e:
         print(f"Redis Set Error: {e}")
     
-    redis_client.delete(lock_key)
-    return response_data
+    finish_generation(user_fingerprint, subject_id, payload, lock_token)
+    return json_response(response_data)
 
 def get_questions_by_ids(db: Session, ids: List[int]):
-    # Maintain order?
-    qs = db.exec(select(Question).where(Question.id.in_(ids))).all()
-    q_map = {q.id: q for q in qs}
-    result = []
-    for i, qid in enumerate(ids):
-        q = q_map.get(qid)
-        if q:
-            # Hide answer/explanation for exam
-            result.append({
-                "id": q.id,
-                "index": i + 1,
-                "content": q.content,
-                "options": q.options,
-                "type": "single", # Single choice
-                "user_answer": None
-            })
-    return result
+    # Exam view (answer/explanation hidden), served from the shared payload cache
+    return get_question_payloads(db, ids)
 
 @app.post("/api/exam/sync")
 def sync_answers(
@@ -1123,28 +897,24 @@ def sync_answers(
     answers: Dict[str, str] = Body(...),
     db: Session = Depends(get_session)
 ):
-    session = db.get(ExamSession, session_id)
-    if not session:
-        raise HTTPException(404, "Session not found")
-        
-    session.user_answers = answers
-    db.add(session)
-    db.commit()
-    
-    # Update Redis Cache
-    try:
-        cache_key = f"exam_session:{session.user_fingerprint}"
-        cached_data = redis_client.get(cache_key)
-        if cached_data:
-            data = json.loads(cached_data)
-            data["user_answers"] = answers
-            redis_client.setex(cache_key, 1800, json.dumps(data))
-    except Exception as e:
-        print(f"Redis Update Error: {e}")
-        
+    # Buffered in Redis, written to MySQL by the answer flusher
+    record_answers(db, session_id, answers)
     return {"status": "synced"}
 
-from backend.ai_service import generate_report, generate_share_content
+@app.post("/api/exam/answer")
+def save_answer(
+    session_id: str = Body(...),
+    question_id: int = Body(...),
+    answer: str = Body(...),
+    db: Session = Depends(get_session)
+):
+    """Record a single answer (buffered, see backend/answer_buffer.py)."""
+    record_answers(db, session_id, {str(question_id): answer})
+    return {"status": "saved"}
+
+from backend.ai_service import build_share_prompt, call_llm, get_api_keys
+from backend.llm_router import can_route
+from backend.share_cache import pick_cached_share, store_share_variant
 
 @app.post("/api/exam/submit")
 def submit_exam(
@@ -1158,6 +928,9 @@ def submit_exam(
     if session.is_submitted:
         return session.ai_report or {"error": "Already submitted but no report"}
 
+    # Write any buffered answers before grading
+    flush_session(db, session)
+
     # Grade
     questions = db.exec(select(Question).where(Question.id.in_(session.question_ids))).all()
     q_map = {q.id: q for q in questions}
@@ -1232,69 +1005,39 @@ def submit_exam(
     duration_seconds = (final_end_time - session.start_time).total_seconds()
     duration_minutes = int(duration_seconds / 60)
     
-    # Generate AI Report
-    # Get Prompt from DB
-    prompt_conf = db.exec(select(AIConfig).where(AIConfig.config_key == "prompt_report")).first()
-    prompt_template = prompt_conf.value if prompt_conf else settings.DEFAULT_PROMPT_REPORT
-    
-    # Get API Key
-    if settings.AI_PROVIDER == "qwen":
-        api_conf = db.exec(select(AIConfig).where(AIConfig.config_key == "qwen_api_key")).first()
-        api_key = api_conf.value if api_conf else settings.QWEN_API_KEY
-    else:
-        api_conf = db.exec(select(AIConfig).where(AIConfig.config_key == "gemini_api_key")).first()
-        api_key = api_conf.value if api_conf else settings.GEMINI_API_KEY
-    
-    # Run AI Generation
-    # We run it synchronously here for simplicity, but for production use BackgroundTasks
-    # IMPORTANT: Do not modify session object before this to avoid holding DB locks during slow AI call (due to autoflush)
-    try:
-        # Fetch historical rates for context
-        history_rates = get_user_kp_error_rates(db, session.user_fingerprint)
-        
-        # Get subject name
-        subject_name = "系统架构设计师"
-        if session.subject_id:
-             sub_obj = db.get(Subject, session.subject_id)
-             if sub_obj: subject_name = sub_obj.name
-
-        start_ts = time.time()
-        report = generate_report(final_score, kp_stats, prompt_template, api_key=api_key, duration_minutes=duration_minutes, history_rates=history_rates, subject_name=subject_name)
-        duration = time.time() - start_ts
-        db.add(AILog(call_type="report", status="success", response_time=duration))
-        
-        # Fallback if AI fails
-        if "error" in report:
-            print(f"AI Generation Failed: {report['error']}")
-            # We already logged success for the API call itself (it returned), but the content might be error.
-            # Actually if it returns a dict with error, it technically succeeded in calling, but failed in content.
-            # Let's count it as success in invocation, but maybe we want to know.
-            # For now, keep it simple.
-            report = generate_ai_report_mock(final_score, kp_stats, db, subject_id=session.subject_id)
-        else:
-            # Inject radar data if AI succeeded
-            report["radar_data"] = calculate_radar_data(kp_stats, db, subject_id=session.subject_id)
-    except Exception as e:
-        duration = time.time() - start_ts
-        db.add(AILog(call_type="report", status="failure", response_time=duration, error_message=str(e)))
-        print(f"AI Service Exception: {e}")
-        report = generate_ai_report_mock(final_score, kp_stats, db, subject_id=session.subject_id)
+    # Preliminary report (score, radar, rule-based analysis); the AI version is
+    # generated by the worker, see backend/report_queue.py
+    history_rates = get_user_kp_error_rates(db, session.user_fingerprint, session.subject_id)
+    report = generate_ai_report_mock(final_score, kp_stats, db, subject_id=session.subject_id)
 
     # Inject basic stats (accuracy, duration)
     report["score"] = final_score
     report["accuracy"] = int((final_score / 75) * 100)
     report["duration_minutes"] = duration_minutes
     report["total_questions"] = 75
+    report["report_status"] = REPORT_PENDING
 
     # Update Session - Now safe to acquire lock
     session.score = final_score
     session.is_submitted = True
     session.end_time = final_end_time
     session.ai_report = report
-    session.ai_report_generated = True
+    session.ai_report_generated = False
     
     db.add(session)
+    # Add this session to the user's per-KP mastery counts in the same transaction
+    # (unanswered sessions are left out, the same rule the mastery backfill applies)
+    mastery_stats = kp_stats if counts_toward_mastery(session.user_answers) else {}
+    record_session_results(db, session.user_fingerprint, session.subject_id, mastery_stats)
     db.commit()
+    mirror_session_results(session.user_fingerprint, session.subject_id, mastery_stats)
+    discard_session(session.id)
+    invalidate_report(session.id)
+
+    job = build_report_job(session, kp_stats, duration_minutes, history_rates)
+    if not enqueue_report_job(job):
+        # No queue: generate inline as before
+        report = process_report_job(db, job) or report
     
     # Clear Redis Cache (3.2.2)
     try:
@@ -1314,6 +1057,8 @@ def get_share_content(
     session = db.get(ExamSession, session_id)
     if not session or not session.ai_report:
         raise HTTPException(404, "Report not found")
+    if report_status(session.ai_report) == REPORT_PENDING:
+        raise HTTPException(409, "Report is still being generated")
         
     # Increment share count
     session.share_count += 1
@@ -1334,8 +1079,11 @@ def get_share_content(
     
     # Check if share content already exists
     if session.ai_report and "share_content" in session.ai_report:
+        db.commit() # Share count
         return session.ai_report["share_content"]
     
+    start_ts = time.time()
+    usage = None
     try:
         # Get subject name
         subject_name = "系统架构设计师"
@@ -1343,10 +1091,23 @@ def get_share_content(
              sub_obj = db.get(Subject, session.subject_id)
              if sub_obj: subject_name = sub_obj.name
 
-        start_ts = time.time()
-        share_content = generate_share_content(session.ai_report, prompt_template, api_key=api_key, subject_name=subject_name)
-        duration = time.time() - start_ts
-        db.add(AILog(call_type="social_analysis", status="success", response_time=duration))
+        # Same level/score/percentile/strengths/subject -> reuse cached copy (backend/share_cache.py)
+        share_prompt = build_share_prompt(session.ai_report, prompt_template, subject_name=subject_name)
+        share_content = pick_cached_share(share_prompt)
+        if share_content is not None:
+            log_ai_call("social_analysis", "success", time.time() - start_ts, cache_hit=True)
+        else:
+            api_keys = get_api_keys(db)
+            if not api_key and not can_route(api_keys):
+                raise Exception(f"{settings.AI_PROVIDER} API Key not configured")
+            with track_llm_call() as usage:
+                share_content = call_llm(share_prompt, api_key=api_key, api_keys=api_keys)
+            # Never keep a provider error as the session's share copy
+            if "error" in share_content:
+                raise Exception(share_content["error"])
+            duration = time.time() - start_ts
+            log_ai_call("social_analysis", "success", duration, usage=usage)
+            store_share_variant(share_prompt, share_content)
         
         # Save generated content to session
         session.ai_report["share_content"] = share_content
@@ -1355,12 +1116,13 @@ def get_share_content(
         flag_modified(session, "ai_report")
         db.add(session)
         
-        db.commit() # Commit logs and session update
+        db.commit() # Commit share count and session update
+        invalidate_report(session.id)
         return share_content
     except Exception as e:
         duration = time.time() - start_ts
-        db.add(AILog(call_type="social_analysis", status="failure", response_time=duration, error_message=str(e)))
-        db.commit()
+        log_ai_call("social_analysis", "failure", duration, error_message=str(e), usage=usage)
+        db.commit() # Share count
         raise HTTPException(500, f"AI generation failed: {str(e)}")
 
 def calculate_radar_data(kp_stats, db, subject_id: int = 1):
@@ -1472,8 +1234,8 @@ def generate_ai_report_mock(score, kp_stats, db, subject_id: int = 1):
 from fastapi.responses import Response
 
 @app.get("/api/exam/report/{session_id}/pdf")
-async def get_report_pdf(session_id: str, db: Session = Depends(get_session)):
-    session = db.get(ExamSession, session_id)
+async def get_report_pdf(session_id: str, db: AsyncSession = Depends(get_async_session)):
+    session = await db.get(ExamSession, session_id)
     if not session:
         raise HTTPException(404, "Session not found")
         
@@ -1494,10 +1256,11 @@ async def get_report_pdf(session_id: str, db: Session = Depends(get_session)):
     # Get subject name
     subject_name = "系统架构设计师"
     if session.subject_id:
-        sub_obj = db.get(Subject, session.subject_id)
+        sub_obj = await db.get(Subject, session.subject_id)
         if sub_obj: subject_name = sub_obj.name
 
-    pdf_bytes = create_pdf_report({"ai_report": session.ai_report}, session_id, subject_name=subject_name)
+    # PDF rendering is CPU-bound, keep it off the event loop
+    pdf_bytes = await run_in_threadpool(create_pdf_report, {"ai_report": session.ai_report}, session_id, subject_name=subject_name)
     
     return Response(
         content=pdf_bytes,
@@ -1507,8 +1270,87 @@ async def get_report_pdf(session_id: str, db: Session = Depends(get_session)):
         }
     )
 
-@app.get("/api/exam/report/{session_id}")
-def get_report(session_id: str, db: Session = Depends(get_session)):
+@app.get("/api/exam/report/{session_id}", response_model=ReportResponse)
+def get_report(session_id: str, request: Request, db: Session = Depends(get_session)):
+    # Assembled once per session and served by ETag (see backend/report_cache.py)
+    cached = get_cached_report(session_id)
+    if cached:
+        body, etag = cached
+    else:
+        # Read the generation before the DB so a concurrent invalidate_report() wins
+        generation = report_generation(session_id)
+        payload = build_report_payload(db, session_id)
+        body, etag = serialize_report(payload)
+        # A pending report is about to be replaced by the worker; don't cache it
+        if report_status(payload["ai_report"]) != REPORT_PENDING:
+            store_report(session_id, body, etag, generation)
+
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@app.get("/api/exam/report/{session_id}/status")
+async def get_report_status(
+    session_id: str,
+    wait: int = Query(0, ge=0, le=REPORT_WAIT_MAX),
+    db: AsyncSession = Depends(get_async_session),
+    rds = Depends(get_async_redis)
+):
+    """
+    AI report status of a submitted session: "pending" or "ready".
+    With `wait`, long-polls up to that many seconds for the worker to finish.
+    """
+    status = await _current_report_status(db, session_id)
+    if status == REPORT_PENDING and wait:
+        async def is_ready() -> bool:
+            return await _current_report_status(db, session_id) != REPORT_PENDING
+        if await wait_for_report(rds, session_id, is_ready, wait):
+            status = await _current_report_status(db, session_id)
+    return {"status": status}
+
+@app.get("/api/exam/report/{session_id}/stream")
+async def stream_report_progress(
+    session_id: str,
+    request: Request,
+    db: AsyncSession = Depends(get_async_session),
+    rds = Depends(get_async_redis)
+):
+    """
+    Server-sent events while the AI report is generated: `delta` (raw text),
+    `section` (a completed top-level report field) and `done`. See backend/report_stream.py.
+    """
+    status = await _current_report_status(db, session_id)
+
+    async def is_ready() -> bool:
+        return await _current_report_status(db, session_id) != REPORT_PENDING
+
+    async def events():
+        if status != REPORT_PENDING:
+            yield sse_message("done", json_dumps({"status": status}))
+            return
+        # Browsers resend the last seen id when EventSource reconnects
+        last_id = request.headers.get("last-event-id") or "0"
+        async for message in follow_report_stream(rds, session_id, last_id, is_ready, request.is_disconnected):
+            yield message
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        # Keep nginx from buffering the stream
+        "X-Accel-Buffering": "no",
+    })
+
+async def _current_report_status(db: AsyncSession, session_id: str) -> str:
+    # Called repeatedly on one session while waiting for the worker: end the
+    # transaction first so each read gets a fresh snapshot (MySQL REPEATABLE READ
+    # would otherwise keep returning the first one)
+    await db.rollback()
+    report = (await db.exec(select(ExamSession.ai_report).where(ExamSession.id == session_id))).first()
+    if not report:
+        raise HTTPException(404, "Report not found")
+    return report_status(report)
+
+def build_report_payload(db: Session, session_id: str) -> Dict[str, Any]:
     session = db.get(ExamSession, session_id)
     if not session or not session.ai_report:
         raise HTTPException(404, "Report not found")
@@ -1610,7 +1452,7 @@ def get_material_stats(subject_id: Optional[int] = None, db: Session = Depends(g
     cache_key = f"material_stats:{subject_id}" if subject_id else "material_stats:all"
     cached = redis_client.get(cache_key)
     if cached:
-        return json.loads(cached)
+        return raw_json_response(cached)
 
     # Base queries
     q_query = select(func.count(Question.id))
@@ -1669,20 +1511,49 @@ def get_material_stats(subject_id: Optional[int] = None, db: Session = Depends(g
     }
     
     # Cache for 1 hour (Material stats change infrequently)
-    redis_client.setex(cache_key, 3600, json.dumps(result))
+    redis_client.setex(cache_key, 3600, json_dumps(result))
     
     return result
 
 
-@app.get("/api/dashboard/stats")
-async def get_dashboard_stats(db: Session = Depends(get_session), admin: AdminUser = Depends(get_current_admin)):
+@app.get("/api/dashboard/stats", response_model=DashboardStatsResponse)
+async def get_dashboard_stats(db: AsyncSession = Depends(get_async_session), rds = Depends(get_async_redis), admin: AdminUser = Depends(get_current_admin)):
     # Try cache
     cache_key = "dashboard_stats"
-    cached = redis_client.get(cache_key)
+    cached = await rds.get(cache_key)
     if cached:
-        return json.loads(cached)
+        return raw_json_response(cached)
+
+    # Only the columns the stats use (skips the JSON question/answer/report columns)
+    sessions = (await db.exec(select(
+        ExamSession.user_fingerprint, ExamSession.start_time, ExamSession.end_time, ExamSession.score,
+        ExamSession.device_info, ExamSession.location, ExamSession.pdf_download_count, ExamSession.share_count,
+    ))).all()
+    kps = (await db.exec(select(KnowledgePoint.id, KnowledgePoint.weight_level))).all()
+    # AI stats come from the latency rollups (backend/ai_latency.py): a bounded number of
+    # grouped rows however long the AILog history is
+    rollup_cols = (AILatencyRollup.call_type, AILatencyRollup.status, AILatencyRollup.cache_hit, AILatencyRollup.bucket)
+    sums = (func.sum(AILatencyRollup.count), func.sum(AILatencyRollup.sum_seconds))
+    ai_totals = (await db.exec(
+        select(AILatencyRollup.call_type, AILatencyRollup.provider, *rollup_cols[1:], *sums)
+        .group_by(AILatencyRollup.call_type, AILatencyRollup.provider, *rollup_cols[1:])
+    )).all()
+    ai_daily = (await db.exec(
+        select(AILatencyRollup.day, *rollup_cols, *sums)
+        .where(AILatencyRollup.day >= china_day(datetime.utcnow() - timedelta(days=6)))
+        .group_by(AILatencyRollup.day, *rollup_cols)
+    )).all()
 
-    sessions = db.exec(select(ExamSession)).all()
+    # Aggregation is pure CPU work over every row, run it in the threadpool
+    body = await run_in_threadpool(build_dashboard_stats, sessions, kps, ai_totals, ai_daily)
+    
+    # Cache for 5 minutes (stored serialized, so hits are returned as-is)
+    await rds.setex(cache_key, 300, body)
+    
+    return raw_json_response(body)
+
+def build_dashboard_stats(sessions, kps, ai_totals, ai_daily) -> str:
+    """Aggregate dashboard stats from session/KP rows and AI latency rollups. Returns the serialized payload."""
     
     # --- 1. User Stats (New Users, PDF Downloads, Shares, Trends, Distributions) ---
     unique_users = set(s.user_fingerprint for s in sessions)
@@ -1789,7 +1660,6 @@ async def get_dashboard_stats(db: Session = Depends(get_session), admin: AdminUs
     # We need to query KnowledgePoints and aggregate by weight_level
     # weight_level: "核心", "重要", "一般", "冷门" (default)
     
-    kps = db.exec(select(KnowledgePoint)).all()
     weight_dist = {
         "核心": {"count": 0, "name": "核心考点"},
         "重要": {"count": 0, "name": "重要考点"},
@@ -1863,9 +1733,10 @@ async def get_dashboard_stats(db: Session = Depends(get_session), admin: AdminUs
     duration_list = [{"name": k, "value": v} for k,v in duration_dist.items()]
 
     # --- 4. AI Stats & Trends ---
-    # We need to query AILog
+    # From the latency rollups (backend/ai_latency.py) instead of AILog rows:
+    # (call_type, provider, status, cache_hit, bucket, count, sum_seconds), plus day for the trends
     # Call types: "smart_paper" (assembly), "report" (report), "social_analysis" (social)
-    logs = db.exec(select(AILog)).all()
+    type_names = {"smart_paper": "assembly", "report": "report", "social_analysis": "social"}
     
     ai_stats = {
         "assembly": 0,
@@ -1877,14 +1748,45 @@ async def get_dashboard_stats(db: Session = Depends(get_session), admin: AdminUs
             "assembly": 0.0,
             "report": 0.0,
             "social": 0.0
-        }
+        },
+        # p50/p90/p99 per call type, overall and per provider
+        "latency_percentiles": {},
+        "latency_by_provider": {},
+        # AI report cache (backend/report_gen_cache.py); saved_seconds = hits * avg LLM report latency
+        "report_cache": {"hits": 0, "misses": 0, "hit_ratio": 0.0, "saved_seconds": 0.0}
     }
     
     # Latency Accumulators for Global Stats
     latency_sums = {"smart_paper": 0.0, "report": 0.0, "social_analysis": 0.0}
     latency_counts = {"smart_paper": 0, "report": 0, "social_analysis": 0}
+    histograms = {ctype: {} for ctype in type_names}
+    provider_histograms = {}
 
-    # Trends: Date -> {assembly: 0, report: 0, social: 0, success: 0, failure: 0, latency_sums: {}, latency_counts: {}}
+    for call_type, provider, status, cache_hit, bucket, count, total in ai_totals:
+        # 1. Global Counts
+        if call_type in type_names: ai_stats[type_names[call_type]] += count
+        
+        if status == "success":
+            ai_stats["success"] += count
+        else:
+            ai_stats["failure"] += count
+
+        if call_type == "report":
+            if cache_hit:
+                ai_stats["report_cache"]["hits"] += count
+            else:
+                ai_stats["report_cache"]["misses"] += count
+            
+        # Global Latency Accumulation (LLM calls only, cache hits would hide provider latency)
+        if not cache_hit and call_type in latency_sums:
+            latency_sums[call_type] += total
+            latency_counts[call_type] += count
+            histograms[call_type][bucket] = histograms[call_type].get(bucket, 0) + count
+            if provider:
+                hist = provider_histograms.setdefault(provider, {}).setdefault(call_type, {})
+                hist[bucket] = hist.get(bucket, 0) + count
+
+    # Trends: Date -> {assembly: 0, report: 0, social: 0, success: 0, failure: 0, latency_sums: {}, latency_counts: {}, histograms: {}}
     # Last 7 days
     china_now = datetime.utcnow() + timedelta(hours=8)
     dates = [(china_now - timedelta(days=i)).strftime("%Y-%m-%d") for i in range(6, -1, -1)]
@@ -1894,52 +1796,32 @@ async def get_dashboard_stats(db: Session = Depends(get_session), admin: AdminUs
     for d in dates:
         ai_trends[d] = {
             "assembly": 0, "report": 0, "social": 0,
-            "success": 0, "failure": 0,
+            "success": 0, "failure": 0, "report_cache_hits": 0,
             "latency_sums": {"smart_paper": 0.0, "report": 0.0, "social_analysis": 0.0},
-            "latency_counts": {"smart_paper": 0, "report": 0, "social_analysis": 0}
+            "latency_counts": {"smart_paper": 0, "report": 0, "social_analysis": 0},
+            "histograms": {ctype: {} for ctype in type_names}
         }
     
-    for log in logs:
-        # 1. Global Counts
-        if log.call_type == "smart_paper": ai_stats["assembly"] += 1
-        elif log.call_type == "report": ai_stats["report"] += 1
-        elif log.call_type == "social_analysis": ai_stats["social"] += 1
+    for d_str, call_type, status, cache_hit, bucket, count, total in ai_daily:
+        if d_str not in ai_trends:
+            continue
+        day = ai_trends[d_str]
+        # Type Counts
+        if call_type in type_names: day[type_names[call_type]] += count
         
-        if log.status == "success":
-            ai_stats["success"] += 1
+        # Status Counts
+        if status == "success":
+            day["success"] += count
         else:
-            ai_stats["failure"] += 1
-            
-        # Global Latency Accumulation
-        if log.response_time and log.response_time > 0:
-            ctype = log.call_type
-            if ctype in latency_sums:
-                latency_sums[ctype] += log.response_time
-                latency_counts[ctype] += 1
-
-        # 2. Trend Data
-        # Convert timestamp to China Time
-        log_time = log.timestamp + timedelta(hours=8)
-        d_str = log_time.strftime("%Y-%m-%d")
-        
-        if d_str in ai_trends:
-            # Type Counts
-            if log.call_type == "smart_paper": ai_trends[d_str]["assembly"] += 1
-            elif log.call_type == "report": ai_trends[d_str]["report"] += 1
-            elif log.call_type == "social_analysis": ai_trends[d_str]["social"] += 1
+            day["failure"] += count
+        if cache_hit and call_type == "report":
+            day["report_cache_hits"] += count
             
-            # Status Counts
-            if log.status == "success":
-                ai_trends[d_str]["success"] += 1
-            else:
-                ai_trends[d_str]["failure"] += 1
-                
-            # Latency Accumulation
-            if log.response_time and log.response_time > 0:
-                ctype = log.call_type
-                if ctype in ai_trends[d_str]["latency_sums"]:
-                    ai_trends[d_str]["latency_sums"][ctype] += log.response_time
-                    ai_trends[d_str]["latency_counts"][ctype] += 1
+        # Latency Accumulation
+        if not cache_hit and call_type in day["latency_sums"]:
+            day["latency_sums"][call_type] += total
+            day["latency_counts"][call_type] += count
+            day["histograms"][call_type][bucket] = day["histograms"][call_type].get(bucket, 0) + count
             
     # Calculate Global Averages
     if latency_counts["smart_paper"] > 0:
@@ -1948,6 +1830,17 @@ async def get_dashboard_stats(db: Session = Depends(get_session), admin: AdminUs
         ai_stats["avg_latency"]["report"] = round(latency_sums["report"] / latency_counts["report"], 2)
     if latency_counts["social_analysis"] > 0:
         ai_stats["avg_latency"]["social"] = round(latency_sums["social_analysis"] / latency_counts["social_analysis"], 2)
+
+    ai_stats["latency_percentiles"] = {name: latency_percentiles(histograms[ctype]) for ctype, name in type_names.items()}
+    ai_stats["latency_by_provider"] = {
+        provider: {type_names[ctype]: latency_percentiles(hist) for ctype, hist in by_type.items()}
+        for provider, by_type in sorted(provider_histograms.items())
+    }
+
+    cache_stats = ai_stats["report_cache"]
+    if cache_stats["hits"] + cache_stats["misses"] > 0:
+        cache_stats["hit_ratio"] = round(cache_stats["hits"] / (cache_stats["hits"] + cache_stats["misses"]), 4)
+    cache_stats["saved_seconds"] = round(cache_stats["hits"] * ai_stats["avg_latency"]["report"], 1)
             
     # Flatten Trends
     ai_trend_list = []
@@ -1971,7 +1864,9 @@ async def get_dashboard_stats(db: Session = Depends(get_session), admin: AdminUs
             "social": data["social"],
             "success": data["success"],
             "failure": data["failure"],
-            "latency": avg_lat
+            "report_cache_hits": data["report_cache_hits"],
+            "latency": avg_lat,
+            "latency_percentiles": {name: latency_percentiles(data["histograms"][ctype]) for ctype, name in type_names.items()}
         })
 
     result = {
@@ -1991,10 +1886,7 @@ async def get_dashboard_stats(db: Session = Depends(get_session), admin: AdminUs
         "ai_trends": ai_trend_list
     }
     
-    # Cache for 5 minutes
-    redis_client.setex(cache_key, 300, json.dumps(result))
-    
-    return result
+    return json_dumps(result)
 
 @app.post("/api/exam/download-event")
 def track_download_event(
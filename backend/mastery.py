@@ -0,0 +1,246 @@
+"""
+Incremental per-user knowledge point mastery.
+
+Each submit adds its per-KP (total, wrong) counts to the KPMastery table in one
+batched upsert and mirrors them into a Redis hash `kp_mastery:{fp}:{subject}`
+(fields "<kp_id>:t" / "<kp_id>:w"). Reading error rates for sampling and report
+generation is then one HGETALL, O(#KPs), instead of reloading past sessions and
+every question they touched.
+
+Sessions submitted without any recorded answer are not counted, both live
+(counts_toward_mastery) and in the backfill.
+
+A missing mirror is rebuilt from the table by the next reader. Submits that
+find no mirror bump `kp_mastery_ver:{fp}:{subject}` instead of incrementing,
+and the reader only creates the hash if that version is unchanged since before
+its table load, so a rebuild can never drop a concurrent submit.
+
+Backfill from existing sessions (rebuilds the table and clears the mirror):
+
+    python -m backend.mastery backfill
+"""
+import argparse
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Optional
+
+from sqlmodel import Session, select, delete
+
+from backend.database import engine, redis_client, upsert_increment
+from backend.models import KPMastery, ExamSession, Question
+
+MIRROR_TTL = 3600 * 24 * 30
+# Marks a mirror as loaded even when the user has no history yet
+LOADED_FIELD = "_loaded"
+
+# KEYS: mirror, version. Only add to the mirror if it is already loaded (a
+# partial hash would hide older counts); otherwise bump the version so a reader
+# rebuilding it from a table snapshot that may predate this submit gives up
+_MIRROR_INCR_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    redis.call('INCR', KEYS[2])
+    redis.call('EXPIRE', KEYS[2], %d)
+    return 0
+end
+for i = 1, #ARGV, 2 do
+    redis.call('HINCRBY', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+redis.call('EXPIRE', KEYS[1], %d)
+return 1
+""" % (MIRROR_TTL, MIRROR_TTL)
+_mirror_incr = redis_client.register_script(_MIRROR_INCR_SCRIPT)
+
+# KEYS: mirror, version. ARGV: version read before the table load, then field/value pairs.
+# Create the mirror only if nobody else has and no submit missed it meanwhile
+_MIRROR_LOAD_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then return 0 end
+if (redis.call('GET', KEYS[2]) or '') ~= ARGV[1] then return 0 end
+for i = 2, #ARGV, 2 do
+    redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+redis.call('EXPIRE', KEYS[1], %d)
+return 1
+""" % MIRROR_TTL
+_mirror_load = redis_client.register_script(_MIRROR_LOAD_SCRIPT)
+
+
+def _subject_key(subject_id: Optional[int]) -> int:
+    return subject_id or 0
+
+
+def _mirror_key(fingerprint: str, subject_id: Optional[int]) -> str:
+    return f"kp_mastery:{fingerprint}:{_subject_key(subject_id)}"
+
+
+def _version_key(fingerprint: str, subject_id: Optional[int]) -> str:
+    return f"kp_mastery_ver:{fingerprint}:{_subject_key(subject_id)}"
+
+
+def counts_toward_mastery(user_answers: Optional[Dict[str, str]]) -> bool:
+    """Sessions submitted without a single recorded answer are left out of mastery."""
+    return bool(user_answers)
+
+
+def _rates_from_counts(counts: Dict[int, list]) -> Dict[int, float]:
+    return {kp: wrong / total for kp, (total, wrong) in counts.items() if total > 0}
+
+
+def _load_from_db(db: Session, fingerprint: str, subject_id: Optional[int]) -> Dict[int, list]:
+    rows = db.exec(select(KPMastery.knowledge_point_id, KPMastery.total, KPMastery.wrong).where(
+        KPMastery.user_fingerprint == fingerprint,
+        KPMastery.subject_id == _subject_key(subject_id)
+    )).all()
+    return {kp: [total, wrong] for kp, total, wrong in rows}
+
+
+def get_user_kp_error_rates(db: Session, fingerprint: str, subject_id: Optional[int] = None) -> Dict[int, float]:
+    """
+    Error rate per KP for a user in a subject.
+    Returns: {kp_id: error_rate} (0.0 to 1.0)
+    """
+    key = _mirror_key(fingerprint, subject_id)
+    version_key = _version_key(fingerprint, subject_id)
+    try:
+        mirror = redis_client.hgetall(key)
+        version = redis_client.get(version_key) or ""
+    except Exception as e:
+        print(f"Redis Mastery Fetch Error: {e}")
+        return _rates_from_counts(_load_from_db(db, fingerprint, subject_id))
+
+    if mirror:
+        counts = defaultdict(lambda: [0, 0])
+        for field, value in mirror.items():
+            if field == LOADED_FIELD:
+                continue
+            kp, kind = field.split(":")
+            counts[int(kp)][0 if kind == "t" else 1] = int(value)
+        return _rates_from_counts(counts)
+
+    # Mirror miss: load from the table and populate the hash. Read through a
+    # fresh session so the load is not served from the caller's older snapshot
+    with Session(engine) as fresh:
+        counts = _load_from_db(fresh, fingerprint, subject_id)
+    try:
+        args = [version, LOADED_FIELD, 1]
+        for kp, (total, wrong) in counts.items():
+            args.extend([f"{kp}:t", total, f"{kp}:w", wrong])
+        _mirror_load(keys=[key, version_key], args=args)
+    except Exception as e:
+        print(f"Redis Mastery Mirror Error: {e}")
+    return _rates_from_counts(counts)
+
+
+def record_session_results(db: Session, fingerprint: str, subject_id: Optional[int], kp_stats: Dict[int, Dict]):
+    """
+    Add a graded session's per-KP counts to the table in one upsert. Runs inside
+    the caller's transaction; call mirror_session_results() after commit.
+    kp_stats: {kp_id: {"total": n, "correct": m, ...}}
+    """
+    now = datetime.utcnow()
+    rows = [
+        {
+            "user_fingerprint": fingerprint,
+            "subject_id": _subject_key(subject_id),
+            "knowledge_point_id": kp_id,
+            "total": stats["total"],
+            "wrong": stats["total"] - stats["correct"],
+            "updated_at": now,
+        }
+        for kp_id, stats in kp_stats.items() if stats["total"] > 0
+    ]
+    upsert_increment(
+        db, KPMastery, rows,
+        key_cols=("user_fingerprint", "subject_id", "knowledge_point_id"),
+        inc_cols=("total", "wrong"),
+        set_cols=("updated_at",),
+    )
+
+
+def mirror_session_results(fingerprint: str, subject_id: Optional[int], kp_stats: Dict[int, Dict]):
+    args = []
+    for kp_id, stats in kp_stats.items():
+        if stats["total"] > 0:
+            args.extend([f"{kp_id}:t", stats["total"], f"{kp_id}:w", stats["total"] - stats["correct"]])
+    if not args:
+        return
+    try:
+        _mirror_incr(keys=[_mirror_key(fingerprint, subject_id), _version_key(fingerprint, subject_id)], args=args)
+    except Exception as e:
+        print(f"Redis Mastery Update Error: {e}")
+        # Drop the mirror so the next read reloads it from the table
+        try:
+            redis_client.delete(_mirror_key(fingerprint, subject_id))
+        except Exception:
+            pass
+
+
+# -----------------------------------------------------------------------------
+# Backfill
+# -----------------------------------------------------------------------------
+
+def backfill(batch_size: int = 500) -> int:
+    """Rebuild KPMastery from all submitted sessions. Returns the number of rows written."""
+    with Session(engine) as db:
+        q_info = {qid: (kpid, answer) for qid, kpid, answer in db.exec(
+            select(Question.id, Question.knowledge_point_id, Question.answer)
+        ).all()}
+
+        counts = defaultdict(lambda: [0, 0]) # (fp, subject, kp) -> [total, wrong]
+        offset = 0
+        while True:
+            sessions = db.exec(
+                select(ExamSession.user_fingerprint, ExamSession.subject_id, ExamSession.question_ids, ExamSession.user_answers)
+                .where(ExamSession.is_submitted == True)
+                .order_by(ExamSession.start_time)
+                .offset(offset).limit(batch_size)
+            ).all()
+            if not sessions:
+                break
+            offset += len(sessions)
+
+            for fp, subject_id, question_ids, user_answers in sessions:
+                # Same rule as submit (counts_toward_mastery)
+                if not counts_toward_mastery(user_answers): continue
+                for qid in question_ids or []:
+                    info = q_info.get(qid)
+                    if not info or not info[0]: continue
+                    c = counts[(fp, _subject_key(subject_id), info[0])]
+                    c[0] += 1
+                    if user_answers.get(str(qid)) != info[1]:
+                        c[1] += 1
+
+        db.exec(delete(KPMastery))
+        now = datetime.utcnow()
+        rows = [
+            KPMastery(user_fingerprint=fp, subject_id=sid, knowledge_point_id=kp, total=t, wrong=w, updated_at=now)
+            for (fp, sid, kp), (t, w) in counts.items()
+        ]
+        for i in range(0, len(rows), batch_size):
+            db.add_all(rows[i:i + batch_size])
+            db.flush()
+        db.commit()
+
+    # Clear mirrors so they reload from the rebuilt table
+    deleted = 0
+    for key in redis_client.scan_iter(match="kp_mastery:*", count=1000):
+        redis_client.delete(key)
+        deleted += 1
+    print(f"Backfilled {len(rows)} KP mastery rows from {offset} sessions, cleared {deleted} Redis mirrors.")
+    return len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="KP mastery aggregates")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_backfill = sub.add_parser("backfill", help="Rebuild aggregates from existing submitted sessions")
+    p_backfill.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    if args.command == "backfill":
+        from backend.database import create_db_and_tables
+        create_db_and_tables()
+        backfill(args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 from typing import Optional, List, Dict, Any
 from sqlmodel import Field, SQLModel, Relationship
-from sqlalchemy import Column, JSON, Text
+from sqlalchemy import Column, JSON, Text, UniqueConstraint
 from datetime import datetime
 import uuid
 
@@ -100,6 +100,21 @@ class ExamSession(SQLModel, table=True):
     pdf_download_count: int = Field(default=0)
     share_count: int = Field(default=0)
 
+class KPMastery(SQLModel, table=True):
+    """
+    Running per-user answer counts per knowledge point, updated on every submit.
+    Replaces re-scanning past sessions to compute error rates.
+    """
+    __table_args__ = (UniqueConstraint("user_fingerprint", "subject_id", "knowledge_point_id", name="uq_kpmastery_user_subject_kp"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_fingerprint: str = Field(index=True)
+    subject_id: int = Field(default=0) # 0 for legacy sessions without subject
+    knowledge_point_id: int = Field(index=True)
+    total: int = Field(default=0)
+    wrong: int = Field(default=0)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
 class AILog(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     call_type: str = Field(index=True) # "smart_paper", "report", "social_analysis"
@@ -107,6 +122,31 @@ class AILog(SQLModel, table=True):
     response_time: float # in seconds
     timestamp: datetime = Field(default_factory=datetime.utcnow)
     error_message: Optional[str] = None
+    # Served from the AI report cache instead of an LLM call
+    cache_hit: bool = Field(default=False)
+    # Filled from the provider response when known (see backend/ai_telemetry.py)
+    provider: Optional[str] = None
+    model: Optional[str] = None
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+
+class AILatencyRollup(SQLModel, table=True):
+    """
+    Latency histogram of AI calls per day (UTC+8), call type, provider, status
+    and cache hit: one row per log-linear bucket (see backend/ai_latency.py).
+    Incremented when AILog entries are flushed; the dashboard reads these instead of AILog.
+    """
+    __table_args__ = (UniqueConstraint("day", "call_type", "provider", "status", "cache_hit", "bucket", name="uq_ailatency_key"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    day: str = Field(max_length=10, index=True) # YYYY-MM-DD
+    call_type: str = Field(max_length=32)
+    provider: str = Field(default="", max_length=32) # "" when unknown (cache hits, older logs)
+    status: str = Field(max_length=16)
+    cache_hit: bool = Field(default=False)
+    bucket: int
+    count: int = Field(default=0)
+    sum_seconds: float = Field(default=0.0)
 
 class AIConfig(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
@@ -0,0 +1,99 @@
+"""
+Stock of pre-drawn base exam papers per subject, kept in Redis.
+
+A background producer (one per worker, serialised by a Redis lock) tops each
+subject's stock up to PAPER_STOCK_DEPTH papers drawn with global KP weights and
+a reserve of spare candidates. start_exam pops a stocked paper and only applies
+per-user personalisation on top of it (see exam_assembly.personalise_paper).
+
+Stock keys embed the question bank version, so any bank change made through
+invalidate_catalog() makes older stock unreachable; it then expires on its TTL.
+AI variants saved by the worker only move the subject's catalog version
+(invalidate_subject_variants), so existing stock stays in use; weak-KP swaps
+still draw from the current catalog's AI pool.
+"""
+import uuid
+from typing import Dict, Optional, Tuple
+
+from sqlmodel import Session, select
+
+from backend.config import settings
+from backend.database import engine, redis_client
+from backend.models import Subject
+from backend.question_catalog import get_catalog
+from backend.sampling import CandidatePool, KPWeightTable
+from backend.serialization import dumps, loads
+from backend.exam_assembly import catalog_pools, base_kp_weights, draw_paper, paper_to_dict, paper_from_dict
+
+PRODUCER_LOCK_KEY = "paper_stock_producer_lock"
+# Delete the lock only if it still holds our token: a producer that outlived
+# its TTL must not release the lock another producer has since taken
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end
+return 0
+"""
+_release = redis_client.register_script(_RELEASE_SCRIPT)
+STOCK_TTL = 3600
+
+# Spare candidates kept per pool, as a fraction of the pool's question count
+RESERVE_RATIO = 1.0
+
+
+def stock_key(subject_id: int, version: int) -> str:
+    return f"paper_stock:{subject_id}:{version}"
+
+
+def take_stocked_paper(subject_id: int, version: Optional[int]) -> Optional[Dict[str, Tuple[CandidatePool, int]]]:
+    """Pop one stocked paper for the current bank version, or None if the stock is empty."""
+    if settings.PAPER_STOCK_DEPTH <= 0 or version is None:
+        return None
+    try:
+        raw = redis_client.lpop(stock_key(subject_id, version))
+    except Exception as e:
+        print(f"Redis Paper Stock Error: {e}")
+        return None
+    if not raw:
+        return None
+    return paper_from_dict(loads(raw))
+
+
+def refill_subject(db: Session, subject_id: int) -> int:
+    catalog = get_catalog(db, subject_id)
+    if catalog.version is None or not catalog.entries:
+        return 0
+
+    key = stock_key(subject_id, catalog.version)
+    missing = settings.PAPER_STOCK_DEPTH - redis_client.llen(key)
+    if missing <= 0:
+        return 0
+
+    pools = catalog_pools(catalog)
+    weight_table = KPWeightTable(base_kp_weights(catalog.kp_scores))
+    papers = [
+        dumps(paper_to_dict(draw_paper(pools, weight_table, reserve_ratio=RESERVE_RATIO)))
+        for _ in range(missing)
+    ]
+
+    pipe = redis_client.pipeline()
+    pipe.rpush(key, *papers)
+    pipe.expire(key, STOCK_TTL)
+    pipe.execute()
+    return missing
+
+
+def refill_stock():
+    """Top up every subject's stock. Only one worker refills at a time."""
+    if settings.PAPER_STOCK_DEPTH <= 0:
+        return
+    lock_ttl = max(5, settings.PAPER_STOCK_REFRESH_SECONDS)
+    token = uuid.uuid4().hex
+    if not redis_client.set(PRODUCER_LOCK_KEY, token, nx=True, ex=lock_ttl):
+        return
+    try:
+        with Session(engine) as db:
+            for subject_id in db.exec(select(Subject.id)).all():
+                added = refill_subject(db, subject_id)
+                if added:
+                    print(f"DEBUG: Stocked {added} papers for subject {subject_id}")
+    finally:
+        _release(keys=[PRODUCER_LOCK_KEY], args=[token])
@@ -0,0 +1,147 @@
+"""
+Compaction of the per-KP section ({kp_analysis}) of the report prompt.
+
+A 75-question paper can touch 60+ knowledge points, and one line per KP (with
+history) makes the prompt long, which slows down both the first token and the
+whole reply. When the full listing would push the prompt over
+settings.REPORT_PROMPT_TOKEN_BUDGET, the section is rewritten as:
+
+- one summary line per major chapter (accuracy, KP count, weak KPs, history), and
+- detail lines only for the KPs that matter: weak (accuracy below
+  WEAK_ACCURACY), high weight (KEY_WEIGHTS) or regressed against history,
+  highest priority first, as many as fit in the budget.
+
+Prompts that fit keep the full per-KP listing unchanged. Token counts are an
+estimate (one token per CJK character, four other characters per token),
+which is close enough for budgeting against both providers.
+"""
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+WEAK_ACCURACY = 60
+KEY_WEIGHTS = ("核心", "重要")
+# Accuracy change (points) against history counted as progress / regression
+TREND_THRESHOLD = 5
+
+_CJK = re.compile(r"[\u3000-\u303f\u4e00-\u9fff\uff00-\uffef]")
+
+
+def estimate_tokens(text: str) -> int:
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _accuracy(correct: int, total: int) -> int:
+    return int((correct / total) * 100) if total > 0 else 0
+
+
+def _history(kpid: Any, accuracy: int, history_rates: Optional[Dict[int, float]]) -> Tuple[Optional[int], str]:
+    # history_rates is {kp_id: error_rate} (0.0 - 1.0); shown as historical accuracy
+    if not history_rates or kpid not in history_rates:
+        return None, ""
+    hist_acc = int((1.0 - history_rates[kpid]) * 100)
+    diff = accuracy - hist_acc
+    trend = "持平"
+    if diff > TREND_THRESHOLD: trend = "进步"
+    elif diff < -TREND_THRESHOLD: trend = "退步"
+    return hist_acc, trend
+
+
+def kp_trend(kpid: Any, stats: Dict[str, Any], history_rates: Optional[Dict[int, float]]) -> str:
+    """Trend shown in the prompt for a KP ("进步" / "持平" / "退步"), "" without history."""
+    return _history(kpid, _accuracy(stats["correct"], stats["total"]), history_rates)[1]
+
+
+def kp_line(kpid: Any, stats: Dict[str, Any], history_rates: Optional[Dict[int, float]] = None) -> str:
+    name = stats.get('name', 'Unknown KP')
+    chapter = stats.get('chapter', 'Unknown Chapter')
+    weight = stats.get('weight', 'Unknown')
+    total = stats['total']
+    correct = stats['correct']
+    accuracy = _accuracy(correct, total)
+
+    history_str = ""
+    hist_acc, trend = _history(kpid, accuracy, history_rates)
+    if hist_acc is not None:
+        history_str = f" | 历史正确率: {hist_acc}% ({trend})"
+    return f"- [{chapter}] {name} (权重: {weight}): 本次 {accuracy}% ({correct}/{total}){history_str}\n"
+
+
+def full_kp_analysis(kp_stats: Dict[Any, Dict[str, Any]], history_rates: Optional[Dict[int, float]] = None) -> str:
+    """One line per KP, grouped by chapter (the uncompacted section)."""
+    kp_items = sorted(kp_stats.items(), key=lambda x: x[1].get('chapter', ''))
+    return "".join(kp_line(kpid, stats, history_rates) for kpid, stats in kp_items)
+
+
+def _priority(kpid: Any, stats: Dict[str, Any], history_rates: Optional[Dict[int, float]]) -> Optional[float]:
+    """Higher is more important; None when the KP needs no detail line."""
+    accuracy = _accuracy(stats['correct'], stats['total'])
+    _, trend = _history(kpid, accuracy, history_rates)
+    weak = accuracy < WEAK_ACCURACY
+    key = stats.get('weight') in KEY_WEIGHTS
+    regressed = trend == "退步"
+    if not (weak or key or regressed):
+        return None
+    # Weak and key first (lose the most points), then regressions, then lowest accuracy
+    return (4 if weak and key else 0) + (2 if regressed else 0) + (1 if weak else 0) + (100 - accuracy) / 1000
+
+
+def chapter_summary(kp_stats: Dict[Any, Dict[str, Any]], history_rates: Optional[Dict[int, float]] = None) -> str:
+    chapters: Dict[str, Dict[str, Any]] = {}
+    for kpid, stats in kp_stats.items():
+        entry = chapters.setdefault(stats.get('chapter', 'Unknown Chapter'), {"total": 0, "correct": 0, "kps": 0, "weak": 0, "hist": []})
+        entry["total"] += stats['total']
+        entry["correct"] += stats['correct']
+        entry["kps"] += 1
+        accuracy = _accuracy(stats['correct'], stats['total'])
+        if accuracy < WEAK_ACCURACY:
+            entry["weak"] += 1
+        if history_rates and kpid in history_rates:
+            entry["hist"].append(1.0 - history_rates[kpid])
+
+    lines = []
+    for chapter in sorted(chapters):
+        entry = chapters[chapter]
+        line = f"- [{chapter}] 本次 {_accuracy(entry['correct'], entry['total'])}% ({entry['correct']}/{entry['total']})，{entry['kps']} 个知识点，薄弱 {entry['weak']} 个"
+        if entry["hist"]:
+            line += f" | 历史正确率: {int(sum(entry['hist']) / len(entry['hist']) * 100)}%"
+        lines.append(line + "\n")
+    return "".join(lines)
+
+
+def compact_kp_analysis(kp_stats: Dict[Any, Dict[str, Any]], history_rates: Optional[Dict[int, float]], token_budget: int) -> str:
+    """
+    The {kp_analysis} section within `token_budget` tokens: the full listing if
+    it fits (or the budget is <= 0), otherwise chapter summaries plus the most
+    important KP details. The chapter summaries are always kept.
+    """
+    full = full_kp_analysis(kp_stats, history_rates)
+    if token_budget <= 0 or estimate_tokens(full) <= token_budget:
+        return full
+
+    summary = "按章节汇总：\n" + chapter_summary(kp_stats, history_rates)
+    ranked: List[Tuple[float, Any, Dict[str, Any]]] = []
+    for kpid, stats in kp_stats.items():
+        priority = _priority(kpid, stats, history_rates)
+        if priority is not None:
+            ranked.append((priority, kpid, stats))
+    ranked.sort(key=lambda x: x[0], reverse=True)
+
+    header = "重点知识点（薄弱、高权重或退步）：\n"
+    used = estimate_tokens(summary) + estimate_tokens(header)
+    details = []
+    for _, kpid, stats in ranked:
+        line = kp_line(kpid, stats, history_rates)
+        cost = estimate_tokens(line)
+        if used + cost > token_budget:
+            break
+        details.append(line)
+        used += cost
+
+    section = summary
+    if details:
+        section += header + "".join(details)
+    omitted = len(kp_stats) - len(details)
+    if omitted:
+        section += f"（其余 {omitted} 个知识点已并入章节汇总）\n"
+    return section
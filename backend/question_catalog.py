@@ -0,0 +1,178 @@
+"""
+Per-subject question catalog used by exam assembly.
+
+The catalog keeps only what the draw needs (id, knowledge point, source type and
+the knowledge point's weight), so assembling a paper never loads question text,
+options or explanations for candidates that are not picked. Each worker builds
+a subject's catalog once and reuses it until the question bank version in Redis
+moves, which the admin endpoints bump through `invalidate_catalog()`.
+
+AI variants saved by the worker only add questions to one subject, so they bump
+that subject's own version instead (`invalidate_subject_variants()`): the other
+subjects' catalogs, the paper stock and the question payload caches, all keyed
+on the bank version, stay valid.
+"""
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from sqlmodel import Session, select
+
+from backend.database import redis_client
+from backend.models import Question, KnowledgePoint, MajorChapter
+from backend.sampling import CandidatePool
+
+BANK_VERSION_KEY = "question_bank_version"
+
+
+def subject_version_key(subject_id: int) -> str:
+    return f"question_bank_version:{subject_id}"
+
+
+# Source types as stored by upload_questions, with the legacy English names as fallback
+PAST_PAPER_TYPES = ("历年真题", "past_paper")
+EXERCISE_TYPES = ("章节练习", "exercise")
+AI_GENERATED_TYPE = "ai_generated"
+
+LOW_WEIGHT_LEVELS = ("一般", "冷门", "非考纲要求")
+
+# How long a catalog may be trusted when the bank version cannot be read from Redis
+LOCAL_FALLBACK_TTL = 60
+
+
+class CatalogEntry(NamedTuple):
+    id: int
+    knowledge_point_id: Optional[int]
+    source_type: str
+    weight_level: Optional[str]
+    weight_score: Optional[int]
+
+
+class SubjectCatalog:
+    def __init__(self, subject_id: int, version: Optional[int], entries: List[CatalogEntry], kp_scores: List[Tuple[int, Optional[int]]], subject_version: Optional[int] = None):
+        self.subject_id = subject_id
+        # Bank version (keys the paper stock) and this subject's variant version
+        self.version = version
+        self.subject_version = subject_version
+        self.built_at = time.time()
+        self.entries = entries
+        # [(kp_id, weight_score)] for every KP of the subject, including KPs without questions
+        self.kp_scores = kp_scores
+        # Every question of the subject, for backfilling short papers
+        self.all_questions = CandidatePool.from_entries(entries)
+
+        grouped: Dict[str, List[CatalogEntry]] = {}
+        for e in entries:
+            grouped.setdefault(e.source_type, []).append(e)
+        self.by_source: Dict[str, CandidatePool] = {st: CandidatePool.from_entries(es) for st, es in grouped.items()}
+
+        self.low_weight = CandidatePool.from_entries(e for e in entries if e.weight_level in LOW_WEIGHT_LEVELS)
+
+    def pool(self, source_types) -> CandidatePool:
+        """
+        Return the pool of the first source type in `source_types` that has any questions.
+        Mirrors the old "Chinese type first, English type as legacy fallback" lookup.
+        """
+        if isinstance(source_types, str):
+            source_types = (source_types,)
+        for st in source_types:
+            found = self.by_source.get(st)
+            if found is not None and len(found):
+                return found
+        return CandidatePool.from_entries([])
+
+    def is_fresh(self, version: Optional[int], subject_version: Optional[int] = None) -> bool:
+        if version is None:
+            return time.time() - self.built_at < LOCAL_FALLBACK_TTL
+        return self.version == version and self.subject_version == subject_version
+
+
+_catalogs: Dict[int, SubjectCatalog] = {}
+_catalog_lock = threading.Lock()
+
+
+def get_bank_version() -> Optional[int]:
+    """Current question bank version, or None if Redis is unavailable."""
+    try:
+        return int(redis_client.get(BANK_VERSION_KEY) or 0)
+    except Exception as e:
+        print(f"Redis Catalog Version Error: {e}")
+        return None
+
+
+def get_catalog_versions(subject_id: int) -> Tuple[Optional[int], Optional[int]]:
+    """(bank version, subject variant version) in one round trip; (None, None) if Redis is unavailable."""
+    try:
+        bank, subject = redis_client.mget(BANK_VERSION_KEY, subject_version_key(subject_id))
+        return int(bank or 0), int(subject or 0)
+    except Exception as e:
+        print(f"Redis Catalog Version Error: {e}")
+        return None, None
+
+
+def build_catalog(db: Session, subject_id: int, version: Optional[int] = None, subject_version: Optional[int] = None) -> SubjectCatalog:
+    rows = db.exec(
+        select(
+            Question.id,
+            Question.knowledge_point_id,
+            Question.source_type,
+            KnowledgePoint.weight_level,
+            KnowledgePoint.weight_score,
+        )
+        .join(KnowledgePoint, Question.knowledge_point_id == KnowledgePoint.id)
+        .join(MajorChapter, KnowledgePoint.major_chapter_id == MajorChapter.id)
+        .where(MajorChapter.subject_id == subject_id)
+        .order_by(Question.id)
+    ).all()
+    entries = [CatalogEntry(*row) for row in rows]
+
+    kp_scores = db.exec(
+        select(KnowledgePoint.id, KnowledgePoint.weight_score)
+        .join(MajorChapter)
+        .where(MajorChapter.subject_id == subject_id)
+    ).all()
+
+    print(f"DEBUG: Built question catalog for subject {subject_id} (version {version}.{subject_version}, {len(entries)} questions)")
+    return SubjectCatalog(subject_id, version, entries, [tuple(x) for x in kp_scores], subject_version)
+
+
+def get_catalog(db: Session, subject_id: int) -> SubjectCatalog:
+    """Return the worker's catalog for a subject, rebuilding it if the bank changed."""
+    version, subject_version = get_catalog_versions(subject_id)
+    catalog = _catalogs.get(subject_id)
+    if catalog and catalog.is_fresh(version, subject_version):
+        return catalog
+
+    with _catalog_lock:
+        catalog = _catalogs.get(subject_id)
+        if catalog and catalog.is_fresh(version, subject_version):
+            return catalog
+        catalog = build_catalog(db, subject_id, version, subject_version)
+        _catalogs[subject_id] = catalog
+        return catalog
+
+
+def invalidate_catalog():
+    """
+    Mark the question bank as changed. Bumps the shared version so every worker
+    rebuilds its catalogs on next use, and drops this worker's copies right away.
+    """
+    with _catalog_lock:
+        _catalogs.clear()
+    try:
+        redis_client.incr(BANK_VERSION_KEY)
+    except Exception as e:
+        print(f"Redis Catalog Invalidate Error: {e}")
+
+
+def invalidate_subject_variants(subject_id: int):
+    """
+    New AI variants were added to one subject. Only that subject's catalogs are
+    rebuilt; the bank version (paper stock, question payload caches) is untouched.
+    """
+    with _catalog_lock:
+        _catalogs.pop(subject_id, None)
+    try:
+        redis_client.incr(subject_version_key(subject_id))
+    except Exception as e:
+        print(f"Redis Catalog Invalidate Error: {e}")
@@ -0,0 +1,144 @@
+"""
+Shared cache of exam-view question payloads.
+
+A payload is what the exam page needs for one question (id, content, options,
+type), without answer or explanation. Payloads are cached once per question in
+Redis under `qpayload:v1:{id}` and in a per-worker LRU in front of it, instead
+of being copied into every user's session cache and rebuilt from MySQL on each
+resume. Session caches (`exam_session:{fp}:{subject}`) keep only question ids
+and answers and are expanded through this cache.
+
+The local LRU is dropped whenever the question bank version moves (see
+question_catalog.invalidate_catalog); update/delete of a question also deletes
+its Redis entry through invalidate_question_payloads(), which must run before
+the version bump so no worker caches the old Redis copy under the new version.
+"""
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlmodel import Session, select
+
+from backend.database import redis_client
+from backend.models import Question
+from backend.question_catalog import get_bank_version
+from backend.serialization import dumps, loads
+
+PAYLOAD_SCHEMA = "v1"
+PAYLOAD_TTL = 3600 * 24
+LOCAL_CACHE_SIZE = 5000
+
+_local: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+_local_version: Optional[int] = None
+_local_lock = threading.Lock()
+
+
+def payload_key(question_id: int) -> str:
+    return f"qpayload:{PAYLOAD_SCHEMA}:{question_id}"
+
+
+def _to_payload(q) -> Dict[str, Any]:
+    return {
+        "id": q.id,
+        "content": q.content,
+        "options": q.options,
+        "type": "single", # Single choice
+    }
+
+
+def _local_get(ids: Iterable[int], version: Optional[int]) -> Dict[int, Dict[str, Any]]:
+    global _local_version
+    found = {}
+    with _local_lock:
+        if version is None or version != _local_version:
+            _local.clear()
+            _local_version = version
+        for qid in ids:
+            payload = _local.get(qid)
+            if payload is not None:
+                _local.move_to_end(qid)
+                found[qid] = payload
+    return found
+
+
+def _local_put(payloads: Dict[int, Dict[str, Any]], version: Optional[int]):
+    if version is None:
+        return
+    with _local_lock:
+        if version != _local_version:
+            return
+        for qid, payload in payloads.items():
+            _local[qid] = payload
+            _local.move_to_end(qid)
+        while len(_local) > LOCAL_CACHE_SIZE:
+            _local.popitem(last=False)
+
+
+def get_question_payloads(db: Session, ids: List[int]) -> List[Dict[str, Any]]:
+    """Exam-view payloads for `ids` in order, numbered from 1. Unknown ids are skipped."""
+    version = get_bank_version()
+    unique_ids = list(dict.fromkeys(ids))
+    payloads = _local_get(unique_ids, version)
+
+    missing = [qid for qid in unique_ids if qid not in payloads]
+    if missing:
+        fetched = {}
+        try:
+            for qid, raw in zip(missing, redis_client.mget([payload_key(qid) for qid in missing])):
+                if raw:
+                    fetched[qid] = loads(raw)
+        except Exception as e:
+            print(f"Redis Payload Fetch Error: {e}")
+
+        db_missing = [qid for qid in missing if qid not in fetched]
+        if db_missing:
+            rows = db.exec(select(Question.id, Question.content, Question.options).where(Question.id.in_(db_missing))).all()
+            loaded = {row.id: _to_payload(row) for row in rows}
+            if loaded:
+                try:
+                    pipe = redis_client.pipeline()
+                    for qid, payload in loaded.items():
+                        pipe.setex(payload_key(qid), PAYLOAD_TTL, dumps(payload))
+                    pipe.execute()
+                except Exception as e:
+                    print(f"Redis Payload Set Error: {e}")
+            fetched.update(loaded)
+
+        _local_put(fetched, version)
+        payloads.update(fetched)
+
+    result = []
+    for i, qid in enumerate(ids):
+        payload = payloads.get(qid)
+        if payload:
+            result.append(dict(payload, index=i + 1, user_answer=None))
+    return result
+
+
+def invalidate_question_payloads(ids: Iterable[int]):
+    ids = list(ids)
+    with _local_lock:
+        for qid in ids:
+            _local.pop(qid, None)
+    try:
+        redis_client.delete(*[payload_key(qid) for qid in ids])
+    except Exception as e:
+        print(f"Redis Payload Invalidate Error: {e}")
+
+
+# -----------------------------------------------------------------------------
+# Session cache entries (ids + answers only)
+# -----------------------------------------------------------------------------
+
+def session_cache_entry(response_data: Dict[str, Any], question_ids: List[int]) -> str:
+    """Serialize a start/resume response for the session cache, without question bodies."""
+    entry = {k: v for k, v in response_data.items() if k != "questions"}
+    entry["question_ids"] = question_ids
+    return dumps(entry)
+
+
+def session_from_cache(db: Session, raw: str) -> Dict[str, Any]:
+    """Expand a session cache entry back into a start/resume response."""
+    data = loads(raw)
+    data["questions"] = get_question_payloads(db, data.pop("question_ids", []))
+    return data
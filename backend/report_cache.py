@@ -0,0 +1,101 @@
+"""
+Cache of assembled report payloads for /api/exam/report/{id}.
+
+A submitted report only changes when share content is generated, so the full
+response body (report + 75 question details + subject name) is serialized once
+and kept in Redis with a strong ETag derived from its bytes. Repeat views are a
+single HGETALL, or a 304 when the client already holds the same version.
+Writers that change a report call invalidate_report(), which also bumps the
+report's generation. A reader stores the payload it built only if the
+generation is still the one it read before loading from the DB (compare-and-
+set in one script), so a payload assembled just before a writer commits can't
+be written back over the invalidation. Payloads of reports still pending AI
+generation are not cached at all.
+"""
+import hashlib
+from typing import Any, Dict, Optional, Tuple
+
+from backend.database import redis_client
+from backend.serialization import dumps
+
+REPORT_CACHE_TTL = 3600 * 24
+
+# KEYS: payload, generation. ARGV: generation read before building, body, etag, ttl
+_STORE_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '') ~= ARGV[1] then return 0 end
+redis.call('HSET', KEYS[1], 'body', ARGV[2], 'etag', ARGV[3])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return 1
+"""
+_store = redis_client.register_script(_STORE_SCRIPT)
+
+
+def report_key(session_id: str) -> str:
+    return f"report_payload:{session_id}"
+
+
+def generation_key(session_id: str) -> str:
+    return f"report_payload_gen:{session_id}"
+
+
+def serialize_report(payload: Dict[str, Any]) -> Tuple[str, str]:
+    """Returns (body, etag)."""
+    body = dumps(payload)
+    etag = '"' + hashlib.sha256(body.encode("utf-8")).hexdigest()[:32] + '"'
+    return body, etag
+
+
+def get_cached_report(session_id: str) -> Optional[Tuple[str, str]]:
+    try:
+        cached = redis_client.hgetall(report_key(session_id))
+    except Exception as e:
+        print(f"Redis Report Cache Fetch Error: {e}")
+        return None
+    if not cached or "body" not in cached:
+        return None
+    return cached["body"], cached["etag"]
+
+
+def report_generation(session_id: str) -> Optional[str]:
+    """Read before building the payload and pass to store_report(). None if Redis is unavailable."""
+    try:
+        return redis_client.get(generation_key(session_id)) or ""
+    except Exception as e:
+        print(f"Redis Report Cache Fetch Error: {e}")
+        return None
+
+
+def store_report(session_id: str, body: str, etag: str, generation: Optional[str]):
+    """Cache the payload unless the report was invalidated since `generation` was read."""
+    if generation is None:
+        return
+    try:
+        _store(keys=[report_key(session_id), generation_key(session_id)], args=[generation, body, etag, REPORT_CACHE_TTL])
+    except Exception as e:
+        print(f"Redis Report Cache Set Error: {e}")
+
+
+def invalidate_report(session_id: str):
+    try:
+        pipe = redis_client.pipeline()
+        pipe.delete(report_key(session_id))
+        pipe.incr(generation_key(session_id))
+        pipe.expire(generation_key(session_id), REPORT_CACHE_TTL)
+        pipe.execute()
+    except Exception as e:
+        print(f"Redis Report Cache Invalidate Error: {e}")
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match check (weak comparison, as RFC 9110 requires for this header)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
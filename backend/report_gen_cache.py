@@ -0,0 +1,106 @@
+"""
+Content-addressed cache of AI report bodies.
+
+Many submissions produce nearly the same report prompt: same subject, same
+score, similar accuracy per chapter. Reports are cached under a fingerprint of
+those normalised inputs:
+
+- subject name and a hash of the prompt template (editing the prompt starts over)
+- the exact score (0-75): the text quotes it, the pass-line gap and the level
+  derived from it, so nearby scores cannot share a body
+- accuracy per chapter, bucketed to ACCURACY_BUCKET percent
+- the set of weak knowledge points (accuracy below WEAK_THRESHOLD)
+- the trend per knowledge point with history (progress / flat / regression, as
+  shown in the prompt by backend/prompt_compaction.py)
+
+A hit is returned as stored; the worker adds radar data and stats as for a
+fresh report.
+
+Storage: `ai_report_cache:{fp}` strings with a TTL, plus the ZSET
+`ai_report_cache:lru` (member = fp, score = last use) used to evict the least
+recently used entries beyond REPORT_GEN_CACHE_MAX_ENTRIES.
+"""
+import hashlib
+import time
+from typing import Any, Dict, Optional
+
+from backend.config import settings
+from backend.database import redis_client
+from backend.prompt_compaction import kp_trend
+from backend.serialization import dumps, loads
+
+CACHE_SCHEMA = "v2"
+LRU_KEY = "ai_report_cache:lru"
+
+ACCURACY_BUCKET = 20
+WEAK_THRESHOLD = 0.6
+
+# Fields filled per session, never taken from the cache
+PERSONAL_FIELDS = ("score", "accuracy", "duration_minutes", "total_questions", "radar_data", "report_status")
+
+
+def entry_key(fingerprint: str) -> str:
+    return f"ai_report_cache:{CACHE_SCHEMA}:{fingerprint}"
+
+
+def report_fingerprint(subject_name: str, score: int, kp_stats: Dict[int, Dict[str, Any]], prompt_template: str, history_rates: Optional[Dict[int, float]]) -> str:
+    chapters: Dict[str, list] = {}
+    weak = []
+    trends = []
+    for kp_id, stats in kp_stats.items():
+        total, correct = stats["total"], stats["correct"]
+        bucket = chapters.setdefault(str(stats.get("chapter", "")), [0, 0])
+        bucket[0] += correct
+        bucket[1] += total
+        if total and correct / total < WEAK_THRESHOLD:
+            weak.append(int(kp_id))
+        trend = kp_trend(kp_id, stats, history_rates)
+        if trend:
+            trends.append((int(kp_id), trend))
+
+    normalised = {
+        "subject": subject_name,
+        "prompt": hashlib.sha256(prompt_template.encode("utf-8")).hexdigest()[:16],
+        "score": score,
+        "chapters": sorted(
+            (name, int(correct * 100 / total) // ACCURACY_BUCKET)
+            for name, (correct, total) in chapters.items() if total
+        ),
+        "weak": sorted(weak),
+        "trends": sorted(trends),
+    }
+    return hashlib.sha256(dumps(normalised).encode("utf-8")).hexdigest()
+
+
+def get_cached_ai_report(fingerprint: str) -> Optional[Dict[str, Any]]:
+    """Cached report body for the fingerprint, or None."""
+    if settings.REPORT_GEN_CACHE_MAX_ENTRIES <= 0:
+        return None
+    try:
+        raw = redis_client.get(entry_key(fingerprint))
+        if not raw:
+            return None
+        redis_client.zadd(LRU_KEY, {fingerprint: time.time()})
+    except Exception as e:
+        print(f"Redis AI Report Cache Fetch Error: {e}")
+        return None
+    return loads(raw)
+
+
+def store_ai_report(fingerprint: str, report: Dict[str, Any]):
+    max_entries = settings.REPORT_GEN_CACHE_MAX_ENTRIES
+    if max_entries <= 0:
+        return
+    body = {k: v for k, v in report.items() if k not in PERSONAL_FIELDS}
+    try:
+        pipe = redis_client.pipeline()
+        pipe.setex(entry_key(fingerprint), settings.REPORT_GEN_CACHE_TTL_SECONDS, dumps(body))
+        pipe.zadd(LRU_KEY, {fingerprint: time.time()})
+        pipe.zcard(LRU_KEY)
+        size = pipe.execute()[-1]
+        if size > max_entries:
+            evicted = redis_client.zpopmin(LRU_KEY, size - max_entries)
+            if evicted:
+                redis_client.delete(*[entry_key(member) for member, _ in evicted])
+    except Exception as e:
+        print(f"Redis AI Report Cache Set Error: {e}")
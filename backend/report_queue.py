@@ -0,0 +1,187 @@
+"""
+Queue for AI report generation after submit.
+
+submit_exam grades the paper, stores a preliminary report (score, radar data and
+the rule-based analysis from generate_ai_report_mock) marked
+`report_status: "pending"` and enqueues a job here. The worker process
+(`python -m backend.worker`) streams the LLM completion into the report's
+Redis Stream (see backend/report_stream.py), replaces the report with the AI
+version (or keeps the preliminary one if generation fails), marks it "ready" and
+publishes on `report_ready:{session_id}`.
+
+The Report page follows /api/exam/report/{id}/stream (SSE) to show sections as
+they are written, and falls back to /api/exam/report/{id}/status?wait=N, which
+long-polls on the ready channel.
+"""
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from sqlmodel import Session, select
+
+from backend.database import redis_client
+from backend.serialization import dumps
+from backend.models import AIConfig, ExamSession, Subject
+from backend.config import settings
+from backend.ai_service import stream_report, get_api_key, get_api_keys
+from backend.llm_client import parse_json_text
+from backend.report_cache import invalidate_report
+from backend.ai_telemetry import log_ai_call, track_llm_call
+from backend.report_stream import JSONSectionParser, ReportStreamWriter
+from backend.report_gen_cache import report_fingerprint, get_cached_ai_report, store_ai_report
+
+QUEUE_KEY = "report_gen_queue"
+
+STATUS_PENDING = "pending"
+STATUS_READY = "ready"
+
+# Upper bound for one long-poll on the status endpoint (seconds)
+STATUS_WAIT_MAX = 25
+
+
+def ready_channel(session_id: str) -> str:
+    return f"report_ready:{session_id}"
+
+
+def report_status(report: Dict[str, Any]) -> str:
+    # Reports written before async generation have no status and are complete
+    return report.get("report_status", STATUS_READY)
+
+
+def build_report_job(session: ExamSession, kp_stats: Dict[int, Dict[str, Any]], duration_minutes: int, history_rates: Dict[int, float]) -> Dict[str, Any]:
+    return {
+        "session_id": session.id,
+        "score": session.score,
+        "duration_minutes": duration_minutes,
+        "kp_stats": kp_stats,
+        # Taken before this session was added to the mastery counts
+        "history_rates": history_rates,
+        "queued_at": time.time(),
+    }
+
+
+def enqueue_report_job(job: Dict[str, Any]) -> bool:
+    try:
+        redis_client.lpush(QUEUE_KEY, dumps(job))
+        return True
+    except Exception as e:
+        print(f"Redis Report Queue Error: {e}")
+        return False
+
+
+def _int_keys(d: Dict[Any, Any]) -> Dict[int, Any]:
+    # JSON turns the KP id keys into strings
+    return {int(k): v for k, v in (d or {}).items()}
+
+
+def process_report_job(db: Session, job: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Generate the AI report for a submitted session and mark it ready. Returns the final report."""
+    session_id = job["session_id"]
+    session = db.get(ExamSession, session_id)
+    if not session or not session.ai_report:
+        print(f"Report job for unknown session {session_id}, skipped")
+        return None
+    if session.ai_report_generated:
+        return session.ai_report
+
+    preliminary = session.ai_report
+    score = job["score"]
+    kp_stats = _int_keys(job["kp_stats"])
+    history_rates = _int_keys(job.get("history_rates"))
+
+    prompt_conf = db.exec(select(AIConfig).where(AIConfig.config_key == "prompt_report")).first()
+    prompt_template = prompt_conf.value if prompt_conf else settings.DEFAULT_PROMPT_REPORT
+    api_key = get_api_key(db)
+    api_keys = get_api_keys(db)
+
+    subject_name = "系统架构设计师"
+    if session.subject_id:
+        sub_obj = db.get(Subject, session.subject_id)
+        if sub_obj: subject_name = sub_obj.name
+
+    stream = ReportStreamWriter(session_id)
+    start_ts = time.time()
+    fingerprint = report_fingerprint(subject_name, score, kp_stats, prompt_template, history_rates)
+    cached = get_cached_ai_report(fingerprint)
+    if cached is not None:
+        report = cached
+        log_ai_call("report", "success", time.time() - start_ts, cache_hit=True)
+        for key, value in report.items():
+            stream.section(key, value)
+        report["radar_data"] = preliminary.get("radar_data")
+    else:
+        report = _generate_report(db, stream, preliminary, fingerprint, score, kp_stats, prompt_template, api_key, api_keys, job["duration_minutes"], history_rates, subject_name)
+
+    for field in ("score", "accuracy", "duration_minutes", "total_questions"):
+        report[field] = preliminary.get(field)
+    report["report_status"] = STATUS_READY
+
+    session.ai_report = report
+    session.ai_report_generated = True
+    db.add(session)
+    db.commit()
+
+    invalidate_report(session_id)
+    stream.done(STATUS_READY)
+    try:
+        redis_client.publish(ready_channel(session_id), STATUS_READY)
+    except Exception as e:
+        print(f"Redis Publish Error: {e}")
+    print(f"Report job for session {session_id} done in {time.time() - start_ts:.1f}s" + (" (cached)" if cached is not None else ""))
+    return report
+
+
+def _generate_report(db, stream, preliminary, fingerprint, score, kp_stats, prompt_template, api_key, api_keys, duration_minutes, history_rates, subject_name) -> Dict[str, Any]:
+    """LLM call for a cache miss; falls back to the preliminary report on failure."""
+    parser = JSONSectionParser()
+    start_ts = time.time()
+    with track_llm_call() as usage:
+        try:
+            chunks = []
+            for text in stream_report(score, kp_stats, prompt_template, api_key=api_key, duration_minutes=duration_minutes, history_rates=history_rates, subject_name=subject_name, api_keys=api_keys):
+                chunks.append(text)
+                stream.delta(text)
+                for key, value in parser.feed(text):
+                    stream.section(key, value)
+            report = parse_json_text("".join(chunks))
+            if not isinstance(report, dict):
+                raise ValueError("report is not a JSON object")
+            log_ai_call("report", "success", time.time() - start_ts, usage=usage)
+            store_ai_report(fingerprint, report)
+            report["radar_data"] = preliminary.get("radar_data")
+            return report
+        except Exception as e:
+            log_ai_call("report", "failure", time.time() - start_ts, error_message=str(e), usage=usage)
+            print(f"AI Service Exception: {e}")
+            return dict(preliminary)
+
+
+async def wait_for_report(rds, session_id: str, is_ready: Callable[[], Awaitable[bool]], timeout: float) -> bool:
+    """
+    Wait until the worker publishes on the session's ready channel. `is_ready` is
+    re-checked after subscribing, so a report finished in between is not missed.
+    Returns False on timeout / Redis error.
+    """
+    pubsub = rds.pubsub(ignore_subscribe_messages=True)
+    try:
+        await pubsub.subscribe(ready_channel(session_id))
+        if await is_ready():
+            return True
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return False
+            message = await pubsub.get_message(timeout=remaining)
+            if message and message["type"] == "message":
+                return True
+    except Exception as e:
+        print(f"Redis Report Wait Error: {e}")
+        return False
+    finally:
+        try:
+            await pubsub.aclose()
+        except Exception:
+            pass
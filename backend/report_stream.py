@@ -0,0 +1,174 @@
+"""
+Live progress of AI report generation, relayed to the browser over SSE.
+
+The worker streams the model's completion (see report_queue.process_report_job)
+and appends events to the Redis Stream `report_stream:{session_id}`:
+
+- delta   {"text": ...}              raw completion text as it arrives
+- section {"key": ..., "value": ...} a top-level field of the report JSON, as
+                                     soon as its value is complete
+- done    {"status": "ready"}        the final report is saved in the DB
+
+/api/exam/report/{id}/stream replays the stream from the start (or from
+Last-Event-ID) and follows it with XREAD BLOCK, so any API worker can serve the
+client regardless of which worker process generates the report.
+"""
+import asyncio
+import json
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from backend.database import redis_client
+from backend.serialization import dumps
+
+STREAM_TTL = 3600
+# Approximate cap on entries kept per report (XADD MAXLEN ~)
+STREAM_MAXLEN = 4000
+# XREAD block per round; a keep-alive comment is sent when nothing arrives
+READ_BLOCK_MS = 15000
+# Give up on a stream that never finishes (seconds)
+STREAM_MAX_SECONDS = 300
+
+EVENT_DELTA = "delta"
+EVENT_SECTION = "section"
+EVENT_DONE = "done"
+
+
+def stream_key(session_id: str) -> str:
+    return f"report_stream:{session_id}"
+
+
+class JSONSectionParser:
+    """
+    Incremental parser for a streamed JSON object. feed() returns the top-level
+    (key, value) pairs whose values became complete in the new text. Text before
+    the opening brace (e.g. a ```json fence) is skipped.
+    """
+
+    def __init__(self):
+        self.buf = ""
+        self.pos = 0
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.entry_start: Optional[int] = None
+        self.closed = False
+
+    def feed(self, text: str) -> List[Tuple[str, Any]]:
+        self.buf += text
+        sections = []
+        buf = self.buf
+        while self.pos < len(buf) and not self.closed:
+            ch = buf[self.pos]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == "\\":
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch in "{[":
+                self.depth += 1
+                if self.depth == 1:
+                    self.entry_start = self.pos + 1
+            elif ch in "}]":
+                self.depth -= 1
+                if self.depth == 0:
+                    sections.extend(self._entry(self.pos))
+                    self.closed = True
+            elif ch == "," and self.depth == 1:
+                sections.extend(self._entry(self.pos))
+                self.entry_start = self.pos + 1
+            self.pos += 1
+        return sections
+
+    def _entry(self, end: int) -> List[Tuple[str, Any]]:
+        if self.entry_start is None:
+            return []
+        raw = self.buf[self.entry_start:end].strip()
+        if not raw:
+            return []
+        try:
+            return list(json.loads("{" + raw + "}").items())
+        except ValueError:
+            return []
+
+
+class ReportStreamWriter:
+    """Appends events for one report. Redis errors are logged once and then ignored."""
+
+    def __init__(self, session_id: str):
+        self.key = stream_key(session_id)
+        self.broken = False
+        self.started = False
+
+    def _add(self, event: str, data: Dict[str, Any]):
+        if self.broken:
+            return
+        try:
+            pipe = redis_client.pipeline()
+            pipe.xadd(self.key, {"event": event, "data": dumps(data)}, maxlen=STREAM_MAXLEN, approximate=True)
+            if not self.started or event == EVENT_DONE:
+                pipe.expire(self.key, STREAM_TTL)
+            pipe.execute()
+            self.started = True
+        except Exception as e:
+            print(f"Redis Report Stream Error: {e}")
+            self.broken = True
+
+    def delta(self, text: str):
+        self._add(EVENT_DELTA, {"text": text})
+
+    def section(self, key: str, value: Any):
+        self._add(EVENT_SECTION, {"key": key, "value": value})
+
+    def done(self, status: str):
+        self._add(EVENT_DONE, {"status": status})
+
+
+def sse_message(event: str, data: str, event_id: Optional[str] = None) -> str:
+    lines = []
+    if event_id:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {data}")
+    return "\n".join(lines) + "\n\n"
+
+
+async def follow_report_stream(
+    rds,
+    session_id: str,
+    last_id: str,
+    is_ready: Callable[[], Awaitable[bool]],
+    is_disconnected: Callable[[], Awaitable[bool]],
+) -> AsyncIterator[str]:
+    """
+    SSE messages for a report stream, from after `last_id` until the done event.
+    `is_ready` is checked on every idle round so a report finished without
+    stream events (e.g. generated inline) still ends the stream.
+    """
+    key = stream_key(session_id)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + STREAM_MAX_SECONDS
+    while loop.time() < deadline:
+        if await is_disconnected():
+            return
+        try:
+            result = await rds.xread({key: last_id}, block=READ_BLOCK_MS, count=200)
+        except Exception as e:
+            print(f"Redis Report Stream Read Error: {e}")
+            await asyncio.sleep(1)
+            result = None
+        if not result:
+            if await is_ready():
+                yield sse_message(EVENT_DONE, dumps({"status": "ready"}))
+                return
+            yield ": keep-alive\n\n"
+            continue
+        for _, entries in result:
+            for entry_id, fields in entries:
+                last_id = entry_id
+                yield sse_message(fields["event"], fields["data"], entry_id)
+                if fields["event"] == EVENT_DONE:
+                    return
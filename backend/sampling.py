@@ -0,0 +1,173 @@
+"""
+Vectorized weighted sampling for exam assembly.
+
+Implements Efraimidis-Spirakis weighted sampling without replacement over numpy
+arrays: one batch of random keys for the whole candidate array and a partial
+selection (argpartition) of the top k, instead of a Python loop and a full sort.
+Key u ** (1 / w) is computed as log(u) / w, which orders candidates identically
+and does not underflow for large weights.
+"""
+import threading
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+_thread_local = threading.local()
+
+
+def get_rng() -> np.random.Generator:
+    # numpy Generators are not thread-safe; sync endpoints run in a threadpool
+    rng = getattr(_thread_local, "rng", None)
+    if rng is None:
+        rng = np.random.default_rng()
+        _thread_local.rng = rng
+    return rng
+
+
+class CandidatePool:
+    """Parallel arrays of question ids and knowledge point ids (-1 when unlinked)."""
+
+    def __init__(self, ids: np.ndarray, kp_ids: np.ndarray):
+        self.ids = ids
+        self.kp_ids = kp_ids
+
+    @classmethod
+    def from_entries(cls, entries: Iterable) -> "CandidatePool":
+        """Build from objects exposing `.id` and `.knowledge_point_id` (catalog entries, Question rows)."""
+        entries = list(entries)
+        ids = np.fromiter((e.id for e in entries), dtype=np.int64, count=len(entries))
+        kp_ids = np.fromiter(
+            (e.knowledge_point_id if e.knowledge_point_id is not None else -1 for e in entries),
+            dtype=np.int64, count=len(entries),
+        )
+        return cls(ids, kp_ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def without(self, ids: Iterable[int]) -> "CandidatePool":
+        """Return a pool with the given question ids removed."""
+        ids = np.fromiter(ids, dtype=np.int64)
+        if len(ids) == 0:
+            return self
+        keep = ~np.isin(self.ids, ids)
+        return CandidatePool(self.ids[keep], self.kp_ids[keep])
+
+    def concat(self, other: "CandidatePool") -> "CandidatePool":
+        return CandidatePool(np.concatenate([self.ids, other.ids]), np.concatenate([self.kp_ids, other.kp_ids]))
+
+
+class KPWeightTable:
+    """
+    Sorted lookup table from KP id to sampling weight, so a whole candidate array
+    can be mapped to weights with one searchsorted call. KPs missing from the
+    table, and non-positive weights, count as weight 1 (same as the old dict.get).
+    """
+
+    def __init__(self, kp_weights: Dict[int, float]):
+        keys = np.fromiter(kp_weights.keys(), dtype=np.int64, count=len(kp_weights))
+        values = np.fromiter(kp_weights.values(), dtype=np.float64, count=len(kp_weights))
+        order = np.argsort(keys)
+        self.keys = keys[order]
+        self.values = values[order]
+
+    def lookup(self, kp_ids: np.ndarray) -> np.ndarray:
+        if len(self.keys) == 0:
+            return np.ones(len(kp_ids), dtype=np.float64)
+        pos = np.searchsorted(self.keys, kp_ids)
+        pos_clipped = np.minimum(pos, len(self.keys) - 1)
+        found = self.keys[pos_clipped] == kp_ids
+        weights = np.where(found, self.values[pos_clipped], 1.0)
+        weights[weights <= 0] = 1.0
+        return weights
+
+
+def weighted_sample_indices(weights: np.ndarray, k: int, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+    """
+    Draw k indices without replacement, each with probability proportional to its
+    weight (Efraimidis-Spirakis). Returned in descending key order.
+    """
+    n = len(weights)
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=np.int64)
+    if k >= n:
+        return np.arange(n)
+
+    rng = rng or get_rng()
+    # 1 - random() is in (0, 1], so log() is finite
+    keys = np.log1p(-rng.random(n)) / weights
+    top = np.argpartition(keys, n - k)[n - k:]
+    return top[np.argsort(keys[top])[::-1]]
+
+
+def _soft_exclude(pool: CandidatePool, k: int, exclude_ids) -> CandidatePool:
+    """Drop excluded ids unless that would leave fewer than k candidates."""
+    if not exclude_ids or len(pool) == 0:
+        return pool
+    excluded = np.isin(pool.ids, np.fromiter(exclude_ids, dtype=np.int64))
+    if len(pool) - int(excluded.sum()) >= k:
+        return CandidatePool(pool.ids[~excluded], pool.kp_ids[~excluded])
+    return pool
+
+
+def weighted_pick(pool: CandidatePool, k: int, kp_weights: KPWeightTable, exclude_ids=None, rng: Optional[np.random.Generator] = None) -> CandidatePool:
+    """Like weighted_sample, but returns the picked sub-pool (ids and KP ids)."""
+    candidates = _soft_exclude(pool, k, exclude_ids)
+    if len(candidates) <= k:
+        return candidates
+    idx = weighted_sample_indices(kp_weights.lookup(candidates.kp_ids), k, rng=rng)
+    return CandidatePool(candidates.ids[idx], candidates.kp_ids[idx])
+
+
+def uniform_pick(pool: CandidatePool, k: int, exclude_ids=None, rng: Optional[np.random.Generator] = None) -> CandidatePool:
+    """Like uniform_sample, but returns the picked sub-pool (ids and KP ids)."""
+    candidates = _soft_exclude(pool, k, exclude_ids)
+    if len(candidates) <= k:
+        return candidates
+    rng = rng or get_rng()
+    idx = rng.choice(len(candidates), size=k, replace=False)
+    return CandidatePool(candidates.ids[idx], candidates.kp_ids[idx])
+
+
+def uniform_pick_excluding(pool: CandidatePool, k: int, exclude_ids=(), rng: Optional[np.random.Generator] = None) -> CandidatePool:
+    """
+    Pick k candidates uniformly, never returning an id in `exclude_ids` (hard exclusion).
+
+    Uses rejection sampling on random positions, so the cost depends on k and the
+    number of excluded ids rather than the pool size; small pools are filtered directly.
+    """
+    exclude = set(int(x) for x in exclude_ids)
+    n = len(pool)
+    if k <= 0 or n == 0:
+        return CandidatePool.from_entries([])
+    if n <= 4 * (k + len(exclude)):
+        return uniform_pick(pool.without(exclude), k, rng=rng)
+
+    rng = rng or get_rng()
+    # At least 3/4 of positions are acceptable here, so this converges in a few rounds
+    picked: Dict[int, None] = {}
+    while len(picked) < k:
+        for pos in rng.integers(0, n, size=2 * (k - len(picked))):
+            pos = int(pos)
+            if pos in picked or int(pool.ids[pos]) in exclude:
+                continue
+            picked[pos] = None
+            if len(picked) == k:
+                break
+    idx = np.fromiter(picked, dtype=np.int64, count=k)
+    return CandidatePool(pool.ids[idx], pool.kp_ids[idx])
+
+
+def weighted_sample(pool: CandidatePool, k: int, kp_weights: KPWeightTable, exclude_ids=None, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+    """
+    Sample k question ids from `pool`, weighted by their KP weight.
+
+    Ids in `exclude_ids` (e.g. recently seen questions) are avoided unless that
+    would leave fewer than k candidates, in which case the full pool is used.
+    """
+    return weighted_pick(pool, k, kp_weights, exclude_ids=exclude_ids, rng=rng).ids.copy()
+
+
+def uniform_sample(pool: CandidatePool, k: int, exclude_ids=None, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+    """Sample k question ids uniformly, with the same soft exclusion rule as weighted_sample."""
+    return uniform_pick(pool, k, exclude_ids=exclude_ids, rng=rng).ids.copy()
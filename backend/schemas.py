@@ -0,0 +1,117 @@
+"""
+Typed response models for the heavy endpoints.
+
+The endpoints build their payloads as plain dicts and return them through
+serialization.json_response, so these models describe the response shape in
+the OpenAPI schema without adding a validation pass on the hot path.
+"""
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel, ConfigDict
+
+
+# --- Exam ---
+
+class ExamQuestion(BaseModel):
+    id: int
+    index: int
+    content: str
+    options: Any
+    type: str = "single"
+    user_answer: Optional[str] = None
+
+
+class ExamSessionResponse(BaseModel):
+    session_id: str
+    status: str # "created" | "resumed"
+    start_time: str
+    duration_left: int
+    questions: List[ExamQuestion]
+    user_answers: Dict[str, str] = {}
+    subject_name: Optional[str] = None
+
+
+# --- Report ---
+
+class ReportQuestion(BaseModel):
+    id: int
+    index: int
+    content: str
+    options: Any
+    answer: str
+    explanation: Optional[str] = None
+    user_answer: Optional[str] = None
+
+
+class ReportResponse(BaseModel):
+    ai_report: Dict[str, Any]
+    questions: List[ReportQuestion]
+    subject_name: str
+
+
+# --- Dashboard ---
+
+class NameValue(BaseModel):
+    name: str
+    value: int
+
+
+class UserTrendPoint(BaseModel):
+    date: str
+    active: int
+    new: int
+    total: int
+
+
+class UserStats(BaseModel):
+    total_users: int
+    pdf_downloads: int
+    shares: int
+    trend: List[UserTrendPoint]
+    device_distribution: List[NameValue]
+    score_distribution: List[NameValue]
+
+
+class KPDistribution(BaseModel):
+    name: str
+    count: int
+    percentage: float
+
+
+class AIStats(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    assembly: int
+    report: int
+    social: int
+    success: int
+    failure: int
+    avg_latency: Dict[str, float]
+    # {"assembly": {"p50": s, "p90": s, "p99": s}, ...}, overall and per provider
+    latency_percentiles: Dict[str, Dict[str, float]] = {}
+    latency_by_provider: Dict[str, Dict[str, Dict[str, float]]] = {}
+    report_cache: Dict[str, float] = {}
+
+
+class AITrendPoint(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    date: str
+    assembly: int
+    report: int
+    social: int
+    success: int
+    failure: int
+    report_cache_hits: int = 0
+    latency: Dict[str, float]
+    latency_percentiles: Dict[str, Dict[str, float]] = {}
+
+
+class DashboardStatsResponse(BaseModel):
+    user_stats: UserStats
+    kp_distribution: List[KPDistribution]
+    location_distribution: List[NameValue]
+    start_time_distribution: List[NameValue]
+    duration_distribution: List[NameValue]
+    ai_stats: AIStats
+    ai_trends: List[AITrendPoint]
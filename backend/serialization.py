@@ -0,0 +1,52 @@
+"""
+JSON serialization used across the API and Redis caches, built on orjson.
+
+- FastJSONResponse: the app's default response class.
+- dumps / loads: codecs for JSON values stored in Redis (session caches,
+  question payloads, report and dashboard caches, queues).
+- json_response: returns an already-built payload without passing it through
+  jsonable_encoder; used by the heavy endpoints together with a typed
+  response_model (see backend/schemas.py) that documents the shape.
+"""
+from typing import Any, Union
+
+import orjson
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel
+
+_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def _default(obj: Any):
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps_bytes(obj: Any) -> bytes:
+    return orjson.dumps(obj, default=_default, option=_OPTIONS)
+
+
+def dumps(obj: Any) -> str:
+    return dumps_bytes(obj).decode("utf-8")
+
+
+def loads(data: Union[str, bytes, bytearray]) -> Any:
+    return orjson.loads(data)
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps_bytes(content)
+
+
+def json_response(content: Any, status_code: int = 200, headers=None) -> Response:
+    """Serialize `content` directly with orjson, skipping FastAPI's encoder pass."""
+    return Response(content=dumps_bytes(content), status_code=status_code, headers=headers, media_type="application/json")
+
+
+def raw_json_response(body: Union[str, bytes], status_code: int = 200, headers=None) -> Response:
+    """Return JSON that is already serialized (e.g. a cache hit) as-is."""
+    return Response(content=body, status_code=status_code, headers=headers, media_type="application/json")
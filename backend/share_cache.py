@@ -0,0 +1,54 @@
+"""
+Cache of social share copy.
+
+The share prompt only depends on level, score, a coarse percentile bucket, the
+top 3 strong points and the subject (see ai_service.build_share_prompt), so
+these combinations repeat across users. Copy is cached per distinct prompt
+under `share_copy:v1:{sha256(prompt)}` as a Redis list of up to
+SHARE_CACHE_VARIANTS generated variants. While a key has fewer variants a
+click generates a new one; after that clicks pick one of them at random and
+skip the provider.
+"""
+import hashlib
+import random
+from typing import Any, Dict, Optional
+
+from backend.config import settings
+from backend.database import redis_client
+from backend.serialization import dumps, loads
+
+CACHE_SCHEMA = "v1"
+
+
+def share_key(prompt: str) -> str:
+    return f"share_copy:{CACHE_SCHEMA}:{hashlib.sha256(prompt.encode('utf-8')).hexdigest()}"
+
+
+def pick_cached_share(prompt: str) -> Optional[Dict[str, Any]]:
+    """A random cached variant once the key has all its variants, otherwise None."""
+    if settings.SHARE_CACHE_VARIANTS <= 0:
+        return None
+    key = share_key(prompt)
+    try:
+        variants = redis_client.lrange(key, 0, -1)
+    except Exception as e:
+        print(f"Redis Share Cache Fetch Error: {e}")
+        return None
+    if len(variants) < settings.SHARE_CACHE_VARIANTS:
+        return None
+    return loads(random.choice(variants))
+
+
+def store_share_variant(prompt: str, content: Dict[str, Any]):
+    if settings.SHARE_CACHE_VARIANTS <= 0:
+        return
+    key = share_key(prompt)
+    try:
+        pipe = redis_client.pipeline()
+        pipe.rpush(key, dumps(content))
+        # Concurrent misses may push more than needed; keep the newest
+        pipe.ltrim(key, -settings.SHARE_CACHE_VARIANTS, -1)
+        pipe.expire(key, settings.SHARE_CACHE_TTL_SECONDS)
+        pipe.execute()
+    except Exception as e:
+        print(f"Redis Share Cache Set Error: {e}")
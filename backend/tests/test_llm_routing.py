@@ -0,0 +1,50 @@
+"""
+Report and share generation must go through backend/llm_router.py when keys
+for several providers are set, and call the configured provider directly
+otherwise.
+"""
+import asyncio
+
+import pytest
+
+from backend import ai_service
+from backend.config import settings
+
+KEYS = {"qwen": "qk", "gemini": "gk"}
+KP_STATS = {1: {"total": 2, "correct": 1, "name": "KP", "chapter": "Ch", "weight": "核心"}}
+REPORT = {"score": 40, "ai_report": {"evaluation": {"level": "良好"}}}
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    calls = []
+    monkeypatch.setattr(settings, "LLM_ROUTING", True)
+    monkeypatch.setattr(settings, "AI_PROVIDER", "qwen")
+    monkeypatch.setattr(ai_service, "route_chat_json", lambda prompt, keys: calls.append(("route_chat_json", keys)) or {"ok": True})
+    monkeypatch.setattr(ai_service, "route_stream_text", lambda prompt, keys: calls.append(("route_stream_text", keys)) or iter(["{}"]))
+    monkeypatch.setattr(ai_service, "call_qwen", lambda prompt, api_key=None: calls.append(("direct", api_key)) or {"ok": True})
+
+    async def acall_qwen(prompt, api_key=None):
+        calls.append(("direct", api_key))
+        return {"ok": True}
+    monkeypatch.setattr(ai_service, "acall_qwen", acall_qwen)
+    return calls
+
+
+def test_report_paths_route_with_two_keys(calls):
+    ai_service.generate_report(40, KP_STATS, "{kp_analysis}", api_key="qk", api_keys=KEYS)
+    asyncio.run(ai_service.agenerate_report(40, KP_STATS, "{kp_analysis}", api_key="qk", api_keys=KEYS))
+    list(ai_service.stream_report(40, KP_STATS, "{kp_analysis}", api_key="qk", api_keys=KEYS))
+    assert calls == [("route_chat_json", KEYS), ("route_chat_json", KEYS), ("route_stream_text", KEYS)]
+
+
+def test_share_paths_route_with_two_keys(calls):
+    ai_service.generate_share_content(REPORT, "{score}", api_key="qk", api_keys=KEYS)
+    asyncio.run(ai_service.agenerate_share_content(REPORT, "{score}", api_key="qk", api_keys=KEYS))
+    assert calls == [("route_chat_json", KEYS), ("route_chat_json", KEYS)]
+
+
+def test_single_key_calls_provider_directly(calls):
+    ai_service.generate_report(40, KP_STATS, "{kp_analysis}", api_key="qk", api_keys={"qwen": "qk", "gemini": ""})
+    ai_service.generate_share_content(REPORT, "{score}", api_key="qk", api_keys={"qwen": "qk"})
+    assert calls == [("direct", "qk"), ("direct", "qk")]
@@ -0,0 +1,234 @@
+"""
+Queue for error-driven AI variant generation.
+
+start_exam never calls the LLM: when a user's target knowledge points have no
+`ai_generated` questions yet, it enqueues them here and fills the paper from the
+existing bank. The worker process (`python -m backend.worker`) generates the
+variants and saves them, so later sessions find them in the bank.
+
+A KP is only queued once at a time: a per-KP pending key
+(`variant_gen_pending:{subject}:{kp}`, SET NX with its own TTL) makes
+concurrent requests for the same KP collapse into a single job.
+
+Jobs are coalesced in the worker: after taking a job it keeps collecting queued
+variant jobs for up to VARIANT_BATCH_WINDOW_SECONDS (or until
+VARIANT_BATCH_MAX_KPS distinct KPs), then sends one prompt per subject for all
+of them. Generated questions are mapped back to their KP by `based_on_id`, so
+provider calls scale with distinct weak KPs rather than with users starting
+exams. The window is cut short when a report job is waiting.
+"""
+import json
+import time
+from typing import Any, Dict, List
+
+from sqlmodel import Session, select
+
+from backend.database import redis_client
+from backend.serialization import dumps, loads
+from backend.config import settings
+from backend.models import Question, Subject
+from backend.ai_service import generate_variant_questions, get_api_key, get_api_keys
+from backend.report_queue import QUEUE_KEY as REPORT_QUEUE_KEY
+from backend.ai_telemetry import log_ai_call, track_llm_call
+from backend.question_catalog import invalidate_subject_variants, PAST_PAPER_TYPES, EXERCISE_TYPES
+
+QUEUE_KEY = "variant_gen_queue"
+PENDING_KEY_PREFIX = "variant_gen_pending"
+# Each KP stays marked as pending at most this long (its own key and TTL, not
+# refreshed by later enqueues), so a job lost with a crashed worker cannot block it forever
+PENDING_TTL = 3600
+# How often the batch window checks for more jobs (seconds)
+BATCH_POLL_SECONDS = 0.05
+
+
+def _pending_key(subject_id: int, kp_id: int) -> str:
+    return f"{PENDING_KEY_PREFIX}:{subject_id}:{kp_id}"
+
+
+def enqueue_variant_generation(subject_id: int, kp_ids: List[int]) -> List[int]:
+    """
+    Queue variant generation for KPs that are not already pending.
+    Returns the KP ids that were actually queued.
+    """
+    if not kp_ids:
+        return []
+    try:
+        pipe = redis_client.pipeline()
+        for kp_id in kp_ids:
+            pipe.set(_pending_key(subject_id, kp_id), 1, nx=True, ex=PENDING_TTL)
+        added = pipe.execute()
+        queued = [kp_id for kp_id, was_added in zip(kp_ids, added) if was_added]
+        if queued:
+            redis_client.lpush(QUEUE_KEY, dumps({"subject_id": subject_id, "kp_ids": queued, "queued_at": time.time()}))
+        return queued
+    except Exception as e:
+        print(f"Redis Variant Queue Error: {e}")
+        return []
+
+
+def _release_pending(subject_id: int, kp_ids: List[int]):
+    if not kp_ids:
+        return
+    try:
+        redis_client.delete(*[_pending_key(subject_id, kp_id) for kp_id in kp_ids])
+    except Exception as e:
+        print(f"Redis Variant Queue Error: {e}")
+
+
+def collect_seeds(db: Session, kp_ids: List[int]) -> List[Dict[str, Any]]:
+    """One past-paper/exercise seed question per KP."""
+    seeds_data = []
+    for kpid in kp_ids:
+        seeds = db.exec(select(Question).where(
+            Question.knowledge_point_id == kpid,
+            Question.source_type.in_(PAST_PAPER_TYPES + EXERCISE_TYPES)
+        ).limit(1)).all()
+
+        for q in seeds:
+            kp_name = q.knowledge_point.name if q.knowledge_point else "Unknown"
+            seeds_data.append({
+                "id": q.id,
+                "content": q.content,
+                "options": q.options,
+                "answer": q.answer,
+                "explanation": q.explanation,
+                "knowledge_point": kp_name,
+                "kp_id": kpid # Pass KP ID to map back later
+            })
+    return seeds_data
+
+
+def save_generated_variants(db: Session, generated_all: List[Dict[str, Any]], seeds_data: List[Dict[str, Any]]) -> List[Question]:
+    """Validate generated items and add them as ai_generated questions (caller commits)."""
+    new_qs = []
+
+    # Helper to find original KP ID from generated item (based_on_id)
+    seed_kp_map = {str(item["id"]): item["kp_id"] for item in seeds_data}
+
+    for item in generated_all:
+        # Basic validation
+        raw_content = item.get("content", "")
+        if not raw_content: continue
+
+        content = str(raw_content).strip()
+        if len(content) < 5 or "xxx" in content.lower(): continue
+
+        if not item.get("options") or not item.get("answer"): continue
+
+        opts = item.get("options", [])
+        # Ensure options list
+        if isinstance(opts, str):
+            try: opts = json.loads(opts)
+            except: pass
+        if not isinstance(opts, list) or len(opts) < 2: continue
+
+        # Retrieve KP ID
+        base_id = str(item.get('based_on_id', ''))
+        kp_id_gen = seed_kp_map.get(base_id)
+
+        if not kp_id_gen: continue # Should not happen if AI returns based_on_id correctly
+
+        q = Question(
+            content=item["content"],
+            options=opts,
+            answer=item["answer"],
+            explanation=item.get("explanation", "AI Generated"),
+            source_type="ai_generated",
+            knowledge_point_id=kp_id_gen,
+            source_detail=f"Error-Driven Variant of {base_id}"
+        )
+        db.add(q)
+        new_qs.append(q)
+    return new_qs
+
+
+def _generate_for_kps(db: Session, subject_id: int, kp_ids: List[int]) -> int:
+    """One LLM call for the KPs that still have no AI question. Returns the number of questions saved."""
+    # Another job may have filled these KPs since they were queued
+    existing = set(db.exec(select(Question.knowledge_point_id).where(
+        Question.knowledge_point_id.in_(kp_ids),
+        Question.source_type == "ai_generated"
+    )).all())
+    todo = [kp for kp in kp_ids if kp not in existing]
+
+    seeds_data = collect_seeds(db, todo)
+    if not seeds_data:
+        return 0
+
+    api_key = get_api_key(db)
+    api_keys = get_api_keys(db)
+
+    # Get Subject Name for Prompt
+    subject_obj = db.get(Subject, subject_id)
+    subject_name = subject_obj.name if subject_obj else "系统架构设计师"
+
+    start_ts = time.time()
+    with track_llm_call() as usage:
+        try:
+            generated_all = generate_variant_questions(seeds_data, 1, api_key=api_key, subject_name=subject_name, api_keys=api_keys)
+        except Exception as e:
+            log_ai_call("smart_paper", "failure", time.time() - start_ts, error_message=str(e), usage=usage)
+            raise
+    log_ai_call("smart_paper", "success", time.time() - start_ts, usage=usage)
+
+    new_qs = save_generated_variants(db, generated_all, seeds_data)
+    db.commit()
+    if new_qs:
+        # Adds questions only: rebuild this subject's catalogs, keep stock and payload caches
+        invalidate_subject_variants(subject_id)
+    print(f"Variant batch for subject {subject_id} KPs {todo}: saved {len(new_qs)} questions")
+    return len(new_qs)
+
+
+def _distinct_kps(jobs: List[Dict[str, Any]]) -> Dict[int, List[int]]:
+    """subject_id -> KP ids across jobs, duplicates removed, in queue order."""
+    by_subject: Dict[int, List[int]] = {}
+    for job in jobs:
+        kps = by_subject.setdefault(job["subject_id"], [])
+        for kp_id in job.get("kp_ids", []):
+            if kp_id not in kps:
+                kps.append(kp_id)
+    return by_subject
+
+
+def collect_batch(first_job: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """`first_job` plus the variant jobs queued within the batch window."""
+    jobs = [first_job]
+    deadline = time.monotonic() + settings.VARIANT_BATCH_WINDOW_SECONDS
+    try:
+        while sum(len(kps) for kps in _distinct_kps(jobs).values()) < settings.VARIANT_BATCH_MAX_KPS:
+            raw = redis_client.rpop(QUEUE_KEY)
+            if raw:
+                jobs.append(loads(raw))
+                continue
+            if time.monotonic() >= deadline or redis_client.llen(REPORT_QUEUE_KEY):
+                break
+            time.sleep(BATCH_POLL_SECONDS)
+    except Exception as e:
+        print(f"Redis Variant Queue Error: {e}")
+    return jobs
+
+
+def process_variant_job(db: Session, job: Dict[str, Any]) -> int:
+    """
+    Worker handler: coalesce `job` with other queued variant jobs and generate
+    variants for their distinct KPs, VARIANT_BATCH_MAX_KPS per LLM call.
+    Returns the number of questions saved.
+    """
+    jobs = collect_batch(job)
+    by_subject = _distinct_kps(jobs)
+    batch_size = max(1, settings.VARIANT_BATCH_MAX_KPS)
+    saved = 0
+    try:
+        for subject_id, kp_ids in by_subject.items():
+            for i in range(0, len(kp_ids), batch_size):
+                try:
+                    saved += _generate_for_kps(db, subject_id, kp_ids[i:i + batch_size])
+                except Exception as e:
+                    print(f"Variant batch for subject {subject_id} failed: {e}")
+        if len(jobs) > 1:
+            print(f"Coalesced {len(jobs)} variant jobs into {sum(-(-len(k) // batch_size) for k in by_subject.values())} LLM calls")
+        return saved
+    finally:
+        for subject_id, kp_ids in by_subject.items():
+            _release_pending(subject_id, kp_ids)
@@ -0,0 +1,75 @@
+"""
+Background worker for slow AI jobs that must stay out of the request path.
+
+Usage:
+    python -m backend.worker
+
+Consumes the report generation queue (see backend/report_queue.py) and the
+variant generation queue (see backend/variant_queue.py). Run it as a separate
+process/container next to the API (docker-compose service `worker`); scale it
+out when reports queue up.
+"""
+import signal
+import time
+
+from sqlmodel import Session
+
+from backend.background import PeriodicTask
+from backend.config import settings
+from backend.database import engine, redis_client
+from backend.ai_telemetry import flush_ai_logs
+from backend.serialization import loads
+from backend.report_queue import QUEUE_KEY as REPORT_QUEUE_KEY, process_report_job
+from backend.variant_queue import QUEUE_KEY as VARIANT_QUEUE_KEY, process_variant_job
+
+# queue key -> handler(db, job); BRPOP serves the keys in this order, so a
+# waiting user's report goes before background variant generation
+HANDLERS = {
+    REPORT_QUEUE_KEY: process_report_job,
+    VARIANT_QUEUE_KEY: process_variant_job,
+}
+
+POLL_TIMEOUT = 5
+
+# AILog entries written by the handlers are buffered and bulk-inserted (see backend/ai_telemetry.py)
+ai_log_flush_task = PeriodicTask("ai-log-flush", settings.AI_LOG_FLUSH_SECONDS, flush_ai_logs, run_on_stop=True)
+
+_running = True
+
+
+def _stop(signum, frame):
+    global _running
+    print(f"Worker received signal {signum}, finishing current job...")
+    _running = False
+
+
+def run():
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+    print(f"Worker started, queues: {', '.join(HANDLERS)}")
+    ai_log_flush_task.start()
+
+    while _running:
+        try:
+            item = redis_client.brpop(list(HANDLERS), timeout=POLL_TIMEOUT)
+        except Exception as e:
+            print(f"Worker Redis Error: {e}")
+            time.sleep(POLL_TIMEOUT)
+            continue
+        if not item:
+            continue
+
+        queue, raw = item
+        try:
+            job = loads(raw)
+            with Session(engine) as db:
+                HANDLERS[queue](db, job)
+        except Exception as e:
+            print(f"Worker job failed ({queue}): {e}")
+
+    ai_log_flush_task.stop()
+    print("Worker stopped.")
+
+
+if __name__ == "__main__":
+    run()
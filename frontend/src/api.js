@@ -73,6 +73,10 @@ export const syncAnswers = async (sessionId, answers) => {
     await api.post('/api/exam/sync', { session_id: sessionId, answers });
 }
 
+export const saveAnswer = async (sessionId, questionId, answer) => {
+    await api.post('/api/exam/answer', { session_id: sessionId, question_id: questionId, answer });
+}
+
 export const submitExam = async (sessionId) => {
   const res = await api.post('/api/exam/submit', { session_id: sessionId });
   return res.data;
@@ -83,6 +87,15 @@ export const getReport = async (sessionId) => {
   return res.data;
 };
 
+// AI report status ("pending" | "ready"); wait = seconds to long-poll
+export const getReportStatus = async (sessionId, wait = 0) => {
+  const res = await api.get(`/api/exam/report/${sessionId}/status`, { params: { wait } });
+  return res.data;
+};
+
+// Server-sent events while the AI report is generated (delta / section / done)
+export const reportStreamUrl = (sessionId) => `${getApiBaseUrl()}/api/exam/report/${sessionId}/stream`;
+
 export const getShareContent = async (sessionId) => {
   const res = await api.post('/api/exam/share', { session_id: sessionId });
   return res.data;
@@ -427,18 +427,35 @@ const Dashboard = ({ subjectId }) => {
                  <div className="bg-indigo-50 p-3 rounded-xl border border-indigo-100">
                     <p className="text-xs text-indigo-600 mb-1">平均组卷响应</p>
                     <p className="text-lg font-bold text-indigo-700">{stats?.ai_stats?.avg_latency?.assembly || 0}s</p>
+                    <p className="text-xs text-indigo-500 mt-1">P50 {stats?.ai_stats?.latency_percentiles?.assembly?.p50 || 0}s · P90 {stats?.ai_stats?.latency_percentiles?.assembly?.p90 || 0}s · P99 {stats?.ai_stats?.latency_percentiles?.assembly?.p99 || 0}s</p>
                  </div>
                  <div className="bg-blue-50 p-3 rounded-xl border border-blue-100">
                     <p className="text-xs text-blue-600 mb-1">平均报告生成</p>
                     <p className="text-lg font-bold text-blue-700">{stats?.ai_stats?.avg_latency?.report || 0}s</p>
+                    <p className="text-xs text-blue-500 mt-1">P50 {stats?.ai_stats?.latency_percentiles?.report?.p50 || 0}s · P90 {stats?.ai_stats?.latency_percentiles?.report?.p90 || 0}s · P99 {stats?.ai_stats?.latency_percentiles?.report?.p99 || 0}s</p>
                  </div>
                  <div className="bg-purple-50 p-3 rounded-xl border border-purple-100">
                     <p className="text-xs text-purple-600 mb-1">平均社交分享</p>
                     <p className="text-lg font-bold text-purple-700">{stats?.ai_stats?.avg_latency?.social || 0}s</p>
+                    <p className="text-xs text-purple-500 mt-1">P50 {stats?.ai_stats?.latency_percentiles?.social?.p50 || 0}s · P90 {stats?.ai_stats?.latency_percentiles?.social?.p90 || 0}s · P99 {stats?.ai_stats?.latency_percentiles?.social?.p99 || 0}s</p>
+                 </div>
+              </div>
+              <div className="grid grid-cols-3 gap-4">
+                 <div className="bg-teal-50 p-3 rounded-xl border border-teal-100">
+                    <p className="text-xs text-teal-600 mb-1">报告缓存命中率</p>
+                    <p className="text-lg font-bold text-teal-700">{((stats?.ai_stats?.report_cache?.hit_ratio || 0) * 100).toFixed(1)}%</p>
+                 </div>
+                 <div className="bg-teal-50 p-3 rounded-xl border border-teal-100">
+                    <p className="text-xs text-teal-600 mb-1">缓存命中 / 未命中</p>
+                    <p className="text-lg font-bold text-teal-700">{stats?.ai_stats?.report_cache?.hits || 0} / {stats?.ai_stats?.report_cache?.misses || 0}</p>
+                 </div>
+                 <div className="bg-teal-50 p-3 rounded-xl border border-teal-100">
+                    <p className="text-xs text-teal-600 mb-1">节省 LLM 耗时</p>
+                    <p className="text-lg font-bold text-teal-700">{Math.round((stats?.ai_stats?.report_cache?.saved_seconds || 0) / 60)} 分钟</p>
                  </div>
               </div>
               <div className="bg-white p-4 rounded-xl border border-gray-100 shadow-sm">
-                 <h3 className="text-sm font-semibold text-gray-500 mb-4">平均响应时长趋势 (秒)</h3>
+                 <h3 className="text-sm font-semibold text-gray-500 mb-4">响应时长趋势 (秒，平均 / P90)</h3>
                  <div className="h-64">
                     <ResponsiveContainer width="100%" height="100%">
                       <LineChart data={stats?.ai_trends}>
@@ -450,6 +467,9 @@ const Dashboard = ({ subjectId }) => {
                         <Line type="monotone" dataKey="latency.assembly" name="智能组卷" stroke="#8884d8" strokeWidth={2} dot={false} />
                         <Line type="monotone" dataKey="latency.report" name="AI报告" stroke="#82ca9d" strokeWidth={2} dot={false} />
                         <Line type="monotone" dataKey="latency.social" name="社交分享" stroke="#ffc658" strokeWidth={2} dot={false} />
+                        <Line type="monotone" dataKey="latency_percentiles.assembly.p90" name="智能组卷 P90" stroke="#8884d8" strokeDasharray="4 4" dot={false} />
+                        <Line type="monotone" dataKey="latency_percentiles.report.p90" name="AI报告 P90" stroke="#82ca9d" strokeDasharray="4 4" dot={false} />
+                        <Line type="monotone" dataKey="latency_percentiles.social.p90" name="社交分享 P90" stroke="#ffc658" strokeDasharray="4 4" dot={false} />
                       </LineChart>
                     </ResponsiveContainer>
                  </div>
@@ -1,6 +1,6 @@
 import React, { useEffect, useState } from 'react';
 import { useSearchParams, useNavigate } from 'react-router-dom';
-import { getSession, syncAnswers, submitExam } from '../api';
+import { getSession, saveAnswer, submitExam } from '../api';
 import { Clock, CheckSquare, List, HelpCircle } from 'lucide-react';
 import clsx from 'clsx';
 import ReactMarkdown from 'react-markdown';
@@ -94,8 +94,8 @@ const Exam = () => {
     const newAnswers = { ...answers, [q.id]: ansKey };
     setAnswers(newAnswers);
     
-    // Optimistic update, sync in background
-    await syncAnswers(sessionId, newAnswers);
+    // Optimistic update, only the changed answer is sent
+    await saveAnswer(sessionId, q.id, ansKey);
   };
 
   const handleSubmit = () => {
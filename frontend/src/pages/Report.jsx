@@ -1,6 +1,6 @@
 import React, { useEffect, useState, useRef } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
-import { getReport, getShareContent, downloadReportPDF, downloadReportYAML } from '../api';
+import { getReport, getReportStatus, reportStreamUrl, getShareContent, downloadReportPDF, downloadReportYAML } from '../api';
 import { 
   BarChart, Bar, XAxis, YAxis, CartesianGrid, Tooltip, Legend, ResponsiveContainer 
 } from 'recharts';
@@ -47,10 +47,17 @@ const processContent = (text) => {
     return processed;
 };
 
+// Long-poll window per status request (seconds) and number of rounds before giving up
+const REPORT_POLL_WAIT = 20;
+const REPORT_POLL_ATTEMPTS = 15;
+// Tail of the streamed AI text shown while the report is being written
+const STREAM_PREVIEW_CHARS = 160;
+
 const Report = () => {
   const { sessionId } = useParams();
   const navigate = useNavigate();
   const [data, setData] = useState(null);
+  const [streamText, setStreamText] = useState('');
   const [shareModalOpen, setShareModalOpen] = useState(false);
   const [shareContent, setShareContent] = useState(null);
   const [loadingShare, setLoadingShare] = useState(false);
@@ -77,14 +84,67 @@ const Report = () => {
   };
 
   useEffect(() => {
+    let cancelled = false;
+    let source = null;
+
+    const reload = async () => {
+      const res = await getReport(sessionId);
+      if (!cancelled) setData(res);
+      return res;
+    };
+
+    // Fallback when SSE is unavailable: long-poll until the AI version is ready
+    const pollUntilReady = async () => {
+      let attempts = 0;
+      while (!cancelled && attempts < REPORT_POLL_ATTEMPTS) {
+        attempts += 1;
+        const { status } = await getReportStatus(sessionId, REPORT_POLL_WAIT);
+        if (status !== 'pending') {
+          await reload();
+          return;
+        }
+      }
+    };
+
+    // Show report sections as the model writes them, then load the saved report
+    const followStream = () => {
+      if (typeof EventSource === 'undefined') {
+        pollUntilReady();
+        return;
+      }
+      source = new EventSource(reportStreamUrl(sessionId));
+      source.addEventListener('delta', (e) => {
+        const { text } = JSON.parse(e.data);
+        setStreamText(prev => (prev + text).slice(-STREAM_PREVIEW_CHARS));
+      });
+      source.addEventListener('section', (e) => {
+        const { key, value } = JSON.parse(e.data);
+        if (key === 'score' || key === 'radar_data') return;
+        setData(prev => prev && ({ ...prev, ai_report: { ...prev.ai_report, [key]: value } }));
+      });
+      source.addEventListener('done', () => {
+        source.close();
+        reload().catch(e => console.error("Failed to load report:", e));
+      });
+      source.onerror = () => {
+        // EventSource retries by itself while CONNECTING; give up once it is closed
+        if (source.readyState === EventSource.CLOSED && !cancelled) {
+          pollUntilReady();
+        }
+      };
+    };
+
     const load = async () => {
       try {
-        const res = await getReport(sessionId);
-        if (res && res.ai_report) {
-            setData(res);
-        } else {
+        const res = await reload();
+        if (!res || !res.ai_report) {
             console.error("Invalid report data structure:", res);
             alert('Report data is invalid');
+            return;
+        }
+        // The AI analysis is generated in the background after submit
+        if (!cancelled && res.ai_report.report_status === 'pending') {
+          followStream();
         }
       } catch (e) {
         console.error("Failed to load report:", e);
@@ -92,6 +152,10 @@ const Report = () => {
       }
     };
     load();
+    return () => {
+      cancelled = true;
+      if (source) source.close();
+    };
   }, [sessionId]);
 
   const handleShareClick = async () => {
@@ -154,6 +218,7 @@ const Report = () => {
   if (!data) return <div className="p-8 text-center text-[#00838f] font-medium">生成报告中...</div>;
 
   const { ai_report: report, questions } = data;
+  const reportPending = report.report_status === 'pending';
   const isPass = report.score >= 45;
   
   const title = report.evaluation?.level || report.title || "软考考生";
@@ -205,6 +270,18 @@ const Report = () => {
           <div className={clsx("absolute -right-20 -top-20 w-80 h-80 rounded-full opacity-10 blur-3xl", isPass ? 'bg-[#00acc1]' : 'bg-[#ff7043]')}></div>
         </div>
 
+        {reportPending && (
+          <div className="glass-card p-4 rounded-2xl text-[#00838f] font-medium">
+            <div className="flex items-center">
+              <div className="animate-spin rounded-full h-5 w-5 border-b-2 border-[#00acc1] mr-3"></div>
+              AI 正在生成个性化分析，完成后将自动更新本页...
+            </div>
+            {streamText && (
+              <div className="mt-3 text-xs text-[#546e7a] font-mono break-all line-clamp-3">{streamText}</div>
+            )}
+          </div>
+        )}
+
         {/* AI Comprehensive Comment */}
         {report.evaluation?.comment && (
           <div className="glass-card p-6 rounded-2xl relative overflow-hidden group hover:scale-[1.02] transition-transform duration-300">
@@ -362,7 +439,8 @@ const Report = () => {
           </button>
           <button 
             onClick={handleShareClick}
-            className="px-8 py-4 rounded-xl bg-gradient-to-r from-[#00acc1] to-[#0097a7] text-white font-bold shadow-[0_8px_20px_rgba(0,172,193,0.3)] hover:shadow-[0_12px_25px_rgba(0,172,193,0.4)] hover:-translate-y-1 transition-all flex items-center justify-center"
+            disabled={reportPending}
+            className="px-8 py-4 rounded-xl bg-gradient-to-r from-[#00acc1] to-[#0097a7] text-white font-bold shadow-[0_8px_20px_rgba(0,172,193,0.3)] hover:shadow-[0_12px_25px_rgba(0,172,193,0.4)] hover:-translate-y-1 transition-all flex items-center justify-center disabled:opacity-50 disabled:cursor-not-allowed"
           >
             <Share2 className="w-5 h-5 mr-2" /> 分享成绩单
           </button>
@@ -53,7 +53,8 @@ echo ""
 # 3. 部署后端服务
 echo "3️⃣  部署后端服务..."
 kubectl apply -f sealos/base/backend-deployment.yaml
-echo "✅ 后端服务部署完成"
+kubectl apply -f sealos/base/worker-deployment.yaml
+echo "✅ 后端服务部署完成（含后台 worker）"
 echo ""
 
 # 4. 部署前端服务